@@ -0,0 +1,83 @@
+# visualization/dataset.py
+
+"""
+Process-wide access to the combined dataset used by the visualization views.
+
+The CSV is parsed and indexed once per worker and re-used across requests. The
+cache is keyed on the file's modification time and size, so publishing a new
+combined file is picked up on the next request without restarting the server.
+"""
+
+import os
+import sys
+import threading
+import pandas as pd
+
+from .query import QueryEngine
+
+# Define the absolute path to the base directory of the Django project (OPKCWeb)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Construct the full path to the CSV data file
+# This assumes your file is in 'visualization/data/combined_cleaned_data.csv' relative to the project root.
+# OPKC_DATA_DIR points the app at another data directory (e.g. the benchmark's scaled datasets).
+DATA_DIR = os.environ.get('OPKC_DATA_DIR', os.path.join(BASE_DIR, 'visualization', 'data'))
+DATA_FILE_PATH = os.path.join(DATA_DIR, 'combined_cleaned_data.csv')
+
+# Make the ingestion/analysis modules in code/ingest_studies importable
+INGEST_DIR = os.path.join(os.path.dirname(BASE_DIR), 'code', 'ingest_studies')
+if INGEST_DIR not in sys.path:
+    sys.path.insert(0, INGEST_DIR)
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def read_dataset(path=DATA_FILE_PATH, **kwargs):
+    """
+    Read a combined-dataset CSV with the schema's column types.
+
+    Identifier and other string columns are read as strings, so IDs such as
+    "446645" are not turned into floats.
+    """
+    from schema import STRING_COLUMNS
+
+    return pd.read_csv(path, na_values=['<NA>'], dtype={col: str for col in STRING_COLUMNS},
+                       low_memory=False, **kwargs)
+
+
+def dataset_version(path=DATA_FILE_PATH):
+    """Cheap identifier of the current dataset file; changes whenever the file is replaced."""
+    mtime_ns, size = _file_signature(path)
+    return f"{mtime_ns:x}-{size:x}"
+
+
+def loaded_rows(path=DATA_FILE_PATH):
+    """Row count of the dataset this worker has loaded from `path`, or None if it is not loaded."""
+    cached = _cache.get(path)
+    return None if cached is None else len(cached[1].df)
+
+
+def get_engine(path=DATA_FILE_PATH):
+    """
+    Return the QueryEngine for the dataset at `path`, (re)building it if the file changed.
+
+    Raises FileNotFoundError if the file does not exist.
+    """
+    signature = _file_signature(path)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        df = read_dataset(path)
+        engine = QueryEngine(df)
+        _cache[path] = (signature, engine)
+        return engine
@@ -0,0 +1,121 @@
+# visualization/downloads.py
+
+"""
+Serving of the precompressed download artifacts built at ingest time (see
+code/ingest_studies/downloads.py) and published next to the data file.
+
+Nothing is compressed per request: the view picks the best stored encoding the
+client accepts and hands the file to the server. Whole files are sent with
+FileResponse, which WSGI servers such as gunicorn turn into a zero-copy
+sendfile(); with `DOWNLOAD_SENDFILE_HEADER` set (e.g. "X-Sendfile" behind
+Apache, or "X-Accel-Redirect" plus `DOWNLOAD_SENDFILE_PREFIX` behind nginx) the
+front-end server sends the file, including Range requests, by itself.
+"""
+
+import json
+import os
+import threading
+
+from .dataset import DATA_FILE_PATH
+
+from partitions import DOWNLOAD_DIR
+from downloads import DOWNLOAD_MANIFEST, ENCODERS
+
+DOWNLOAD_ROOT = os.path.join(os.path.dirname(DATA_FILE_PATH), DOWNLOAD_DIR)
+MANIFEST_PATH = os.path.join(DOWNLOAD_ROOT, DOWNLOAD_MANIFEST)
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def load_artifacts():
+    """The published download manifest's artifacts, re-read whenever the manifest changes."""
+    stat = os.stat(MANIFEST_PATH)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get("manifest")
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _lock:
+        with open(MANIFEST_PATH) as fh:
+            artifacts = json.load(fh)["artifacts"]
+        _cache["manifest"] = (signature, artifacts)
+        return artifacts
+
+
+def accepted_encodings(header):
+    """Content-Encoding tokens from an Accept-Encoding header with q > 0."""
+    accepted = set()
+    for item in header.split(","):
+        token, _, params = item.strip().partition(";")
+        token = token.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if token and q > 0:
+            accepted.add(token)
+    return accepted
+
+
+def choose_encoding(entry, accept_encoding):
+    """
+    The stored encoding to send for an artifact: the first of ENCODERS' order
+    (brotli, zstd, gzip) that is both available and accepted, else None (identity).
+    """
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in ENCODERS:
+        if encoding in entry["encodings"] and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive byte positions for a single-range `bytes=` header.
+
+    Returns None when the header is absent, malformed (including a last byte
+    before the first, which RFC 7233 says to ignore) or asks for several ranges
+    (the whole file is sent then), and raises ValueError when unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not (first.isdigit() or first == "") or not (last.isdigit() or last == "") or first == last == "":
+        return None
+    if first == "":
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError(f"Range {header} not satisfiable for {size} bytes.")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes.")
+    return start, end
+
+
+class FileRange:
+    """Read-only view of bytes [start, end] of an open file, for 206 responses."""
+
+    def __init__(self, fh, start, end):
+        self.fh = fh
+        self.fh.seek(start)
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fh.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fh.close()
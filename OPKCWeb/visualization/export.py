@@ -0,0 +1,126 @@
+# visualization/export.py
+
+"""
+Chunked encoders for streaming filtered exports of the combined dataset.
+
+Each encoder is a generator that takes the QueryEngine's matching row positions
+and yields the encoded bytes one block of rows at a time, so the response never
+holds more than one block in memory and the first bytes go out immediately.
+
+CSV is always available; Parquet and Arrow IPC need the optional `pyarrow`
+package.
+"""
+
+import io
+import pandas as pd
+
+BLOCK_ROWS = 50_000
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+
+def _blocks(df, positions, columns, block_rows):
+    """Yield the selected rows and `columns` of `df` in blocks of at most `block_rows`."""
+    for start in range(0, len(positions), block_rows):
+        rows = positions[start:start + block_rows]
+        # Column by column, so a block copies only the exported columns
+        yield pd.DataFrame({col: df[col].take(rows) for col in columns})
+
+
+def _arrow_schema(df, columns):
+    """Fixed Arrow schema for the export, so every block encodes identically."""
+    import pyarrow as pa
+
+    fields = []
+    for col in columns:
+        dtype = df[col].dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            fields.append(pa.field(col, pa.bool_()))
+        elif pd.api.types.is_numeric_dtype(dtype):
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def _arrow_batch(block, schema):
+    import pyarrow as pa
+
+    arrays = []
+    for field in schema:
+        values = block[field.name]
+        if pa.types.is_string(field.type):
+            values = values.astype("string")
+        arrays.append(pa.array(values, type=field.type, from_pandas=True))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object whose buffered bytes are handed out after each block."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_csv(df, positions, columns, block_rows=BLOCK_ROWS):
+    yield ",".join(columns).encode() + b"\n"
+    for block in _blocks(df, positions, columns, block_rows):
+        yield block.to_csv(index=False, header=False).encode()
+
+
+def stream_arrow(df, positions, columns, block_rows=BLOCK_ROWS):
+    import pyarrow as pa
+
+    schema = _arrow_schema(df, columns)
+    sink = _DrainableSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield sink.drain()
+        for block in _blocks(df, positions, columns, block_rows):
+            writer.write_batch(_arrow_batch(block, schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_parquet(df, positions, columns, block_rows=BLOCK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(df, columns)
+    sink = _DrainableSink()
+    # One row group per block; the footer is written when the writer closes
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema) as writer:
+        for block in _blocks(df, positions, columns, block_rows):
+            writer.write_table(pa.Table.from_batches([_arrow_batch(block, schema)]))
+            yield sink.drain()
+    yield sink.drain()
+
+
+STREAMERS = {
+    "csv": stream_csv,
+    "parquet": stream_parquet,
+    "arrow": stream_arrow,
+}
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,109 @@
+# visualization/facets.py
+
+"""
+Facet counts for the web filter UI, answered from the precomputed count cube.
+
+The cube (see code/ingest_studies/facet_cube.py) has one row per distinct
+combination of facet values with its row count. For the current filters, the
+counts shown next to each facet value are the cube counts that pass every
+filter *except* the one on that facet itself, so users can see what selecting
+another value would give. All facets are answered in one pass over the cube.
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+from .dataset import DATA_FILE_PATH, dataset_version, get_engine
+
+from facet_cube import CUBE_FILE, FACET_COLUMNS, facet_cube
+
+# The published cube is expected next to the data file
+CUBE_FILE_PATH = os.path.join(os.path.dirname(DATA_FILE_PATH), CUBE_FILE)
+
+_lock = threading.Lock()
+_cache = {}
+
+
+class FacetEngine:
+    """Facet counts over a count cube with columns FACET_COLUMNS + ["count"]."""
+
+    def __init__(self, cube):
+        self.columns = [c for c in FACET_COLUMNS if c in cube.columns]
+        self.counts_ = cube["count"].to_numpy(dtype=np.int64)
+        self._codes = {}
+        self._values = {}
+        for col in self.columns:
+            codes, uniques = pd.factorize(cube[col].astype(str), sort=True)
+            self._codes[col] = codes
+            self._values[col] = list(uniques)
+
+    def counts(self, filters=None):
+        """
+        Counts for every facet value given `filters` ({facet: [values]}).
+
+        Returns:
+            dict: {"total": rows matching all filters,
+                   "facets": {facet: {value: count}}}
+        """
+        filters = {c: v for c, v in (filters or {}).items() if c in self._codes}
+        masks = {}
+        for col, wanted in filters.items():
+            wanted = set(wanted if isinstance(wanted, (list, tuple, set)) else [wanted])
+            lookup = np.array([v in wanted for v in self._values[col]], dtype=bool)
+            masks[col] = lookup[self._codes[col]] if lookup.size else np.zeros(len(self.counts_), dtype=bool)
+
+        all_pass = np.ones(len(self.counts_), dtype=bool)
+        for m in masks.values():
+            all_pass &= m
+
+        facets = {}
+        for col in self.columns:
+            others = all_pass
+            if col in masks:
+                # Every filter except this facet's own
+                others = np.ones(len(self.counts_), dtype=bool)
+                for other, m in masks.items():
+                    if other != col:
+                        others &= m
+            sums = np.bincount(self._codes[col], weights=self.counts_ * others, minlength=len(self._values[col]))
+            facets[col] = {v: int(c) for v, c in zip(self._values[col], sums) if c > 0}
+        return {"total": int(self.counts_[all_pass].sum()), "facets": facets}
+
+
+def get_facet_engine():
+    """
+    FacetEngine for the current dataset, cached per dataset version.
+
+    Uses the cube published next to the data file when it is at least as new as
+    the data; otherwise builds the cube from the loaded dataset once.
+    """
+    version = dataset_version()
+    cached = _cache.get("engine")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _lock:
+        cached = _cache.get("engine")
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if os.path.exists(CUBE_FILE_PATH) and os.path.getmtime(CUBE_FILE_PATH) >= os.path.getmtime(DATA_FILE_PATH):
+            cube = pd.read_csv(CUBE_FILE_PATH, dtype=str, keep_default_na=False)
+            cube["count"] = cube["count"].astype(np.int64)
+        else:
+            cube = facet_cube(get_engine().df)
+        engine = FacetEngine(cube)
+        _cache["engine"] = (version, engine)
+        return engine
+
+
+def facet_filters_from_params(params):
+    """Facet filters from request parameters (repeated or comma-separated values)."""
+    filters = {}
+    for col in FACET_COLUMNS:
+        values = []
+        for raw in params.getlist(col):
+            values.extend(v for v in raw.split(",") if v != "")
+        if values:
+            filters[col] = values
+    return filters
@@ -0,0 +1,57 @@
+# visualization/kinetics.py
+
+"""
+Per-infection kinetics features (peak load, time to peak, shedding duration,
+AUC, ...) for the web app, read from the table built at ingest time (see
+code/ingest_studies/kinetics.py) instead of being recomputed per request.
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+from .dataset import DATA_FILE_PATH, dataset_version, get_engine
+
+from kinetics import KINETICS_FILE, SERIES_KEYS, kinetics
+
+# The published features are expected next to the data file
+KINETICS_FILE_PATH = os.path.join(os.path.dirname(DATA_FILE_PATH), KINETICS_FILE)
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def get_kinetics():
+    """
+    The kinetics features of the current dataset, cached per dataset version.
+
+    Uses the table published next to the data file when it is at least as new as
+    the data; otherwise computes it from the loaded dataset once.
+    """
+    version = dataset_version()
+    cached = _cache.get("features")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _lock:
+        cached = _cache.get("features")
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if os.path.exists(KINETICS_FILE_PATH) and os.path.getmtime(KINETICS_FILE_PATH) >= os.path.getmtime(DATA_FILE_PATH):
+            features = pd.read_csv(KINETICS_FILE_PATH, dtype={k: str for k in SERIES_KEYS})
+        else:
+            features = kinetics(get_engine().df)
+        _cache["features"] = (version, features)
+        return features
+
+
+def select_kinetics(features, params):
+    """Rows of `features` matching the SERIES_KEYS parameters (repeated or comma-separated values)."""
+    mask = np.ones(len(features), dtype=bool)
+    for col in SERIES_KEYS:
+        values = []
+        for raw in params.getlist(col):
+            values.extend(v for v in raw.split(",") if v != "")
+        if values:
+            mask &= features[col].astype(str).isin(values).to_numpy()
+    return features[mask]
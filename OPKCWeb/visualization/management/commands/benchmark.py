@@ -0,0 +1,236 @@
+# visualization/management/commands/benchmark.py
+
+"""
+Latency/throughput benchmark of the visualization endpoints at growing dataset sizes.
+
+For every scale factor the published dataset is replicated that many times
+(each copy with its own IndivIDs) into a temporary data directory, along with
+its download artifacts, and a fresh
+worker process serves the endpoints in-process through the Django test client,
+driven by a thread pool at each requested concurrency. A fresh process per
+dataset size keeps caches and memory measurements independent.
+
+Reported per (size, endpoint, concurrency): cold (first request) latency,
+p50/p95/p99 latency, throughput, and the worker's peak RSS. Results can be
+saved as a baseline JSON and compared against on later runs.
+
+Usage:
+    $ python3 manage.py benchmark --sizes 1 4 16 --concurrency 1 8
+    $ python3 manage.py benchmark --save-baseline benchmarks/baseline.json
+    $ python3 manage.py benchmark --baseline benchmarks/baseline.json --fail-on-regression
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+COLUMNS = {'Accept': 'application/vnd.opkc.columns'}
+CHART_FILTERS = 'StudyID={study}&time_min=0&time_max=14'
+
+# name -> (url name, url args, query string, request headers); "{study}" is filled
+# with a StudyID of the dataset and "{trajectory}" with the key of one of its trajectories
+ENDPOINTS = {
+    'home': ('home', [], '', {}),
+    'chart_page': ('visualization:time_days_bar', [], '', {}),
+    'chart': ('visualization:time_days_data', [], '', {}),
+    'chart_columns': ('visualization:time_days_data', [], '', COLUMNS),
+    'chart_filtered': ('visualization:time_days_data', [], CHART_FILTERS, {}),
+    'chart_filtered_columns': ('visualization:time_days_data', [], CHART_FILTERS, COLUMNS),
+    'facets': ('visualization:facets', [], 'StudyID={study}', {}),
+    'kinetics': ('visualization:kinetics', [], 'StudyID={study}', {}),
+    'thumbnail': ('visualization:thumbnail', ['load'], 'StudyID={study}', {}),
+    'similar': ('visualization:similar', [], '{trajectory}&k=10', {}),
+    'export_csv': ('visualization:export', [], 'StudyID={study}&columns=StudyID,IndivID,TimeDays,PathogenLoad', {}),
+    # The first MiB of the gzip-encoded combined file, so the case measures serving rather than transfer
+    'download': ('visualization:download', ['combined_cleaned_data.csv'], '',
+                 {'Accept-Encoding': 'gzip', 'Range': 'bytes=0-1048575'}),
+}
+
+
+def scale_dataset(source, factor, data_dir):
+    """Write `factor` copies of the dataset at `source` (IndivIDs made distinct) into `data_dir`."""
+    from visualization.dataset import read_dataset
+    from downloads import build_downloads
+
+    df = read_dataset(source)
+    copies = [df]
+    for i in range(1, factor):
+        copy = df.copy()
+        copy['IndivID'] = copy['IndivID'].astype(object).where(copy['IndivID'].isna(), copy['IndivID'] + f'-r{i}')
+        copies.append(copy)
+    path = os.path.join(data_dir, 'combined_cleaned_data.csv')
+    pd.concat(copies, ignore_index=True).to_csv(path, index=False)
+    build_downloads({'partitions': {}}, output_dir=data_dir)
+    return len(df) * factor
+
+
+def trajectory_query(engine):
+    """Query string of the similar view for the dataset's most-measured trajectory it can identify."""
+    from visualization.views import SIMILARITY_KEYS
+
+    keys = engine.df[SIMILARITY_KEYS]
+    measured = engine.df[engine.df['IndivID'].notna() & pd.to_numeric(engine.df['PathogenLoad'], errors='coerce').notna()]
+    sizes = measured.groupby(SIMILARITY_KEYS, dropna=False).size().sort_values(ascending=False, kind='stable')
+    for key in sizes.index:
+        params = {col: str(value) for col, value in zip(SIMILARITY_KEYS, key) if not pd.isna(value)}
+        matches = keys[(keys[list(params)].astype(str) == pd.Series(params)).all(axis=1)]
+        if len(matches.drop_duplicates()) == 1:
+            return urlencode(params)
+    raise CommandError('No trajectory of the dataset can be queried by its key.')
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _get(client, url, headers):
+    """GET `url`, consuming a streamed body, and fail on an error status."""
+    response = client.get(url, headers=headers)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    if response.status_code >= 400:
+        raise CommandError(f'{url} returned {response.status_code}')
+
+
+def _drive(url, headers, requests, concurrency):
+    """Latencies (seconds) of `requests` GETs of `url` issued from `concurrency` threads, and the wall time."""
+    from django.test import Client
+
+    def worker(n):
+        client = Client()
+        latencies = []
+        for _ in range(n):
+            start = time.perf_counter()
+            _get(client, url, headers)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [t for chunk in pool.map(worker, shares) for t in chunk]
+    return np.array(latencies), time.perf_counter() - start
+
+
+def run_worker(endpoints, concurrencies, requests):
+    """Benchmark the endpoints in this process (against OPKC_DATA_DIR); returns result rows."""
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+    from visualization.dataset import get_engine
+
+    setup_test_environment()
+    rows = []
+    start = time.perf_counter()
+    engine = get_engine()
+    load_s = time.perf_counter() - start
+    study = engine.values('StudyID')[0]
+    trajectory = trajectory_query(engine) if 'similar' in endpoints else ''
+    for name in endpoints:
+        url_name, args, query, headers = ENDPOINTS[name]
+        url = reverse(url_name, args=args) + ('?' + query.format(study=study, trajectory=trajectory) if query else '')
+        start = time.perf_counter()
+        _get(Client(), url, headers)
+        cold = time.perf_counter() - start
+        for concurrency in concurrencies:
+            latencies, wall = _drive(url, headers, requests, concurrency)
+            rows.append({
+                'endpoint': name, 'concurrency': concurrency, 'requests': len(latencies),
+                'cold_ms': cold * 1000,
+                'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                'p95_ms': float(np.percentile(latencies, 95) * 1000),
+                'p99_ms': float(np.percentile(latencies, 99) * 1000),
+                'throughput_rps': len(latencies) / wall,
+                'peak_rss_mb': _peak_rss_mb(),
+            })
+    return {'rows': len(engine), 'load_s': load_s, 'results': rows}
+
+
+def _key(size, row):
+    return f"{size}x/{row['endpoint']}/c{row['concurrency']}"
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the visualization endpoints at several dataset sizes and concurrencies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 4, 16],
+                            help='Dataset scale factors (copies of the published dataset).')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+        parser.add_argument('--requests', type=int, default=100, help='Requests per endpoint and concurrency.')
+        parser.add_argument('--endpoints', nargs='+', choices=sorted(ENDPOINTS), default=list(ENDPOINTS))
+        parser.add_argument('--baseline', help='Baseline JSON to compare against.')
+        parser.add_argument('--save-baseline', help='Write the results to this baseline JSON.')
+        parser.add_argument('--tolerance', type=float, default=1.25,
+                            help='p95 ratio over the baseline reported as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--worker', action='store_true', help='Internal: benchmark in this process.')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            result = run_worker(options['endpoints'], options['concurrency'], options['requests'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        from visualization.dataset import DATA_FILE_PATH
+
+        if not os.path.exists(DATA_FILE_PATH):
+            raise CommandError(f'Data file not found at: {DATA_FILE_PATH}')
+        manage_py = os.path.abspath(sys.argv[0])
+        results = {}
+        for size in options['sizes']:
+            with tempfile.TemporaryDirectory(prefix='opkc-bench-') as data_dir:
+                rows = scale_dataset(DATA_FILE_PATH, size, data_dir)
+                self.stdout.write(f'Dataset {size}x ({rows:,} rows)...')
+                command = [sys.executable, manage_py, 'benchmark', '--worker',
+                           '--requests', str(options['requests']),
+                           '--concurrency', *map(str, options['concurrency']),
+                           '--endpoints', *options['endpoints']]
+                proc = subprocess.run(command, env=dict(os.environ, OPKC_DATA_DIR=data_dir),
+                                      capture_output=True, text=True)
+                if proc.returncode != 0:
+                    raise CommandError(f'Benchmark worker failed:\n{proc.stderr}')
+                worker = json.loads(proc.stdout.strip().splitlines()[-1])
+            self.stdout.write(f"  loaded and indexed in {worker['load_s']:.2f}s")
+            for row in worker['results']:
+                results[_key(size, row)] = dict(row, size=size, rows=worker['rows'])
+
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline']) as fh:
+                baseline = json.load(fh)['results']
+
+        regressions = []
+        header = f"{'case':<32}{'cold':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'RSS MB':>9}  vs baseline p95"
+        self.stdout.write(header)
+        for key, row in results.items():
+            line = (f"{key:<32}{row['cold_ms']:>9.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+                    f"{row['p99_ms']:>9.1f}{row['throughput_rps']:>9.1f}{row['peak_rss_mb']:>9.0f}")
+            if key in baseline:
+                ratio = row['p95_ms'] / max(baseline[key]['p95_ms'], 1e-9)
+                line += f'  {ratio:.2f}x'
+                if ratio > options['tolerance']:
+                    line += '  REGRESSION'
+                    regressions.append(key)
+            self.stdout.write(line)
+
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(os.path.abspath(options['save_baseline'])), exist_ok=True)
+            with open(options['save_baseline'], 'w') as fh:
+                json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, fh, indent=2)
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}")
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} case(s) slower than {options['tolerance']}x the baseline p95.")
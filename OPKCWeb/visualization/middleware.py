@@ -0,0 +1,70 @@
+# visualization/middleware.py
+
+"""
+On-demand profiling of the visualization views.
+
+A staff user adding `?_profile=1` to any visualization URL gets the view run
+under cProfile (see code/ingest_studies/profiling.py). The reports are saved
+under output/profiles/ (or settings.PROFILE_DIR) with the view, its
+parameters, the dataset version and row count, and the response is returned
+as usual with an `X-Profile` header naming the report.
+
+Streaming responses (exports, downloads) are consumed inside the profile so
+that the time spent producing their content is included.
+
+Without the parameter, or for anyone else, the middleware only checks the
+query string and the view runs untouched.
+"""
+
+import os
+
+from django.conf import settings
+
+from .dataset import BASE_DIR, DATA_FILE_PATH, dataset_version, loaded_rows
+
+PROFILE_PARAM = '_profile'
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(BASE_DIR), 'output', 'profiles')
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.GET.get(PROFILE_PARAM) != '1':
+            return None
+        user = getattr(request, 'user', None)
+        if not view_func.__module__.startswith('visualization.') or not (user and user.is_active and user.is_staff):
+            return None
+
+        from profiling import Profiler
+
+        # The view sees the request without the profiling switch
+        params = request.GET.copy()
+        del params[PROFILE_PARAM]
+        request.GET = params
+        try:
+            version = dataset_version()
+        except FileNotFoundError:
+            version = None
+        match = request.resolver_match
+        metadata = {
+            'view': match.view_name,
+            'method': request.method,
+            'path': request.path,
+            'parameters': {key: params.getlist(key) for key in params},
+            'view_kwargs': view_kwargs,
+            'user': user.get_username(),
+            'dataset_version': version,
+        }
+        directory = getattr(settings, 'PROFILE_DIR', DEFAULT_PROFILE_DIR)
+        with Profiler(f"view-{match.url_name}", directory, metadata) as profiler:
+            response = view_func(request, *view_args, **view_kwargs)
+            if response.streaming:
+                response.streaming_content = list(response.streaming_content)
+            profiler.metadata.update(status=response.status_code, rows=loaded_rows(DATA_FILE_PATH))
+        response['X-Profile'] = os.path.basename(profiler.report)
+        return response
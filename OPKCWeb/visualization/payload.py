@@ -0,0 +1,154 @@
+# visualization/payload.py
+
+"""
+Columnar wire format for chart and data endpoints.
+
+Chart data used to be inlined into the HTML as JSON text, which grows with the
+data and costs a float-to-text conversion per value on the server and a parse
+on the client. Data endpoints instead answer with whole column buffers that
+the browser wraps as typed arrays without parsing (see
+static/visualization/columns.js).
+
+The format is chosen by `?format=` or the Accept header:
+
+- `application/vnd.opkc.columns` (`format=columns`): the magic bytes "OPKC", a
+  uint32 (little-endian) header length, a JSON header padded to 8 bytes, then
+  one 8-byte aligned little-endian buffer per column. The header lists every
+  column's name, type (float32, float64, int32 or dictionary), byte offset
+  into the body and length; dictionary columns are int32 codes (-1 for
+  missing) with their `categories` in the header. Payload-level metadata is in
+  `meta`.
+- `application/vnd.apache.arrow.stream` (`format=arrow`): one Arrow IPC record
+  batch, with the metadata as JSON in the schema metadata (needs pyarrow).
+- `application/json` (the default): `{"meta": ..., "columns": {name: [...]}}`.
+"""
+
+import json
+import struct
+import numpy as np
+import pandas as pd
+
+from .export import pyarrow_available
+
+MAGIC = b"OPKC"
+ALIGN = 8
+_DTYPES = {"float32": "<f4", "float64": "<f8", "int32": "<i4"}
+FORMATS = {
+    "columns": "application/vnd.opkc.columns",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "json": "application/json",
+}
+
+
+def negotiate(request):
+    """The payload format for `request`: `?format=` if given, else the first acceptable one."""
+    fmt = request.GET.get("format")
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}'; expected one of: {', '.join(FORMATS)}.")
+        if fmt == "arrow" and not pyarrow_available():
+            raise ValueError("Format 'arrow' requires the pyarrow package on the server.")
+        return fmt
+    accept = request.headers.get("Accept", "")
+    for fmt in ("columns", "arrow"):
+        if FORMATS[fmt] in accept and (fmt != "arrow" or pyarrow_available()):
+            return fmt
+    return "json"
+
+
+def _column(values):
+    """(type, array, categories) of one column in its wire representation."""
+    if isinstance(values, pd.Series):
+        values = values.array if isinstance(values.dtype, pd.CategoricalDtype) else values.to_numpy()
+    if isinstance(values, pd.Categorical):
+        return "dictionary", values.codes.astype("<i4"), [str(c) for c in values.categories]
+    values = np.asarray(values)
+    if values.dtype.kind in "iub":
+        return "int32", values.astype("<i4"), None
+    if values.dtype.kind == "f":
+        return ("float64", values.astype("<f8"), None) if values.dtype.itemsize > 4 else ("float32", values.astype("<f4"), None)
+    codes, categories = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    return "dictionary", codes.astype("<i4"), [str(c) for c in categories]
+
+
+def encode_columns(columns, meta=None):
+    """Encode {name: array-like} as the `columns` binary format."""
+    specs, buffers, offset = [], [], 0
+    for name, values in columns.items():
+        kind, array, categories = _column(values)
+        data = array.tobytes()
+        spec = {"name": name, "type": kind, "offset": offset, "length": len(array)}
+        if categories is not None:
+            spec["categories"] = categories
+        specs.append(spec)
+        buffers.append(data + b"\0" * (-len(data) % ALIGN))
+        offset += len(buffers[-1])
+
+    header = json.dumps({"columns": specs, "meta": meta or {}}, separators=(",", ":")).encode()
+    # Pad so the body (and so every buffer) starts 8-byte aligned
+    header += b" " * (-(len(MAGIC) + 4 + len(header)) % ALIGN)
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header, *buffers])
+
+
+def decode_columns(body):
+    """
+    Decode a `columns` payload into (meta, {name: array}).
+
+    Numeric columns are NumPy arrays over the payload bytes; dictionary columns
+    are object arrays of strings (None for missing), like columns.js.
+    """
+    body = memoryview(body)
+    if bytes(body[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not an OPKC columns payload.")
+    (header_length,) = struct.unpack_from("<I", body, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(bytes(body[start:start + header_length]))
+    data = start + header_length
+    columns = {}
+    for spec in header["columns"]:
+        dtype = "<i4" if spec["type"] == "dictionary" else _DTYPES[spec["type"]]
+        array = np.frombuffer(body, dtype=dtype, count=spec["length"], offset=data + spec["offset"])
+        if spec["type"] == "dictionary":
+            categories = np.array(spec["categories"] + [None], dtype=object)
+            array = categories[np.where(array < 0, len(categories) - 1, array)]
+        columns[spec["name"]] = array
+    return header["meta"], columns
+
+
+def encode_arrow(columns, meta=None):
+    """Encode {name: array-like} as a single-batch Arrow IPC stream."""
+    import pyarrow as pa
+
+    arrays = {}
+    for name, values in columns.items():
+        kind, array, categories = _column(values)
+        if kind == "dictionary":
+            arrays[name] = pa.DictionaryArray.from_arrays(
+                pa.array(array, mask=array < 0), pa.array(categories, type=pa.string()))
+        else:
+            arrays[name] = pa.array(array)
+    batch = pa.RecordBatch.from_pydict(arrays)
+    schema = batch.schema.with_metadata({"meta": json.dumps(meta or {})})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+    return sink.getvalue().to_pybytes()
+
+
+def _json_values(values):
+    kind, array, categories = _column(values)
+    if kind == "dictionary":
+        return [categories[c] if c >= 0 else None for c in array.tolist()]
+    if kind == "int32":
+        return array.tolist()
+    return [None if np.isnan(v) else v for v in array.tolist()]
+
+
+def encode(fmt, columns, meta=None):
+    """(body, content type) of the payload in format `fmt`."""
+    if fmt == "columns":
+        return encode_columns(columns, meta), FORMATS[fmt]
+    if fmt == "arrow":
+        return encode_arrow(columns, meta), FORMATS[fmt]
+    body = {"meta": meta or {}, "columns": {name: _json_values(values) for name, values in columns.items()}}
+    return json.dumps(body, separators=(",", ":")).encode(), FORMATS["json"]
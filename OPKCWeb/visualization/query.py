@@ -0,0 +1,230 @@
+# visualization/query.py
+
+"""
+Indexed in-memory query engine over the combined OPKC dataset.
+
+The combined data is sorted once by (Pathogen, StudyID, IndivID, TimeDays) so
+that every individual's trajectory is a contiguous, time-ordered block of rows.
+On top of that layout we keep:
+
+- group offsets: the first/last row of every (Pathogen, StudyID, IndivID) block,
+  so key filters are answered per group instead of per row;
+- a composite (group, time) key, so time windows are binary searches;
+- inverted indexes (sorted row-id posting lists) for the categorical columns
+  in INDEXED_COLUMNS.
+
+Filters are answered by intersecting posting lists and restricting them to the
+row ranges picked out by the key and time filters — never by a boolean scan
+over all rows.
+"""
+
+import numpy as np
+import pandas as pd
+
+SORT_KEYS = ["Pathogen", "StudyID", "IndivID", "TimeDays"]
+GROUP_KEYS = ["Pathogen", "StudyID", "IndivID"]
+INDEXED_COLUMNS = ["Subtype", "SampleSource", "Units", "PlatformType"]
+
+
+def _as_list(value):
+    """Normalize a scalar or iterable filter value into a list of strings."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, np.ndarray, pd.Index)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def _union_sorted(arrays):
+    """Union of several sorted, disjoint row-id arrays (one per matched value)."""
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.sort(np.concatenate(arrays), kind="mergesort")
+
+
+def _expand_ranges(lo, hi):
+    """Materialize the row ids covered by half-open ranges [lo, hi)."""
+    lengths = hi - lo
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(total, dtype=np.int64) + np.repeat(lo - offsets, lengths)
+
+
+def _restrict_to_ranges(positions, lo, hi):
+    """Keep the sorted positions that fall inside one of the sorted ranges [lo, hi)."""
+    idx = np.searchsorted(lo, positions, side="right") - 1
+    keep = idx >= 0
+    keep[keep] = positions[keep] < hi[idx[keep]]
+    return positions[keep]
+
+
+class QueryEngine:
+    """
+    Sorted, indexed view of the combined dataset.
+
+    Parameters:
+        df (pd.DataFrame): Combined data in STANDARD_SCHEMA layout.
+        indexed_columns (list): Categorical columns to build inverted indexes on.
+
+    Example:
+        engine = QueryEngine(df)
+        rows = engine.frame(Pathogen="SARS-CoV-2", Units=["Ct", "GE/ml"],
+                            time_min=0, time_max=10)
+    """
+
+    def __init__(self, df, indexed_columns=INDEXED_COLUMNS):
+        # 1) Sort once; mergesort keeps the original order of ties stable
+        df = df.sort_values(SORT_KEYS, kind="mergesort", na_position="last")
+        self.df = df.reset_index(drop=True)
+        self.indexed_columns = [c for c in indexed_columns if c in self.df.columns]
+        n = len(self.df)
+
+        # 2) Group offsets for (Pathogen, StudyID, IndivID) blocks
+        change = np.zeros(n, dtype=bool)
+        if n:
+            change[0] = True
+        self._key_codes = {}
+        self._key_values = {}
+        for col in GROUP_KEYS:
+            codes, uniques = pd.factorize(self.df[col])
+            if n:
+                change[1:] |= codes[1:] != codes[:-1]
+            self._key_codes[col] = codes
+            self._key_values[col] = {str(v): i for i, v in enumerate(uniques)}
+        self.group_starts = np.flatnonzero(change)
+        self.group_ends = np.append(self.group_starts[1:], n).astype(np.int64)
+        self._group_key_codes = {col: codes[self.group_starts] for col, codes in self._key_codes.items()}
+
+        # 3) Composite (group, time) key: binary-searchable within every group
+        times = pd.to_numeric(self.df["TimeDays"], errors="coerce").to_numpy(dtype=float)
+        finite = times[~np.isnan(times)]
+        self._tmin = float(finite.min()) if finite.size else 0.0
+        self._tmax = float(finite.max()) if finite.size else 0.0
+        # Missing times sort last within a group, one unit past the largest offset
+        self._span = (self._tmax - self._tmin) + 2.0
+        group_ids = np.repeat(np.arange(len(self.group_starts)), self.group_ends - self.group_starts)
+        offsets = np.where(np.isnan(times), self._span - 1.0, times - self._tmin)
+        self._time_key = group_ids * self._span + offsets
+
+        # 4) Inverted indexes: value -> sorted row ids
+        self._postings = {}
+        for col in self.indexed_columns:
+            codes, uniques = pd.factorize(self.df[col])
+            order = np.argsort(codes, kind="stable").astype(np.int64)
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            bounds = np.concatenate([[0], np.cumsum(counts)]) + int((codes < 0).sum())
+            self._postings[col] = {
+                str(v): order[bounds[i]:bounds[i + 1]] for i, v in enumerate(uniques)
+            }
+
+    def __len__(self):
+        return len(self.df)
+
+    def values(self, col):
+        """Distinct values of an indexed or group-key column."""
+        if col in self._postings:
+            return sorted(self._postings[col])
+        return sorted(self._key_values[col])
+
+    def _group_ranges(self, keys, time_min, time_max):
+        """Row ranges [lo, hi) for the groups matching the key filters and time window."""
+        selected = np.ones(len(self.group_starts), dtype=bool)
+        for col, wanted in keys.items():
+            lookup = self._key_values[col]
+            codes = [lookup[v] for v in wanted if v in lookup]
+            selected &= np.isin(self._group_key_codes[col], codes)
+        groups = np.flatnonzero(selected)
+        lo = self.group_starts[groups].astype(np.int64)
+        hi = self.group_ends[groups]
+
+        if time_min is None and time_max is None:
+            return lo, hi
+        t0 = -np.inf if time_min is None else float(time_min)
+        t1 = np.inf if time_max is None else float(time_max)
+        if t0 > self._tmax or t1 < self._tmin or t0 > t1:
+            return lo[:0], hi[:0]
+        # Offsets are clipped so a search can never leave its own group
+        base = groups * self._span
+        off0 = min(max(t0 - self._tmin, 0.0), self._span - 2.0)
+        off1 = min(max(t1 - self._tmin, 0.0), self._span - 2.0)
+        lo = np.searchsorted(self._time_key, base + off0, side="left")
+        hi = np.searchsorted(self._time_key, base + off1, side="right")
+        keep = hi > lo
+        return lo[keep].astype(np.int64), hi[keep].astype(np.int64)
+
+    def positions(self, time_min=None, time_max=None, **filters):
+        """
+        Row positions (into self.df) matching all filters.
+
+        Keyword filters may name any GROUP_KEYS or indexed column; values can be
+        a single value or a list of accepted values. `time_min`/`time_max` bound
+        TimeDays inclusively.
+        """
+        keys, lists = {}, []
+        for col, value in filters.items():
+            wanted = _as_list(value)
+            if wanted is None:
+                continue
+            if col in self._key_values:
+                keys[col] = wanted
+            elif col in self._postings:
+                postings = self._postings[col]
+                matched = [postings[v] for v in wanted if v in postings]
+                if not matched:
+                    return np.empty(0, dtype=np.int64)
+                lists.append(_union_sorted(matched))
+            else:
+                raise KeyError(f"Column '{col}' is not indexed.")
+
+        scoped = bool(keys) or time_min is not None or time_max is not None
+        if scoped:
+            lo, hi = self._group_ranges(keys, time_min, time_max)
+        if not lists:
+            return _expand_ranges(lo, hi) if scoped else np.arange(len(self.df), dtype=np.int64)
+
+        # Intersect from the smallest posting list upwards
+        lists.sort(key=len)
+        result = lists[0]
+        for other in lists[1:]:
+            if result.size == 0:
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+        if scoped:
+            result = _restrict_to_ranges(result, lo, hi)
+        return result
+
+    def count(self, **filters):
+        """Number of rows matching the filters."""
+        return len(self.positions(**filters))
+
+    def column(self, col, **filters):
+        """Values of one column for the matching rows, as a NumPy array."""
+        return self.df[col].to_numpy()[self.positions(**filters)]
+
+    def frame(self, columns=None, **filters):
+        """Matching rows as a DataFrame (optionally restricted to `columns`)."""
+        df = self.df if columns is None else self.df[columns]
+        return df.take(self.positions(**filters))
+
+
+def filters_from_params(params):
+    """
+    Build QueryEngine keyword filters from request parameters.
+
+    Accepts a Django QueryDict (or any mapping with `getlist`) where list filters
+    can be repeated or comma-separated, e.g. `?StudyID=ke2022,kissler2023&time_max=14`.
+    """
+    filters = {}
+    for col in GROUP_KEYS + INDEXED_COLUMNS:
+        values = []
+        for raw in params.getlist(col):
+            values.extend(v for v in raw.split(",") if v != "")
+        if values:
+            filters[col] = values
+    for bound in ("time_min", "time_max"):
+        raw = params.get(bound)
+        if raw not in (None, ""):
+            filters[bound] = float(raw)
+    return filters
@@ -0,0 +1,44 @@
+// visualization/static/visualization/columns.js
+//
+// Decoder for the `application/vnd.opkc.columns` payloads of the data endpoints
+// (see visualization/payload.py). Numeric columns are returned as typed-array
+// views over the response buffer, without copying or parsing; dictionary
+// columns are expanded to arrays of strings (null for missing values).
+
+const OPKC_COLUMNS_TYPE = 'application/vnd.opkc.columns';
+
+const OPKC_ARRAYS = {
+    float32: Float32Array,
+    float64: Float64Array,
+    int32: Int32Array,
+};
+
+function decodeColumns(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'OPKC') {
+        throw new Error('Not an OPKC columns payload');
+    }
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const body = 8 + headerLength;
+
+    const columns = {};
+    for (const spec of header.columns) {
+        if (spec.type === 'dictionary') {
+            const codes = new Int32Array(buffer, body + spec.offset, spec.length);
+            columns[spec.name] = Array.from(codes, code => (code < 0 ? null : spec.categories[code]));
+        } else {
+            columns[spec.name] = new OPKC_ARRAYS[spec.type](buffer, body + spec.offset, spec.length);
+        }
+    }
+    return {meta: header.meta, columns: columns};
+}
+
+async function fetchColumns(url) {
+    const response = await fetch(url, {headers: {Accept: OPKC_COLUMNS_TYPE}});
+    if (!response.ok) {
+        throw new Error(`${response.status} ${await response.text()}`);
+    }
+    return decodeColumns(await response.arrayBuffer());
+}
@@ -1,3 +1,330 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, override_settings
+
+from . import dataset  # noqa: F401 (puts code/ingest_studies on sys.path)
+from . import thumbnails
+from .downloads import parse_range
+from .payload import decode_columns, encode, encode_columns
+from .query import QueryEngine, filters_from_params
+
+from aggregate import aggregate, value_counts
+from episodes import episode_numbers
+from kinetics import kinetics
+from partitions import assemble_combined, write_partition
+from schema import enforce_schema
+
+
+def sample_frame(seed=0, n=400):
+    """A small combined-data frame with every filterable column populated."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'StudyID': rng.choice(['ke2022', 'kissler2023', 'hakki2022'], n),
+        'IndivID': rng.integers(0, 12, n).astype(str),
+        'Pathogen': rng.choice(['SARS-CoV-2', 'Influenza'], n),
+        'TimeDays': np.where(rng.random(n) < 0.05, np.nan, rng.integers(-3, 30, n)).astype(float),
+        'Subtype': rng.choice(['A', 'B', 'Omicron'], n),
+        'SampleSource': rng.choice(['Nasal', 'Saliva'], n),
+        'Units': rng.choice(['Ct', 'GE/ml'], n),
+        'PlatformType': rng.choice(['qPCR', 'RAT'], n),
+        'PathogenLoad': rng.uniform(15, 40, n),
+    })
+    return enforce_schema(df)
+
+
+class QueryEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.df = sample_frame()
+        self.engine = QueryEngine(self.df)
+
+    def assertMatches(self, mask, **filters):
+        # PathogenLoad is unique per row, so it identifies the matched rows
+        got = self.engine.frame(**filters)['PathogenLoad'].to_numpy()
+        np.testing.assert_array_equal(np.sort(got), np.sort(self.df.loc[mask, 'PathogenLoad'].to_numpy()))
+
+    def test_no_filters_returns_every_row(self):
+        self.assertEqual(self.engine.count(), len(self.df))
+
+    def test_key_and_indexed_filters(self):
+        df = self.df
+        self.assertMatches(df['StudyID'] == 'ke2022', StudyID='ke2022')
+        self.assertMatches(df['Units'].isin(['Ct']) & df['SampleSource'].eq('Saliva'),
+                           Units=['Ct'], SampleSource='Saliva')
+        self.assertMatches(df['Pathogen'].eq('Influenza') & df['StudyID'].isin(['ke2022', 'hakki2022'])
+                           & df['Subtype'].isin(['A', 'B']),
+                           Pathogen='Influenza', StudyID=['ke2022', 'hakki2022'], Subtype=['A', 'B'])
+
+    def test_time_window_is_inclusive(self):
+        df = self.df
+        self.assertMatches(df['TimeDays'].between(0, 10), time_min=0, time_max=10)
+        self.assertMatches(df['TimeDays'].ge(5) & df['PlatformType'].eq('RAT'), time_min=5, PlatformType='RAT')
+        self.assertMatches(df['TimeDays'].le(-1) & df['IndivID'].eq('3'), time_max=-1, IndivID='3')
+
+    def test_unmatched_values(self):
+        self.assertEqual(self.engine.count(StudyID='nobody'), 0)
+        self.assertEqual(self.engine.count(Units='copies/swab'), 0)
+        self.assertEqual(self.engine.count(time_min=20, time_max=10), 0)
+
+    def test_unknown_column_raises(self):
+        with self.assertRaises(KeyError):
+            self.engine.positions(DOI='10.1000/x')
+
+    def test_filters_from_params(self):
+        from django.http import QueryDict
+        params = QueryDict('StudyID=ke2022,kissler2023&StudyID=hakki2022&time_max=14&Units=')
+        self.assertEqual(filters_from_params(params),
+                         {'StudyID': ['ke2022', 'kissler2023', 'hakki2022'], 'time_max': 14.0})
+        with self.assertRaises(ValueError):
+            filters_from_params(QueryDict('time_min=soon'))
+
+
+class PayloadTests(SimpleTestCase):
+    def test_columns_round_trip(self):
+        columns = {
+            'TimeDays': np.array([0.5, np.nan, 3.0], dtype=np.float32),
+            'Load': np.array([1e12, 2.5, np.nan]),
+            'Count': np.array([1, 0, 7]),
+            'Units': pd.Categorical(['Ct', None, 'GE/ml']),
+            'StudyID': np.array(['ke2022', None, 'ke2022'], dtype=object),
+        }
+        body = encode_columns(columns, meta={'samples': 3})
+        self.assertEqual(body[:4], b'OPKC')
+        meta, decoded = decode_columns(body)
+        self.assertEqual(meta, {'samples': 3})
+        self.assertEqual(list(decoded), list(columns))
+        self.assertEqual(decoded['TimeDays'].dtype, np.float32)
+        np.testing.assert_array_equal(decoded['TimeDays'], columns['TimeDays'])
+        np.testing.assert_array_equal(decoded['Load'], columns['Load'])
+        np.testing.assert_array_equal(decoded['Count'], [1, 0, 7])
+        self.assertEqual(decoded['Units'].tolist(), ['Ct', None, 'GE/ml'])
+        self.assertEqual(decoded['StudyID'].tolist(), ['ke2022', None, 'ke2022'])
+
+    def test_buffers_are_aligned(self):
+        body = encode_columns({'a': np.arange(3, dtype=np.int8), 'b': np.ones(2)})
+        header_length = int.from_bytes(body[4:8], 'little')
+        header = json.loads(body[8:8 + header_length])
+        for spec in header['columns']:
+            self.assertEqual((8 + header_length + spec['offset']) % 8, 0)
+
+    def test_json_matches_columns(self):
+        columns = {'x': np.array([1.0, np.nan]), 'y': pd.Categorical(['a', None])}
+        body, content_type = encode('json', columns, meta={'n': 2})
+        self.assertEqual(content_type, 'application/json')
+        self.assertEqual(json.loads(body), {'meta': {'n': 2}, 'columns': {'x': [1.0, None], 'y': ['a', None]}})
+
+    def test_rejects_other_payloads(self):
+        with self.assertRaises(ValueError):
+            decode_columns(b'{"meta": {}}')
+
+
+class EpisodeTests(SimpleTestCase):
+    def test_episode_numbers(self):
+        # Person 0: reinfection after a 10-day gap and 3 negative days; person 1: more than
+        # max_gap days between positives; person 2: never positive; person 3: one episode
+        person = np.array([0] * 6 + [1, 1] + [2, 2] + [3, 3, 3])
+        t = np.array([0, 2, 5, 8, 10, 20, 0, 40, 1, 2, 0, 3, 5], dtype=float)
+        positive = np.array([1, 1, 0, 0, 0, 1, 1, 1, 0, 0, 0, 1, 0], dtype=bool)
+        measured = np.ones(len(t), dtype=bool)
+        episodes = episode_numbers(person, t, positive, measured, max_gap=30, negatives=3, min_gap=14)
+        np.testing.assert_array_equal(episodes, [1, 1, 1, 1, 1, 2, 1, 2, 0, 0, 1, 1, 1])
+
+    def test_negative_rule_needs_min_gap(self):
+        person = np.zeros(6, dtype=int)
+        t = np.array([0, 2, 3, 4, 5, 6], dtype=float)
+        positive = np.array([1, 0, 0, 0, 0, 1], dtype=bool)
+        episodes = episode_numbers(person, t, positive, np.ones(6, dtype=bool), negatives=3, min_gap=14)
+        np.testing.assert_array_equal(episodes, np.ones(6))
+
+    def test_unsorted_rows_and_missing_times(self):
+        person = np.array([0, 0, -1, 0, 0])
+        t = np.array([50, 0, 1, np.nan, 10], dtype=float)
+        positive = np.array([1, 1, 1, 1, 0], dtype=bool)
+        episodes = episode_numbers(person, t, positive, np.ones(5, dtype=bool))
+        np.testing.assert_array_equal(episodes, [2, 1, 0, 0, 1])
+
+
+class KineticsTests(SimpleTestCase):
+    def test_peak_needs_a_positive_sample(self):
+        df = enforce_schema(pd.DataFrame({
+            'StudyID': 's', 'IndivID': ['a'] * 3 + ['b'] * 3 + ['c'] * 2,
+            'Units': ['Ct'] * 3 + ['GE/ml'] * 3 + ['Ct'] * 2,
+            'TimeDays': [0, 2, 4, 0, 2, 4, 0, 2],
+            'PathogenLoad': [40, 40, 40, 0, 0, 0, 38, 25],
+        }))
+        features = kinetics(df).set_index('IndivID')
+        self.assertEqual(features['NPositive'].tolist(), [0, 0, 2])
+        self.assertTrue(features.loc[['a', 'b'], ['PeakLoad', 'PeakTime', 'SheddingDuration']].isna().all(axis=None))
+        self.assertEqual(features.loc['c', ['PeakLoad', 'PeakTime', 'SheddingDuration']].tolist(), [25.0, 2.0, 2.0])
+
+
+class DownloadTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        with open(os.path.join(self.root, 'data.csv'), 'wb') as fh:
+            fh.write(b'0123456789')
+        artifacts = {'data.csv': {'bytes': 10, 'sha256': 'ab' * 32, 'content_type': 'text/csv', 'encodings': {}}}
+        for target, value in (('load_artifacts', mock.Mock(return_value=artifacts)), ('DOWNLOAD_ROOT', self.root)):
+            patcher = mock.patch(f'visualization.views.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=2-4', 10), (2, 4))
+        self.assertEqual(parse_range('bytes=7-', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        for ignored in (None, 'bytes=5-3', 'bytes=1-2,4-5', 'items=1-2', 'bytes=a-b'):
+            self.assertIsNone(parse_range(ignored, 10))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=10-12', 10)
+
+    def test_range_statuses(self):
+        url = '/charts/downloads/data.csv'
+        response = self.client.get(url, headers={'Range': 'bytes=2-4'})
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (206, b'234'))
+        response = self.client.get(url, headers={'Range': 'bytes=5-3'})
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (200, b'0123456789'))
+        self.assertEqual(self.client.get(url, headers={'Range': 'bytes=20-'}).status_code, 416)
+
+    def test_not_modified_varies_by_encoding(self):
+        etag = self.client.get('/charts/downloads/data.csv')['ETag']
+        response = self.client.get('/charts/downloads/data.csv', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+
+class PartitionTests(SimpleTestCase):
+    def test_assemble_combined_equals_concat(self):
+        df = sample_frame(seed=1, n=300)
+        with tempfile.TemporaryDirectory() as output_dir:
+            manifest = {'partitions': {}}
+            for study_id, part in df.groupby('StudyID', sort=False):
+                manifest = write_partition(study_id, part, output_dir, manifest)
+            path = assemble_combined(manifest, output_dir)
+            combined = pd.read_csv(path, dtype=str, keep_default_na=False)
+            parts = [pd.read_csv(os.path.join(output_dir, manifest['partitions'][s]['file']),
+                                 dtype=str, keep_default_na=False)
+                     for s in sorted(manifest['partitions'])]
+        pd.testing.assert_frame_equal(combined, pd.concat(parts, ignore_index=True))
+        self.assertEqual(len(combined), len(df))
+        self.assertEqual(manifest['partitions']['ke2022']['rows'], int((df['StudyID'] == 'ke2022').sum()))
+
+
+class AggregateTests(SimpleTestCase):
+    def test_group_split_across_chunks(self):
+        # IndivID "1" looks numeric in the first chunk and is mixed with "x" in the second
+        csv = 'StudyID,IndivID,TimeDays\na,1,1\na,1,2\na,1,3\na,x,4\n'
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, 'combined.csv')
+            with open(path, 'w') as fh:
+                fh.write(csv)
+            stats = aggregate([path], by=['StudyID', 'IndivID'], values=['TimeDays'], chunksize=2)
+            counts = value_counts([path], 'IndivID', chunksize=2)
+        self.assertEqual(list(stats.index), [('a', '1'), ('a', 'x')])
+        self.assertEqual(stats[('TimeDays', 'count')].tolist(), [3, 1])
+        self.assertEqual(stats[('TimeDays', 'max')].tolist(), [3.0, 4.0])
+        self.assertEqual(counts.to_dict(), {'1': 3, 'x': 1})
+
+
+@mock.patch('visualization.views.dataset_version', return_value='test')
+@mock.patch('visualization.views.get_engine')
+class ViewStatusTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = QueryEngine(sample_frame())
+
+    def test_chart_data(self, get_engine, _):
+        get_engine.return_value = self.engine
+        response = self.client.get('/charts/time_days/data/?StudyID=ke2022&format=columns')
+        self.assertEqual(response.status_code, 200)
+        meta, columns = decode_columns(response.content)
+        self.assertEqual(meta['samples'], int(self.engine.df.query("StudyID == 'ke2022'")['TimeDays'].notna().sum()))
+        self.assertEqual(int(columns['Count'].sum()), meta['samples'])
+
+    def test_chart_data_bad_params(self, get_engine, _):
+        get_engine.return_value = self.engine
+        for query in ('time_max=soon', 'format=xml'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/charts/time_days/data/?{query}').status_code, 400)
+
+    def test_export(self, get_engine, _):
+        get_engine.return_value = self.engine
+        response = self.client.get('/charts/export/?Units=Ct&columns=StudyID,TimeDays')
+        self.assertEqual(response.status_code, 200)
+        exported = pd.read_csv(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(list(exported.columns), ['StudyID', 'TimeDays'])
+        self.assertEqual(len(exported), self.engine.count(Units='Ct'))
+
+    def test_export_bad_params(self, get_engine, _):
+        get_engine.return_value = self.engine
+        for query in ('format=xlsx', 'columns=StudyID,Nope', 'time_min=yesterday'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/charts/export/?{query}').status_code, 400)
+
+    def test_thumbnail_bad_params(self, get_engine, _):
+        get_engine.return_value = self.engine
+        self.assertEqual(self.client.get('/charts/thumbnails/samples/?time_max=later').status_code, 400)
+        self.assertEqual(self.client.get('/charts/thumbnails/pie/').status_code, 404)
+
+    def test_kinetics_bad_format(self, get_engine, _):
+        self.assertEqual(self.client.get('/charts/kinetics/?format=xml').status_code, 400)
+
+    def test_similar_bad_body(self, get_engine, _):
+        for body in ('[1, 2]', '{"times": ', '"ke2022"'):
+            with self.subTest(body=body):
+                response = self.client.post('/charts/similar/', body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        get_engine.assert_not_called()
+
+    def test_similar_bad_params(self, get_engine, _):
+        get_engine.return_value = self.engine
+        for query in ('k=-3', 'k=0', 'k=100000', 'grid_step=0', 'grid_step=-1', 'grid_step=nan',
+                      'grid_start=10&grid_end=10', 'grid_end=inf', 'grid_step=0.01'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/charts/similar/?StudyID=ke2022&IndivID=1&{query}')
+                self.assertEqual(response.status_code, 400)
+
+    def test_profiling_needs_staff(self, get_engine, _):
+        get_engine.return_value = self.engine
+        response = self.client.get('/charts/time_days/data/?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile', response)
+
+
+class ThumbnailCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = QueryEngine(sample_frame())
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        thumbnails._cache.clear()
+        self.addCleanup(thumbnails._cache.clear)
+        for target, value in (('get_engine', self.engine), ('dataset_version', 'v1')):
+            patcher = mock.patch(f'visualization.thumbnails.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def cached_files(self):
+        return sorted(name for _, _, files in os.walk(self.cache_dir) for name in files)
+
+    def test_only_gallery_thumbnails_are_cached(self):
+        with override_settings(THUMBNAIL_CACHE_DIR=self.cache_dir):
+            self.assertIsNotNone(thumbnails.thumbnail_path('load', {'StudyID': 'ke2022'}))
+            self.assertIsNone(thumbnails.thumbnail_path('load', {'StudyID': 'ke2022', 'Units': 'Ct'}))
+        self.assertEqual(len(self.cached_files()), 1)
+
+    def test_gallery_is_built_once_per_dataset_version(self):
+        with mock.patch('visualization.thumbnails.gallery_items', wraps=thumbnails.gallery_items) as build:
+            first = thumbnails.gallery()
+            self.assertIs(thumbnails.gallery(), first)
+            self.assertEqual(build.call_count, 1)
+            with mock.patch('visualization.thumbnails.dataset_version', return_value='v2'):
+                thumbnails.gallery()
+            self.assertEqual(build.call_count, 2)
+        self.assertEqual([item['title'] for item in first][-3:], ['hakki2022', 'ke2022', 'kissler2023'])
@@ -0,0 +1,226 @@
+# visualization/thumbnails.py
+
+"""
+Small server-rendered SVG summary charts for the home page gallery.
+
+Thumbnails are drawn as plain SVG markup (no plotting library, no client-side
+JavaScript). The gallery's thumbnails are written to a disk cache keyed by the
+dataset version and the chart parameters: each is rendered once, on its first
+request after a new dataset is published, and every later request is a file
+read. The cache lives under output/thumbnails/ (or settings.THUMBNAIL_CACHE_DIR),
+outside the source tree, and directories of older dataset versions are removed
+when a new one is created. Thumbnails for other filters are rendered per
+request and never written, so clients cannot grow the cache by varying the
+query string.
+
+The gallery itself (one entry per pathogen and per study) is also computed
+once per dataset version, so neither the home page nor a thumbnail request
+walks the dataset to list it.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from html import escape
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .dataset import BASE_DIR, dataset_version, get_engine
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(BASE_DIR), 'output', 'thumbnails')
+WIDTH, HEIGHT = 240, 140
+MARGIN = {'left': 34, 'right': 8, 'top': 20, 'bottom': 18}
+COLOR = 'rgb(55, 128, 191)'
+
+
+def _samples_series(engine, filters):
+    """Sample counts per TimeDays (rounded to whole days)."""
+    times = pd.Series(engine.column('TimeDays', **filters), dtype=float).dropna()
+    counts = times.round().value_counts().sort_index()
+    return {'x': counts.index.to_numpy(), 'y': counts.to_numpy(dtype=float), 'units': 'samples'}
+
+
+def _load_series(engine, filters):
+    """Median and interquartile range of PathogenLoad per day, for the most common numeric Units."""
+    df = engine.frame(columns=['TimeDays', 'PathogenLoad', 'Units'], **filters)
+    df = df.assign(
+        TimeDays=pd.to_numeric(df['TimeDays'], errors='coerce').round(),
+        PathogenLoad=pd.to_numeric(df['PathogenLoad'], errors='coerce'),
+    ).dropna(subset=['TimeDays', 'PathogenLoad'])
+    if df.empty:
+        return {'x': np.empty(0), 'y': np.empty(0), 'units': ''}
+    units = df['Units'].value_counts().index[0]
+    stats = df[df['Units'] == units].groupby('TimeDays')['PathogenLoad'].quantile([0.25, 0.5, 0.75]).unstack()
+    return {
+        'x': stats.index.to_numpy(), 'y': stats[0.5].to_numpy(),
+        'low': stats[0.25].to_numpy(), 'high': stats[0.75].to_numpy(), 'units': str(units),
+    }
+
+
+# kind -> (title, series function, mark)
+CHARTS = {
+    'samples': ('Samples by day', _samples_series, 'bar'),
+    'load': ('Median load by day', _load_series, 'line'),
+}
+
+
+def _scale(values, lo, hi, out_lo, out_hi):
+    span = (hi - lo) or 1.0
+    return out_lo + (np.asarray(values, dtype=float) - lo) / span * (out_hi - out_lo)
+
+
+def _points(xs, ys):
+    return ' '.join(f'{x:.1f},{y:.1f}' for x, y in zip(xs, ys))
+
+
+def render_svg(title, series, mark, width=WIDTH, height=HEIGHT):
+    """SVG markup for one thumbnail: a bar chart, or a median line with an IQR band."""
+    left, right = MARGIN['left'], width - MARGIN['right']
+    top, bottom = MARGIN['top'], height - MARGIN['bottom']
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="Arial, sans-serif" font-size="9">',
+        f'<rect width="{width}" height="{height}" fill="white"/>',
+        f'<text x="{width / 2:.1f}" y="12" text-anchor="middle" font-size="10">{escape(title)}</text>',
+    ]
+    x, y = series['x'], series['y']
+    if len(x) == 0:
+        parts.append(f'<text x="{width / 2:.1f}" y="{height / 2:.1f}" text-anchor="middle" fill="#999">No data</text>')
+        parts.append('</svg>')
+        return '\n'.join(parts)
+
+    x_lo, x_hi = float(x.min()), float(x.max())
+    if x_lo == x_hi:
+        x_lo, x_hi = x_lo - 0.5, x_hi + 0.5
+    low, high = series.get('low', y), series.get('high', y)
+    y_lo = 0.0 if mark == 'bar' else float(np.nanmin(low))
+    y_hi = float(np.nanmax(high))
+    # Lower Ct means more virus, so Ct axes point down
+    y_top, y_bottom = (bottom, top) if series['units'] == 'Ct' else (top, bottom)
+    px = _scale(x, x_lo, x_hi, left, right)
+
+    if mark == 'bar':
+        bar = max((right - left) / max(x_hi - x_lo + 1, 1) - 1, 1)
+        py = _scale(y, y_lo, y_hi, bottom, top)
+        for bx, by in zip(px, py):
+            parts.append(f'<rect x="{bx - bar / 2:.1f}" y="{by:.1f}" width="{bar:.1f}" '
+                         f'height="{bottom - by:.1f}" fill="{COLOR}"/>')
+    else:
+        py = _scale(y, y_lo, y_hi, y_bottom, y_top)
+        band = np.concatenate([_scale(high, y_lo, y_hi, y_bottom, y_top), _scale(low, y_lo, y_hi, y_bottom, y_top)[::-1]])
+        parts.append(f'<polygon points="{_points(np.concatenate([px, px[::-1]]), band)}" '
+                     f'fill="{COLOR}" fill-opacity="0.25" stroke="none"/>')
+        parts.append(f'<polyline points="{_points(px, py)}" fill="none" stroke="{COLOR}" stroke-width="1.5"/>')
+
+    label_top, label_bottom = (y_lo, y_hi) if y_top == bottom else (y_hi, y_lo)
+    parts += [
+        f'<line x1="{left}" y1="{bottom}" x2="{right}" y2="{bottom}" stroke="#666"/>',
+        f'<line x1="{left}" y1="{top}" x2="{left}" y2="{bottom}" stroke="#666"/>',
+        f'<text x="{left - 3}" y="{top + 6}" text-anchor="end">{label_top:.3g}</text>',
+        f'<text x="{left - 3}" y="{bottom}" text-anchor="end">{label_bottom:.3g}</text>',
+        f'<text x="{left}" y="{height - 5}">{x_lo:g}</text>',
+        f'<text x="{right}" y="{height - 5}" text-anchor="end">{x_hi:g} days</text>',
+        f'<text x="{(left + right) / 2:.1f}" y="{height - 5}" text-anchor="middle" fill="#666">{escape(series["units"])}</text>',
+        '</svg>',
+    ]
+    return '\n'.join(parts)
+
+
+def _canonical(filters):
+    """Filters as {column: [str, ...]} (time bounds as floats), so equal filter sets compare equal."""
+    return {
+        col: float(value) if col in ('time_min', 'time_max') else [str(v) for v in (value if isinstance(value, list) else [value])]
+        for col, value in filters.items()
+    }
+
+
+def _filters_key(filters):
+    return json.dumps(_canonical(filters), sort_keys=True)
+
+
+def thumbnail_key(kind, filters):
+    """Cache key of a thumbnail: dataset version, chart kind and a hash of its parameters."""
+    params = json.dumps({'kind': kind, 'filters': _canonical(filters), 'size': [WIDTH, HEIGHT]}, sort_keys=True)
+    return f"{dataset_version()}-{kind}-{hashlib.sha1(params.encode()).hexdigest()[:20]}"
+
+
+def render_thumbnail(kind, filters):
+    """SVG markup of the `kind` thumbnail for `filters` (raises KeyError for an unknown kind)."""
+    title, series_fn, mark = CHARTS[kind]
+    return render_svg(title, series_fn(get_engine(), filters), mark)
+
+
+def thumbnail_path(kind, filters):
+    """
+    Path of the cached thumbnail for `kind` and `filters`, rendering it first if needed.
+
+    Only the gallery's filter sets are cached, so the number of files is bounded
+    by the number of gallery entries; for any other filters this returns None
+    and the caller renders the thumbnail with render_thumbnail().
+
+    Raises KeyError for an unknown kind and FileNotFoundError if there is no dataset.
+    """
+    version = dataset_version()
+    cache_dir = getattr(settings, 'THUMBNAIL_CACHE_DIR', DEFAULT_CACHE_DIR)
+    version_dir = os.path.join(cache_dir, version)
+    path = os.path.join(version_dir, f'{thumbnail_key(kind, filters)}.svg')
+    if os.path.exists(path):
+        return path
+    if _filters_key(filters) not in _gallery()[1]:
+        return None
+
+    if not os.path.isdir(version_dir):
+        os.makedirs(version_dir, exist_ok=True)
+        for stale in os.listdir(cache_dir):
+            if stale != version:
+                shutil.rmtree(os.path.join(cache_dir, stale), ignore_errors=True)
+
+    svg = render_thumbnail(kind, filters)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as fh:
+        fh.write(svg)
+    os.replace(tmp_path, path)
+    return path
+
+
+def gallery_items(engine):
+    """One gallery entry per pathogen and per study, with the filters for its thumbnails."""
+    items = []
+    for pathogen in engine.values('Pathogen'):
+        items.append({'title': pathogen, 'subtitle': 'All studies', 'filters': {'Pathogen': pathogen}})
+    # One row per (Pathogen, StudyID, IndivID) block is enough to list the studies
+    studies = engine.df.loc[engine.group_starts, ['StudyID', 'Pathogen']].drop_duplicates('StudyID')
+    for study_id, pathogen in sorted(studies.dropna(subset=['StudyID']).itertuples(index=False)):
+        items.append({
+            'title': study_id, 'subtitle': pathogen if not pd.isna(pathogen) else '',
+            'filters': {'StudyID': study_id},
+        })
+    return items
+
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _gallery():
+    """(gallery items, keys of their filter sets) of the current dataset, built once per dataset version."""
+    version = dataset_version()
+    cached = _cache.get('gallery')
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _lock:
+        cached = _cache.get('gallery')
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        items = gallery_items(get_engine())
+        gallery = (items, frozenset(_filters_key(item['filters']) for item in items))
+        _cache['gallery'] = (version, gallery)
+        return gallery
+
+
+def gallery():
+    """gallery_items() of the current dataset, memoized per dataset version (do not modify the entries)."""
+    return _gallery()[0]
@@ -9,6 +9,26 @@ app_name = 'visualization'
 urlpatterns = [
     # Path for your first chart view
     path('time_days/', views.chart_view, name='time_days_bar'),
+    path('time_days/data/', views.chart_data_view, name='time_days_data'),
+
+    # Cached SVG thumbnails for the home page gallery
+    path('thumbnails/<str:kind>/', views.thumbnail_view, name='thumbnail'),
+
+    # Streaming filtered export (CSV / Parquet / Arrow IPC)
+    path('export/', views.export_view, name='export'),
+
+    # Precompressed download artifacts (listing, then one file)
+    path('downloads/', views.downloads_view, name='downloads'),
+    path('downloads/<path:name>', views.download_view, name='download'),
+
+    # Facet counts for the filter UI
+    path('facets/', views.facets_view, name='facets'),
+
+    # Per-infection kinetics features
+    path('kinetics/', views.kinetics_view, name='kinetics'),
+
+    # Nearest-neighbour search over resampled trajectories
+    path('similar/', views.similar_view, name='similar'),
     
     # If you later add a second chart view called 'viral_load_line_chart'
     # path('viral_load/', views.viral_load_line_chart, name='viral_load_line'),
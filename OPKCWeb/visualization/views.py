@@ -1,56 +1,353 @@
 # visualization/views.py
 
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+import json
 import os
+from urllib.parse import urlencode
+import numpy as np
 import pandas as pd
-from io import StringIO # Used to read the CSV content string as a file
 
-# Define the absolute path to the base directory of the Django project (OPKCWeb)
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-# Construct the full path to the CSV data file
-# This assumes your file is in 'visualization/data/test_import.csv' relative to the project root.
-DATA_FILE_PATH = os.path.join(BASE_DIR, 'visualization', 'data', 'combined_cleaned_data.csv')
+from .dataset import DATA_FILE_PATH, dataset_version, get_engine
+from .downloads import DOWNLOAD_ROOT, FileRange, choose_encoding, load_artifacts, parse_range
+from .export import FORMATS, STREAMERS, pyarrow_available
+from .facets import facet_filters_from_params, get_facet_engine
+from .kinetics import get_kinetics, select_kinetics
+from .payload import encode, negotiate
+from .query import filters_from_params
+from .thumbnails import CHARTS, gallery, render_thumbnail, thumbnail_key, thumbnail_path
 
 # Define the view for the home page
 def home_view(request):
     """
-    Renders the simple home page template.
+    Renders the home page with a gallery of per-pathogen and per-study thumbnails.
+
+    The page only lists the gallery entries; the thumbnails themselves are
+    cached SVG files served by thumbnail_view.
     """
-    return render(request, 'visualization/home.html', {}) # Note the new template name
+    try:
+        items = [dict(item, query=urlencode(item['filters'])) for item in gallery()]
+    except FileNotFoundError:
+        items = []
+    return render(request, 'visualization/home.html', {'gallery': items, 'chart_kinds': list(CHARTS)})
 
 def chart_view(request):
     """
     Renders the bar chart for time days distribution.
+
+    Optional GET filters (e.g. `?StudyID=ke2022&Units=Ct&time_max=14`) restrict
+    the rows counted. The page itself carries no data: it fetches the counts
+    from chart_data_view as typed-array buffers.
     """
     try:
-        # 1. Read the CSV file directly from the file path
-        df = pd.read_csv(DATA_FILE_PATH, na_values=['<NA>'])
+        # Fail here, with the error page, rather than in the page's data request
+        get_engine()
+    except FileNotFoundError:
+        # Handle the case where the data file cannot be found
+        return render(request, 'visualization/error.html', {'message': f"Data file not found at: {DATA_FILE_PATH}"})
 
-        # 2. (Rest of your existing data processing logic)
-        # ... your filtering, grouping, counting, etc. goes here ...
-        
-        df_clean = df.dropna(subset=['TimeDays']).copy()
-        
-        frequency_series = df_clean['TimeDays'].value_counts().sort_index()
-        labels = frequency_series.index.tolist()
-        data = frequency_series.tolist()
-        
-        # ... (rest of the view function) ...
+    data_url = reverse('visualization:time_days_data')
+    if request.GET:
+        data_url += '?' + request.GET.urlencode()
+    context = {
+        'chart_title': 'Count of Samples by Time Day',
+        'data_url': data_url,
+    }
+    return render(request, 'visualization/data_chart.html', context)
 
-        context = {
-            'chart_title': 'Count of Samples by Time Day',
-            'chart_labels': labels,
-            'chart_data': data,
-        }
+def chart_data_view(request):
+    """
+    Returns the sample counts per time day behind chart_view, for the same filters.
 
-        return render(request, 'visualization/data_chart.html', context)
-        
+    Content-negotiated (see payload.py): typed-array column buffers for
+    `Accept: application/vnd.opkc.columns`, Arrow IPC, or JSON by default.
+    """
+    try:
+        fmt = negotiate(request)
+        engine = get_engine()
+        filters = filters_from_params(request.GET)
+        # Count samples per time day
+        frequency = pd.Series(engine.column('TimeDays', **filters), dtype=float).dropna().value_counts().sort_index()
+    except FileNotFoundError:
+        return JsonResponse({'error': f"Data file not found at: {DATA_FILE_PATH}"}, status=404)
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f"Invalid parameter: {e}")
+
+    body, content_type = encode(fmt, {
+        'TimeDays': frequency.index.to_numpy(dtype=np.float32),
+        'Count': frequency.to_numpy(dtype=np.int32),
+    }, meta={'samples': int(frequency.sum())})
+    response = HttpResponse(body, content_type=content_type)
+    response['Vary'] = 'Accept'
+    return response
+
+def thumbnail_view(request, kind):
+    """
+    Serves an SVG summary chart (`samples` or `load`) for the filters in the
+    query string, e.g. `load/?StudyID=ke2022`. Gallery thumbnails are rendered
+    on first request per dataset version, then read from the disk cache.
+    """
+    if kind not in CHARTS:
+        raise Http404(f"Unknown chart '{kind}'.")
+    try:
+        filters = filters_from_params(request.GET)
+        etag = f'"{thumbnail_key(kind, filters)}"'
+        if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponse(status=304)
+        else:
+            path = thumbnail_path(kind, filters)
+            if path is not None:
+                response = FileResponse(open(path, 'rb'), content_type='image/svg+xml')
+            else:
+                response = HttpResponse(render_thumbnail(kind, filters), content_type='image/svg+xml')
+    except FileNotFoundError:
+        raise Http404("No dataset has been published.")
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f"Invalid filter: {e}")
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+def export_view(request):
+    """
+    Streams the filtered subset of the combined dataset as CSV, Parquet or Arrow IPC.
+
+    Accepts the chart filters (Pathogen, StudyID, Subtype, ..., time_min, time_max),
+    `columns` (comma-separated, default all) and `format` (csv, parquet or arrow).
+    Rows are encoded and sent block by block, so memory use does not grow with
+    the size of the export.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest(f"Unknown format '{fmt}'; expected one of: {', '.join(FORMATS)}.")
+    if fmt != 'csv' and not pyarrow_available():
+        return HttpResponseBadRequest(f"Format '{fmt}' requires the pyarrow package on the server.")
+
+    try:
+        engine = get_engine()
     except FileNotFoundError:
-        # Handle the case where the data file cannot be found
         return render(request, 'visualization/error.html', {'message': f"Data file not found at: {DATA_FILE_PATH}"})
-        
-    except Exception as e:
-        # Handle other potential errors during processing
-        return render(request, 'visualization/error.html', {'message': f"An error occurred during data processing: {e}"})
+
+    columns = [c for c in request.GET.get('columns', '').split(',') if c] or list(engine.df.columns)
+    unknown = [c for c in columns if c not in engine.df.columns]
+    if unknown:
+        return HttpResponseBadRequest(f"Unknown columns: {', '.join(unknown)}")
+
+    try:
+        positions = engine.positions(**filters_from_params(request.GET))
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f"Invalid filter: {e}")
+
+    content_type, extension = FORMATS[fmt]
+    response = StreamingHttpResponse(
+        STREAMERS[fmt](engine.df, positions, columns), content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="opkc_export.{extension}"'
+    response['X-Row-Count'] = str(len(positions))
+    return response
+
+def downloads_view(request):
+    """
+    Lists the precompressed download artifacts with their sizes, SHA-256
+    checksums and the encodings stored for each.
+    """
+    try:
+        artifacts = load_artifacts()
+    except FileNotFoundError:
+        return JsonResponse({'error': "No download artifacts have been published."}, status=404)
+    return JsonResponse({'artifacts': artifacts})
+
+def download_view(request, name):
+    """
+    Serves one published download artifact (e.g. `combined_cleaned_data.csv`,
+    `studies/ke2022.csv`) straight from disk.
+
+    The stored brotli/zstd/gzip copy matching the client's Accept-Encoding is
+    sent as-is with Content-Encoding; single byte ranges (Range / If-Range) are
+    honoured so interrupted downloads can resume, and If-None-Match gives 304.
+    """
+    try:
+        artifacts = load_artifacts()
+    except FileNotFoundError:
+        raise Http404("No download artifacts have been published.")
+    # Only names listed in the manifest are served, so no path from the URL reaches the filesystem
+    entry = artifacts.get(name)
+    if entry is None:
+        raise Http404(f"Unknown download '{name}'.")
+
+    encoding = choose_encoding(entry, request.headers.get('Accept-Encoding', ''))
+    stored = entry['encodings'][encoding] if encoding else dict(entry, file=name)
+    path = os.path.join(DOWNLOAD_ROOT, stored['file'])
+    etag = f'"{stored["sha256"][:32]}"'
+    size = stored['bytes']
+
+    if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    sendfile_header = getattr(settings, 'DOWNLOAD_SENDFILE_HEADER', None)
+    if sendfile_header:
+        # The front-end server sends the file (and handles Range) itself
+        response = HttpResponse(content_type=entry['content_type'])
+        prefix = getattr(settings, 'DOWNLOAD_SENDFILE_PREFIX', None)
+        response[sendfile_header] = prefix.rstrip('/') + '/' + stored['file'] if prefix else os.path.abspath(path)
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=entry['content_type'])
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(open(path, 'rb'), start, end), status=206,
+                                content_type=entry['content_type'])
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(name)}"'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    response['X-Checksum-SHA256'] = entry['sha256']
+    return response
+
+def facets_view(request):
+    """
+    Returns live counts for every facet value (Pathogen, StudyID, Subtype,
+    SampleSource, Units, AgeBand) given the filters in the query string, e.g.
+    `?StudyID=ke2022,kissler2023&AgeBand=30-39`. Answered from the precomputed
+    count cube; each facet's counts ignore that facet's own filter.
+    """
+    try:
+        engine = get_facet_engine()
+    except FileNotFoundError:
+        return JsonResponse({'error': f"Data file not found at: {DATA_FILE_PATH}"}, status=404)
+    return JsonResponse(engine.counts(facet_filters_from_params(request.GET)))
+
+def kinetics_view(request):
+    """
+    Returns the per-infection kinetics features (peak load and time, first/last
+    positive, shedding duration, AUC, sample counts), optionally restricted by
+    StudyID, IndivID, InfectionID, SampleSource, Targets or Units, e.g.
+    `?StudyID=kissler2023&Units=Ct`. Served from the table built at ingest.
+
+    JSON records by default; with `Accept: application/vnd.opkc.columns` or
+    Arrow IPC (see payload.py) the features are sent as column buffers.
+    """
+    try:
+        fmt = negotiate(request)
+        features = select_kinetics(get_kinetics(), request.GET)
+    except FileNotFoundError:
+        return JsonResponse({'error': f"Data file not found at: {DATA_FILE_PATH}"}, status=404)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if fmt != 'json':
+        body, content_type = encode(fmt, {col: features[col] for col in features.columns}, meta={'count': len(features)})
+        response = HttpResponse(body, content_type=content_type)
+    else:
+        features = features.astype(object).where(features.notna(), None)
+        response = JsonResponse({'count': len(features), 'features': features.to_dict(orient='records')})
+    response['Vary'] = 'Accept'
+    return response
+
+# Trajectories are compared per infection and measurement type
+SIMILARITY_KEYS = ['StudyID', 'IndivID', 'InfectionID', 'SampleSource', 'Targets', 'Units']
+GRID_DEFAULTS = {'grid_start': -5, 'grid_end': 30, 'grid_step': 1}
+# Every grid a client asks for gets its own resampled index, so grids and answers are bounded
+MAX_GRID_POINTS = 512
+MAX_NEIGHBOURS = 100
+
+def similar_view(request):
+    """
+    Returns the infections whose resampled trajectories are closest to a query.
+
+    GET: query by an indexed trajectory, given by the SIMILARITY_KEYS parameters
+    (e.g. `?StudyID=kissler2023&IndivID=12&InfectionID=1&Units=Ct`); all key
+    parameters must identify exactly one trajectory.
+    POST: query by an uploaded trajectory, a JSON object body
+    `{"times": [...], "values": [...], "Units": "Ct"}`. Like every POST, it
+    needs Django's CSRF token, so it is meant for pages served by this site.
+
+    Optional parameters: `k` (default 10, at most MAX_NEIGHBOURS), `metric`
+    (euclidean or correlation), `grid_start`, `grid_end`, `grid_step` (default
+    -5, 30, 1 days; at most MAX_GRID_POINTS points).
+    """
+    from similarity import get_index, trajectory_on_grid
+
+    params = request.GET
+    try:
+        body = json.loads(request.body) if request.method == 'POST' else {}
+        if not isinstance(body, dict):
+            return HttpResponseBadRequest("The request body must be a JSON object.")
+        k = int(params.get('k', body.get('k', 10)))
+        metric = params.get('metric', body.get('metric', 'euclidean'))
+        start, end, step = (float(params.get(name, default)) for name, default in GRID_DEFAULTS.items())
+        if not 1 <= k <= MAX_NEIGHBOURS:
+            return HttpResponseBadRequest(f"k must be between 1 and {MAX_NEIGHBOURS}.")
+        if not (np.isfinite([start, end, step]).all() and step > 0 and end > start):
+            return HttpResponseBadRequest("The grid needs finite bounds with grid_end > grid_start and grid_step > 0.")
+        if (end - start) / step + 1 > MAX_GRID_POINTS:
+            return HttpResponseBadRequest(f"The grid may have at most {MAX_GRID_POINTS} points.")
+        grid = np.arange(start, end + 1e-9, step)
+        engine = get_engine()
+    except FileNotFoundError:
+        return JsonResponse({'error': f"Data file not found at: {DATA_FILE_PATH}"}, status=404)
+    except json.JSONDecodeError as e:
+        return HttpResponseBadRequest(f"Invalid JSON body: {e}")
+    except (TypeError, ValueError) as e:
+        return HttpResponseBadRequest(f"Invalid parameter: {e}")
+
+    df = engine.df
+    if request.method == 'POST':
+        units = body.get('Units') or params.get('Units')
+        if not units:
+            return HttpResponseBadRequest("Uploaded trajectories need their Units.")
+        index = get_index(df, grid, {'Units': units}, dataset_version(), keys=SIMILARITY_KEYS)
+        try:
+            q, qmask = trajectory_on_grid(body.get('times', []), body.get('values', []), grid)
+            neighbours = index.query(q, qmask, k=k, metric=metric)
+        except (TypeError, ValueError) as e:
+            return HttpResponseBadRequest(str(e))
+    else:
+        key = {col: params.get(col, '') for col in SIMILARITY_KEYS}
+        candidates = engine.frame(
+            columns=SIMILARITY_KEYS,
+            **{col: value for col, value in key.items() if col in ('StudyID', 'IndivID', 'Units') and value},
+        )
+        for col, value in key.items():
+            if value:
+                candidates = candidates[candidates[col].astype(str) == value]
+        candidates = candidates.drop_duplicates()
+        if len(candidates) != 1:
+            return HttpResponseBadRequest(
+                f"The query matches {len(candidates)} trajectories; add more of: {', '.join(SIMILARITY_KEYS)}."
+            )
+        target = candidates.iloc[0]
+        index = get_index(df, grid, {'Units': str(target['Units'])}, dataset_version(), keys=SIMILARITY_KEYS)
+        try:
+            neighbours = index.query_id(tuple(target), k=k, metric=metric)
+        except KeyError:
+            return HttpResponseBadRequest("The query trajectory has too few observations on this grid.")
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+    neighbours = neighbours.astype(object).where(neighbours.notna(), None)
+    return JsonResponse({
+        'metric': metric,
+        'grid': grid.tolist(),
+        'indexed': len(index),
+        'neighbours': neighbours.to_dict(orient='records'),
+    })
@@ -0,0 +1,144 @@
+"""
+Out-of-core aggregation over the combined output.
+
+The combined dataset is never loaded as a whole. Instead each source file (the
+study partitions listed in `output/manifest.json`, or any single CSV) is read in
+chunks, every chunk is reduced to a small partial result, and the partials are
+merged:
+
+- count, sum, min and max merge exactly (sum, min, max of the partials), and
+  mean is derived from the merged sum and count at the end. Counts, minima and
+  maxima are identical to an in-memory groupby; sums and means are identical up
+  to floating-point summation order.
+- quantiles are approximate, from a mergeable KLL-style sketch per group
+  (sketches.QuantileSketch).
+
+Source files are independent units of work and can be spread over a process pool.
+
+Example:
+    from aggregate import aggregate, manifest_sources
+    stats = aggregate(manifest_sources(), by=["StudyID"], values=["TimeDays"],
+                      quantiles=[0.5, 0.9])
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from partitions import OUTPUT_DIR, COMBINED_FILE, load_manifest
+from schema import STRING_COLUMNS
+from sketches import QuantileSketch
+
+CHUNK_ROWS = 500_000
+MERGEABLE_STATS = {"count": "sum", "sum": "sum", "min": "min", "max": "max"}
+
+
+def manifest_sources(output_dir=OUTPUT_DIR):
+    """Partition files of the published dataset, falling back to the combined CSV."""
+    manifest = load_manifest(output_dir)
+    if manifest["partitions"]:
+        return [os.path.join(output_dir, e["file"]) for _, e in sorted(manifest["partitions"].items())]
+    return [os.path.join(output_dir, COMBINED_FILE)]
+
+
+def iter_chunks(path, columns, chunksize=CHUNK_ROWS):
+    """
+    Read only `columns` of a CSV, `chunksize` rows at a time.
+
+    String columns are read as str so that every chunk types its keys the same
+    way (otherwise IndivID "1" could be an int in one chunk and a str in the next).
+    """
+    return pd.read_csv(path, usecols=columns, chunksize=chunksize, na_values=["<NA>"],
+                       dtype={c: str for c in STRING_COLUMNS if c in columns}, low_memory=False)
+
+
+def _partial(chunk, by, values, quantiles):
+    """Reduce one chunk to mergeable partial statistics (and sketches, if requested)."""
+    data = chunk[values].apply(pd.to_numeric, errors="coerce")
+    # Missing keys become "<NA>" so they compare equal across chunks and files
+    keys = [chunk[c].astype(object).where(chunk[c].notna(), "<NA>") for c in by]
+    grouped = data.groupby(keys, sort=False)
+    partial = grouped.agg(list(MERGEABLE_STATS))
+    sketches = {}
+    if quantiles:
+        for key, idx in grouped.indices.items():
+            for col in values:
+                sketches[(key, col)] = QuantileSketch().update(data[col].to_numpy()[idx])
+    return partial, sketches
+
+
+def _merge(partials, sketch_maps):
+    merged = pd.concat(partials).groupby(level=list(range(partials[0].index.nlevels)))
+    merged = merged.agg({col: MERGEABLE_STATS[col[1]] for col in partials[0].columns})
+    sketches = {}
+    for sketch_map in sketch_maps:
+        for key, sketch in sketch_map.items():
+            if key in sketches:
+                sketches[key].merge(sketch)
+            else:
+                sketches[key] = sketch
+    return merged, sketches
+
+
+def _aggregate_file(job):
+    path, by, values, quantiles, chunksize = job
+    partials, sketch_maps = [], []
+    for chunk in iter_chunks(path, list(dict.fromkeys(by + values)), chunksize):
+        partial, sketches = _partial(chunk, by, values, quantiles)
+        partials.append(partial)
+        sketch_maps.append(sketches)
+    if not partials:
+        return None
+    return _merge(partials, sketch_maps)
+
+
+def aggregate(sources, by, values, quantiles=None, chunksize=CHUNK_ROWS, processes=None):
+    """
+    Grouped count/sum/min/max/mean (and optional approximate quantiles) over CSV sources.
+
+    Parameters:
+        sources (list): CSV paths, e.g. manifest_sources().
+        by (list): Grouping columns.
+        values (list): Numeric columns to summarize (coerced with pd.to_numeric).
+        quantiles (list or None): Quantiles in [0, 1] to estimate per group and value.
+        chunksize (int): Rows per chunk read from each source.
+        processes (int or None): Worker processes; None or 1 aggregates in this process.
+
+    Returns:
+        pd.DataFrame: One row per group (missing keys reported as "<NA>"); columns
+        are (value, statistic) pairs, with statistics count, sum, min, max, mean
+        and q<quantile> for each quantile.
+    """
+    jobs = [(path, list(by), list(values), quantiles, chunksize) for path in sources]
+    if processes and processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_aggregate_file, jobs))
+    else:
+        results = [_aggregate_file(job) for job in jobs]
+    results = [r for r in results if r is not None]
+    if not results:
+        return pd.DataFrame()
+
+    merged, sketches = _merge([r[0] for r in results], [r[1] for r in results])
+    for col in values:
+        merged[(col, "mean")] = merged[(col, "sum")] / merged[(col, "count")].where(merged[(col, "count")] > 0)
+        for q in quantiles or []:
+            merged[(col, f"q{q:g}")] = [
+                sketches[(key, col)].quantile(q) if (key, col) in sketches else np.nan
+                for key in merged.index
+            ]
+    merged = merged[[c for col in values for c in merged.columns if c[0] == col]]
+    return merged.sort_index()
+
+
+def value_counts(sources, column, chunksize=CHUNK_ROWS):
+    """Exact value counts of one column over CSV sources, merged chunk by chunk."""
+    total = None
+    for path in sources:
+        for chunk in iter_chunks(path, [column], chunksize):
+            counts = chunk[column].value_counts()
+            total = counts if total is None else total.add(counts, fill_value=0)
+    if total is None:
+        return pd.Series(dtype="int64", name="count")
+    return total.astype("int64").sort_index()
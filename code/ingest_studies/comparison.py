@@ -0,0 +1,245 @@
+"""
+Permutation tests and bootstrap intervals for group differences in kinetics.
+
+The recurring questions are two-group comparisons of a per-infection metric
+(PeakLoad, SheddingDuration, AUC, ... from kinetics.py) between the levels of a
+grouping column: lineage (`Subtype`) in kissler2023/russell2024, treatment arm
+(`Treatment1`) in wongnak2024, and so on. For every pair of levels:
+
+- the permutation test shuffles a block of copies of the pooled values at
+  once (a (permutations x n) matrix, each row permuted independently) and
+  takes the statistic of the first n_a columns against the rest, so one block
+  is a handful of array operations;
+- the bootstrap draws (replicates x n_a) and (replicates x n_b) index matrices
+  with replacement and reports a percentile interval of the difference.
+
+Blocks are capped at BLOCK_CELLS cells (about BLOCK_BYTES of arrays) so each
+process's memory stays bounded, and can be spread over a process pool; peak
+memory grows with the number of processes. Every comparison seeds its blocks from its own
+data and parameters, so a result does not depend on the number of processes or
+on what else was compared in the same batch, and repeated queries are answered
+from an in-memory cache.
+
+Example:
+    table = with_groups(pd.read_csv("output/kinetics.csv"), df, "Subtype")
+    table = table[(table["StudyID"] == "kissler2023") & (table["Units"] == "Ct")]
+    compare(table, ["PeakLoad", "SheddingDuration"], "Subtype", permutations=10_000)
+
+Usage:
+    $ python3 code/ingest_studies/comparison.py --study kissler2023 --units Ct \\
+          --group Subtype --metric PeakLoad SheddingDuration --permutations 100000
+"""
+
+import argparse
+import hashlib
+import itertools
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from kinetics import KINETICS_FILE, SERIES_KEYS
+from partitions import OUTPUT_DIR, COMBINED_FILE
+from schema import STRING_COLUMNS
+
+STATISTICS = {
+    "mean": lambda x: x.mean(axis=-1),
+    "median": lambda x: np.median(x, axis=-1),
+}
+# Working memory per process for one block: a block holds about CELL_BYTES per
+# cell (the float64 permuted/resampled values plus int32 indices and the
+# statistic's temporaries), so BLOCK_CELLS is about 64 MB of arrays
+BLOCK_BYTES = 64 * 2**20
+CELL_BYTES = 24
+BLOCK_CELLS = BLOCK_BYTES // CELL_BYTES
+
+_CACHE = OrderedDict()
+CACHE_SIZE = 256
+
+
+def with_groups(features, df, column, keys=SERIES_KEYS):
+    """
+    Add `column` from the long data `df` to the per-series `features` table.
+
+    The label is the first non-missing value of `column` within each series.
+    """
+    labels = df.groupby(keys, dropna=False, sort=False, observed=True)[column].first().reset_index()
+    features = features.drop(columns=[column], errors="ignore")
+    return features.merge(labels.astype({k: features[k].dtype for k in keys}), on=keys, how="left")
+
+
+def _key(a, b, statistic, permutations, bootstrap, confidence, seed):
+    digest = hashlib.sha1()
+    for part in (a, b):
+        digest.update(np.ascontiguousarray(part, dtype=np.float64).tobytes())
+        digest.update(b"|")
+    digest.update(repr((len(a), statistic, permutations, bootstrap, confidence, seed)).encode())
+    return digest.hexdigest()
+
+
+def _permutation_block(a, b, statistic, n, seed):
+    """How many of `n` label permutations give a difference at least as extreme as observed."""
+    rng = np.random.default_rng(seed)
+    stat = STATISTICS[statistic]
+    pooled = np.concatenate([a, b])
+    observed = abs(stat(a) - stat(b))
+    shuffled = rng.permuted(np.broadcast_to(pooled, (n, pooled.size)), axis=1)
+    diffs = stat(shuffled[:, :a.size]) - stat(shuffled[:, a.size:])
+    # Tolerance so permutations tying the observed split count as extreme despite rounding
+    return int(np.count_nonzero(np.abs(diffs) >= observed - 1e-12 * max(abs(observed), 1.0)))
+
+
+def _bootstrap_block(a, b, statistic, n, seed):
+    """Differences of the statistic over `n` bootstrap resamples of each group."""
+    rng = np.random.default_rng(seed)
+    stat = STATISTICS[statistic]
+    return (stat(a[rng.integers(a.size, size=(n, a.size), dtype=np.int32)])
+            - stat(b[rng.integers(b.size, size=(n, b.size), dtype=np.int32)]))
+
+
+def _run_job(job):
+    i, kind, a, b, statistic, n, seed = job
+    block = _permutation_block if kind == "permutation" else _bootstrap_block
+    return i, kind, block(a, b, statistic, n, seed)
+
+
+def _jobs(i, a, b, statistic, permutations, bootstrap, key, seed):
+    """Memory-bounded blocks of one comparison, each with its own seed."""
+    sizes = []
+    for kind, total, cells in (("permutation", permutations, a.size + b.size),
+                               ("bootstrap", bootstrap, a.size + b.size)):
+        block = max(1, BLOCK_CELLS // max(cells, 1))
+        sizes.extend((kind, min(block, total - start)) for start in range(0, total, block))
+    seeds = np.random.SeedSequence([seed, int(key[:16], 16)]).spawn(len(sizes))
+    return [(i, kind, a, b, statistic, n, s) for (kind, n), s in zip(sizes, seeds)]
+
+
+def compare_many(pairs, statistic="mean", permutations=10_000, bootstrap=10_000,
+                 confidence=0.95, seed=0, processes=None):
+    """
+    Permutation p-values and bootstrap intervals for a batch of (a, b) value arrays.
+
+    Parameters:
+        pairs (list): (a, b) tuples of 1-D arrays; NaNs are dropped.
+        statistic (str): "mean" or "median"; the difference is stat(a) - stat(b).
+        permutations (int): Label permutations per comparison.
+        bootstrap (int): Bootstrap replicates per comparison (0 to skip).
+        confidence (float): Coverage of the bootstrap percentile interval.
+        seed (int): Seed for the whole run.
+        processes (int or None): Worker processes; None or 1 runs in this process.
+
+    Returns:
+        list: One dict per pair with n_a, n_b, difference, p_value, ci_low, ci_high.
+    """
+    if statistic not in STATISTICS:
+        raise ValueError(f"Unknown statistic '{statistic}'; expected one of {sorted(STATISTICS)}.")
+    results = [None] * len(pairs)
+    jobs, keys = [], {}
+    for i, (a, b) in enumerate(pairs):
+        a = np.asarray(a, dtype=np.float64)
+        b = np.asarray(b, dtype=np.float64)
+        a, b = a[~np.isnan(a)], b[~np.isnan(b)]
+        key = _key(a, b, statistic, permutations, bootstrap, confidence, seed)
+        if key in _CACHE:
+            _CACHE.move_to_end(key)
+            results[i] = dict(_CACHE[key])
+            continue
+        stat = STATISTICS[statistic]
+        results[i] = {
+            "n_a": int(a.size), "n_b": int(b.size),
+            "difference": float(stat(a) - stat(b)) if a.size and b.size else np.nan,
+            "p_value": np.nan, "ci_low": np.nan, "ci_high": np.nan,
+        }
+        keys[i] = key
+        if a.size and b.size:
+            jobs.extend(_jobs(i, a, b, statistic, permutations, bootstrap, key, seed))
+
+    if processes and processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            outputs = list(pool.map(_run_job, jobs))
+    else:
+        outputs = [_run_job(job) for job in jobs]
+
+    extreme = {}
+    replicates = {}
+    for i, kind, value in outputs:
+        if kind == "permutation":
+            extreme[i] = extreme.get(i, 0) + value
+        else:
+            replicates.setdefault(i, []).append(value)
+    alpha = (1 - confidence) / 2
+    for i, key in keys.items():
+        if i in extreme:
+            # Add-one estimate: the observed labelling is one of the permutations
+            results[i]["p_value"] = (extreme[i] + 1) / (permutations + 1)
+        if i in replicates:
+            low, high = np.quantile(np.concatenate(replicates[i]), [alpha, 1 - alpha])
+            results[i]["ci_low"], results[i]["ci_high"] = float(low), float(high)
+        _CACHE[key] = dict(results[i])
+        if len(_CACHE) > CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return results
+
+
+def compare(table, metrics, group, levels=None, **kwargs):
+    """
+    Compare `metrics` between every pair of levels of the `group` column of `table`.
+
+    `table` has one row per infection (filter a kinetics table to one Units,
+    SampleSource and Targets first). Keyword arguments go to compare_many().
+
+    Returns:
+        pd.DataFrame: One row per (metric, level pair) with the group sizes, the
+        observed difference of the statistic (a - b), the permutation p-value and
+        the bootstrap interval.
+    """
+    metrics = [metrics] if isinstance(metrics, str) else list(metrics)
+    if levels is None:
+        levels = sorted(table[group].dropna().unique())
+    pairs, rows = [], []
+    for metric in metrics:
+        values = pd.to_numeric(table[metric], errors="coerce")
+        for level_a, level_b in itertools.combinations(levels, 2):
+            pairs.append((values[table[group] == level_a].to_numpy(), values[table[group] == level_b].to_numpy()))
+            rows.append({"metric": metric, "group": group, "a": level_a, "b": level_b})
+    results = compare_many(pairs, **kwargs)
+    return pd.DataFrame([dict(row, **result) for row, result in zip(rows, results)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare kinetics features between groups.")
+    parser.add_argument("--kinetics", default=os.path.join(OUTPUT_DIR, KINETICS_FILE))
+    parser.add_argument("--input", default=os.path.join(OUTPUT_DIR, COMBINED_FILE),
+                        help="Combined data the group labels are taken from.")
+    parser.add_argument("--group", required=True, help="Grouping column, e.g. Subtype or Treatment1.")
+    parser.add_argument("--metric", nargs="+", default=["PeakLoad", "SheddingDuration"])
+    parser.add_argument("--study", action="append", dest="studies", help="Restrict to this StudyID; may be repeated.")
+    parser.add_argument("--units", help="Restrict to these Units, e.g. Ct.")
+    parser.add_argument("--source", help="Restrict to this SampleSource.")
+    parser.add_argument("--targets", help="Restrict to these Targets.")
+    parser.add_argument("--statistic", choices=sorted(STATISTICS), default="mean")
+    parser.add_argument("--permutations", type=int, default=10_000)
+    parser.add_argument("--bootstrap", type=int, default=10_000)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Worker processes (default 1); each holds one block of about 64 MB.")
+    args = parser.parse_args(argv)
+
+    features = pd.read_csv(args.kinetics, dtype={k: str for k in SERIES_KEYS})
+    df = pd.read_csv(args.input, na_values=["<NA>"], dtype={c: str for c in STRING_COLUMNS}, low_memory=False)
+    table = with_groups(features, df, args.group)
+    for col, wanted in (("StudyID", args.studies), ("Units", args.units),
+                        ("SampleSource", args.source), ("Targets", args.targets)):
+        if wanted:
+            table = table[table[col].isin(wanted if isinstance(wanted, list) else [wanted])]
+    report = compare(table, args.metric, args.group, statistic=args.statistic,
+                     permutations=args.permutations, bootstrap=args.bootstrap,
+                     confidence=args.confidence, seed=args.seed, processes=args.processes)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(report.to_string(index=False, float_format="%.4g"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,97 @@
+import argparse
 from studies import ke2022, kissler2023, russell2024, wagstaffe2024, wongnak2024
 from schema import enforce_schema, coerce_types
+from partitions import OUTPUT_DIR, load_manifest, write_partition, assemble_combined
+from snapshots import create_snapshot, latest_version
+from facet_cube import write_partition_cube, assemble_cube
+from kinetics import write_partition_kinetics, assemble_kinetics
+from sketches import write_partition_sketch, write_drift_report
+from episodes import assign_episodes, MAX_GAP_DAYS, NEGATIVE_DAYS, MIN_GAP_DAYS
+from downloads import build_downloads
+from profiling import Profiler, profile_dir
+import star_schema
 import pandas as pd
 
-def main():
-    df_ke2022 = ke2022.load_and_format()
-    df_kissler2023 = kissler2023.load_and_format()
-    df_russell2024 = russell2024.load_and_format()
-    df_wagstaffe2024 = wagstaffe2024.load_and_format()
-    df_wongnak2024 = wongnak2024.load_and_format()
+# Studies included in the combined output, keyed by StudyID
+STUDIES = {
+    "ke2022": ke2022,
+    "kissler2023": kissler2023,
+    "russell2024": russell2024,
+    "wagstaffe2024": wagstaffe2024,
+    "wongnak2024": wongnak2024,
+}
 
-    combined_df = pd.concat([df_ke2022, df_kissler2023, df_russell2024, df_wagstaffe2024, df_wongnak2024])
-    combined_df.to_csv("output/combined_cleaned_data.csv", index=False)
+def ingest(study_ids=None, output_dir=OUTPUT_DIR, snapshot=True, star=False,
+           episode_gap=MAX_GAP_DAYS, episode_negatives=NEGATIVE_DAYS, episode_min_gap=MIN_GAP_DAYS,
+           profile=False):
+    """
+    Ingest studies into their partitions and re-assemble the combined output.
+
+    With `study_ids=None` every study in STUDIES is rebuilt. Otherwise only the
+    listed studies are loaded and their partitions replaced (or appended, for a
+    new study); the other partitions and their derived artifacts are reused.
+    Individuals without an InfectionID are split into infection episodes
+    (see episodes.py) by the `episode_gap`, `episode_negatives` and `episode_min_gap` rules.
+    Precompressed download artifacts are refreshed for the changed outputs.
+    Unless `snapshot=False`, the result is recorded as a new version (see snapshots.py)
+    and output/drift.json compares the studies' sketches with the previous version.
+    With `star=True` the normalized star-schema tables are written as well.
+    With `profile=True` every study's load_and_format() is profiled and its
+    reports are saved under output/profiles/ (see profiling.py).
+    """
+    if study_ids is None:
+        study_ids = list(STUDIES)
+        manifest = {"partitions": {}}
+    else:
+        manifest = load_manifest(output_dir)
+
+    episode_rules = {"max_gap": episode_gap, "negatives": episode_negatives, "min_gap": episode_min_gap}
+    for study_id in study_ids:
+        metadata = {"study": study_id, "dataset_version": latest_version(output_dir),
+                    "parameters": {"studies": study_ids, "episodes": episode_rules}}
+        with Profiler(f"load_and_format-{study_id}", profile_dir(output_dir), metadata, enabled=profile) as profiler:
+            df = STUDIES[study_id].load_and_format()
+            profiler.metadata.update(rows=len(df), columns=df.shape[1])
+        df = assign_episodes(df, **episode_rules)
+        manifest = write_partition(study_id, df, output_dir, manifest)
+        write_partition_cube(study_id, df, output_dir)
+        write_partition_kinetics(study_id, df, output_dir)
+        write_partition_sketch(study_id, df, output_dir)
+
+    path = assemble_combined(manifest, output_dir)
+    assemble_cube(manifest, output_dir)
+    assemble_kinetics(manifest, output_dir)
+    build_downloads(manifest, output_dir)
+    if snapshot:
+        version_id = create_snapshot(manifest, output_dir)
+        write_drift_report(version_id, output_dir)
+    if star:
+        star_schema.main(["--output-dir", output_dir])
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest studies and build the combined dataset.")
+    parser.add_argument("--study", action="append", choices=sorted(STUDIES), dest="studies",
+                        help="Only (re-)ingest this study and replace its partition; may be repeated.")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--no-snapshot", action="store_true",
+                        help="Do not record this build as a snapshot version.")
+    parser.add_argument("--star", action="store_true",
+                        help="Also write the normalized star-schema tables to output/star/.")
+    parser.add_argument("--episode-gap", type=float, default=MAX_GAP_DAYS,
+                        help="Days between positive tests that start a new infection episode (default: %(default)s).")
+    parser.add_argument("--episode-negatives", type=int, default=NEGATIVE_DAYS,
+                        help="Negative test days between positive tests that start a new infection episode "
+                             "(default: %(default)s).")
+    parser.add_argument("--episode-min-gap", type=float, default=MIN_GAP_DAYS,
+                        help="Minimum days between positive tests for --episode-negatives to apply "
+                             "(default: %(default)s).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile every study's loader and save the reports under output/profiles/.")
+    args = parser.parse_args(argv)
+    ingest(args.studies, args.output_dir, snapshot=not args.no_snapshot, star=args.star,
+           episode_gap=args.episode_gap, episode_negatives=args.episode_negatives,
+           episode_min_gap=args.episode_min_gap, profile=args.profile)
 
 if __name__ == "__main__":
     main()
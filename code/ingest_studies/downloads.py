@@ -0,0 +1,190 @@
+"""
+Precompressed download artifacts of the published dataset.
+
+The web app serves downloads straight from disk, so everything is encoded once
+here rather than on every request. `build_downloads()` writes to
+`output/downloads/`:
+
+- combined_cleaned_data.csv, kinetics.csv, facets.csv
+- combined_cleaned_data.parquet (if pyarrow is installed)
+- studies/<StudyID>.csv, one per partition
+
+Each CSV is stored as-is and gzip-compressed, plus brotli- and
+zstd-compressed if the optional `brotli` / `zstandard` packages are installed.
+`downloads.json` lists every artifact with its size and SHA-256, and the size
+and SHA-256 of every encoded copy, so clients can verify what they received.
+An artifact whose source bytes did not change since the last build is not
+re-encoded.
+
+Usage:
+    $ python3 code/ingest_studies/downloads.py       # after create_schema.py
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import pandas as pd
+
+from partitions import OUTPUT_DIR, COMBINED_FILE, DOWNLOAD_DIR, file_sha256, link_or_copy, load_manifest
+from schema import STRING_COLUMNS
+
+DOWNLOAD_MANIFEST = "downloads.json"
+BLOCK_SIZE = 1 << 20
+
+CONTENT_TYPES = {
+    ".csv": "text/csv",
+    ".parquet": "application/vnd.apache.parquet",
+}
+
+
+def _gzip(src, dst):
+    # mtime=0 keeps the output byte-identical across builds of the same data
+    with gzip.GzipFile(filename="", mode="wb", fileobj=dst, compresslevel=9, mtime=0) as out:
+        shutil.copyfileobj(src, out, BLOCK_SIZE)
+
+
+def _brotli(src, dst):
+    import brotli
+
+    compressor = brotli.Compressor(quality=11)
+    for block in iter(lambda: src.read(BLOCK_SIZE), b""):
+        dst.write(compressor.process(block))
+    dst.write(compressor.finish())
+
+
+def _zstd(src, dst):
+    import zstandard
+
+    zstandard.ZstdCompressor(level=19).copy_stream(src, dst)
+
+
+# Content-Encoding token -> (file suffix, encoder, module it needs)
+ENCODERS = {
+    "br": (".br", _brotli, "brotli"),
+    "zstd": (".zst", _zstd, "zstandard"),
+    "gzip": (".gz", _gzip, None),
+}
+
+
+def available_encodings():
+    """Content-Encodings that can be produced with the installed packages."""
+    available = []
+    for encoding, (_, _, module) in ENCODERS.items():
+        if module is not None:
+            try:
+                __import__(module)
+            except ImportError:
+                continue
+        available.append(encoding)
+    return available
+
+
+def _describe(path):
+    return {"bytes": os.path.getsize(path), "sha256": file_sha256(path)}
+
+
+def _encode(path, encoding):
+    suffix, encoder, _ = ENCODERS[encoding]
+    target = path + suffix
+    with open(path, "rb") as src, open(target + ".tmp", "wb") as dst:
+        encoder(src, dst)
+    os.replace(target + ".tmp", target)
+    return target
+
+
+def _write_parquet(combined_path, target):
+    df = pd.read_csv(combined_path, na_values=["<NA>"], dtype={c: str for c in STRING_COLUMNS}, low_memory=False)
+    df.to_parquet(target + ".tmp", index=False)
+    os.replace(target + ".tmp", target)
+
+
+def load_download_manifest(output_dir=OUTPUT_DIR):
+    path = os.path.join(output_dir, DOWNLOAD_DIR, DOWNLOAD_MANIFEST)
+    if not os.path.exists(path):
+        return {"artifacts": {}}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def build_downloads(manifest=None, output_dir=OUTPUT_DIR, encodings=None):
+    """
+    (Re)build output/downloads/ from the current outputs and return its manifest.
+
+    Only artifacts whose source changed (by SHA-256) are copied and re-encoded.
+    """
+    if manifest is None:
+        manifest = load_manifest(output_dir)
+    if encodings is None:
+        encodings = available_encodings()
+    root = os.path.join(output_dir, DOWNLOAD_DIR)
+    previous = load_download_manifest(output_dir)["artifacts"]
+
+    # Download name -> source file
+    sources = {name: os.path.join(output_dir, name) for name in (COMBINED_FILE, "kinetics.csv", "facets.csv")}
+    for study_id, entry in sorted(manifest["partitions"].items()):
+        sources[f"studies/{study_id}.csv"] = os.path.join(output_dir, entry["file"])
+
+    artifacts = {}
+    for name, src in sources.items():
+        if not os.path.exists(src):
+            continue
+        target = os.path.join(root, name)
+        info = _describe(src)
+        old = previous.get(name)
+        unchanged = (
+            old is not None and old["sha256"] == info["sha256"] and os.path.exists(target)
+            and all(os.path.exists(os.path.join(root, e["file"])) for e in old["encodings"].values())
+            and set(old["encodings"]) == set(encodings)
+        )
+        if unchanged:
+            artifacts[name] = old
+            continue
+
+        link_or_copy(src, target)
+        entry = dict(info, content_type=CONTENT_TYPES[".csv"], encodings={})
+        for encoding in encodings:
+            encoded = _encode(target, encoding)
+            entry["encodings"][encoding] = dict(_describe(encoded), file=os.path.relpath(encoded, root))
+        artifacts[name] = entry
+
+    # Columnar copy of the combined file; already compressed, so no encoded variants
+    combined = artifacts.get(COMBINED_FILE)
+    parquet_name = os.path.splitext(COMBINED_FILE)[0] + ".parquet"
+    if combined is not None:
+        old = previous.get(parquet_name)
+        target = os.path.join(root, parquet_name)
+        if old is not None and old.get("source_sha256") == combined["sha256"] and os.path.exists(target):
+            artifacts[parquet_name] = old
+        else:
+            try:
+                _write_parquet(os.path.join(root, COMBINED_FILE), target)
+            except ImportError:
+                pass
+            else:
+                artifacts[parquet_name] = dict(
+                    _describe(target), content_type=CONTENT_TYPES[".parquet"],
+                    encodings={}, source_sha256=combined["sha256"],
+                )
+
+    download_manifest = {"artifacts": artifacts}
+    path = os.path.join(root, DOWNLOAD_MANIFEST)
+    with open(path + ".tmp", "w") as fh:
+        json.dump(download_manifest, fh, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    return download_manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build precompressed download artifacts under output/downloads/.")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    args = parser.parse_args(argv)
+    artifacts = build_downloads(output_dir=args.output_dir)["artifacts"]
+    for name, entry in sorted(artifacts.items()):
+        sizes = ", ".join(f"{enc} {e['bytes']:,}" for enc, e in sorted(entry["encodings"].items()))
+        print(f"{name}: {entry['bytes']:,} bytes" + (f" ({sizes})" if sizes else ""))
+
+
+if __name__ == "__main__":
+    main()
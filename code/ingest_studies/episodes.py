@@ -0,0 +1,148 @@
+"""
+Segmentation of each individual's samples into infection episodes.
+
+Most studies do not report which infection a sample belongs to, so without an
+InfectionID every repeated infection of a person is merged into one trajectory.
+`assign_episodes()` splits each individual's time series into episodes and
+fills InfectionID with the episode number ("1", "2", ...).
+
+Samples are reduced to test days (all rows of an individual at one TimeDays;
+the day is positive if any row is, negative if rows were measured and none is
+positive). A positive day starts a new episode when it is the individual's
+first positive day, or when, since the previous positive day,
+
+- more than `max_gap` days have passed, or
+- at least `negatives` negative test days were observed and at least
+  `min_gap` days have passed (so that a Ct value flickering around the limit
+  at the end of shedding does not count as a reinfection).
+
+Every day (and so every row) belongs to the latest episode started on or
+before it; days before an individual's first positive belong to episode 1.
+Individuals that never test positive keep their InfectionID, and so do
+individuals whose study already reports one (e.g. kissler2023, russell2024).
+
+Everything is computed over the whole frame at once: days are sorted by
+(individual, time) and the rules are cumulative sums and running maxima over
+the sorted arrays, with no per-individual loop.
+
+Positivity is kinetics.detection(), shared with the kinetics features: Ct
+values below `ct_limit`, and loads of other units above their detection limit
+(so zeros and non-detects, including binary 0 results, are negative).
+
+Example:
+    df = assign_episodes(df, max_gap=60, negatives=2, min_gap=21)
+"""
+
+import numpy as np
+import pandas as pd
+
+from kinetics import CT_LIMIT, detection
+
+PERSON_KEYS = ["StudyID", "IndivID"]
+MAX_GAP_DAYS = 30.0
+NEGATIVE_DAYS = 3
+MIN_GAP_DAYS = 14.0
+MISSING_IDS = ("", "nan", "NaN", "<NA>", "None")
+
+
+def episode_numbers(person, t, positive, measured, max_gap=MAX_GAP_DAYS, negatives=NEGATIVE_DAYS,
+                    min_gap=MIN_GAP_DAYS):
+    """
+    Episode number (1, 2, ...) of every row, or 0 for individuals without a positive row.
+
+    Parameters:
+        person (np.ndarray): Integer individual codes per row (negative: no individual).
+        t (np.ndarray): TimeDays per row (NaN rows get no episode).
+        positive, measured (np.ndarray): Boolean positivity and measurement per row.
+        max_gap (float): Days between positive days that start a new episode.
+        negatives (int): Negative test days between positive days that start a new episode.
+        min_gap (float): Days a positive day must be after the previous one for the
+            `negatives` rule to apply.
+    """
+    n = len(t)
+    episodes = np.zeros(n, dtype=np.int64)
+    valid = (person >= 0) & ~np.isnan(t)
+    rows = np.flatnonzero(valid)
+    if rows.size == 0:
+        return episodes
+
+    # Test days: unique (person, time) pairs in sorted order (loaders usually deliver them sorted)
+    p, tt = person[rows], t[rows]
+    step_p, step_t = np.diff(p), np.diff(tt)
+    if not ((step_p > 0) | ((step_p == 0) & (step_t >= 0))).all():
+        order = np.lexsort((tt, p))
+        rows, p, tt = rows[order], p[order], tt[order]
+    new_day = np.ones(rows.size, dtype=bool)
+    new_day[1:] = (p[1:] != p[:-1]) | (tt[1:] != tt[:-1])
+    day = np.cumsum(new_day) - 1
+    n_days = int(day[-1]) + 1
+    day_person, day_time = p[new_day], tt[new_day]
+    day_positive = np.bincount(day, weights=positive[rows], minlength=n_days) > 0
+    day_negative = ~day_positive & (np.bincount(day, weights=measured[rows], minlength=n_days) > 0)
+
+    # Index of the first day of each day's person, and of the previous positive day (-1 if none)
+    first_of_person = np.ones(n_days, dtype=bool)
+    first_of_person[1:] = day_person[1:] != day_person[:-1]
+    person_start = np.maximum.accumulate(np.where(first_of_person, np.arange(n_days), 0))
+    last_positive = np.maximum.accumulate(np.where(day_positive, np.arange(n_days), -1))
+    previous_positive = np.concatenate([[-1], last_positive[:-1]])
+    previous_positive = np.where(previous_positive >= person_start, previous_positive, -1)
+
+    # Negative days strictly between the previous positive day and this one
+    negative_count = np.cumsum(day_negative)
+    has_previous = previous_positive >= 0
+    since = np.where(has_previous, previous_positive, 0)
+    negatives_between = negative_count - day_negative - negative_count[since]
+    gap = day_time - day_time[since]
+    starts = day_positive & (~has_previous | (gap > max_gap)
+                             | ((negatives_between >= negatives) & (gap >= min_gap)))
+
+    # Episode in force on each day, counted within the person; days before the first start are episode 1
+    cumulative = np.cumsum(starts)
+    before_person = np.concatenate([[0], cumulative[:-1]])[person_start]
+    day_episode = np.maximum(cumulative - before_person, 1)
+    infected = np.bincount(day_person, weights=day_positive, minlength=int(day_person.max()) + 1) > 0
+    day_episode = np.where(infected[day_person], day_episode, 0)
+
+    episodes[rows] = day_episode[day]
+    return episodes
+
+
+def _has_id(values):
+    """Whether each InfectionID is set (coerce_types writes missing strings as "nan"/"<NA>")."""
+    text = values.astype(str).str.strip()
+    return (values.notna() & ~text.isin(MISSING_IDS)).to_numpy()
+
+
+def assign_episodes(df, max_gap=MAX_GAP_DAYS, negatives=NEGATIVE_DAYS, min_gap=MIN_GAP_DAYS,
+                    ct_limit=CT_LIMIT, detection_limits=None, keys=PERSON_KEYS, overwrite=False):
+    """
+    Fill InfectionID with inferred episode numbers.
+
+    Individuals that already have an InfectionID on any row are left alone
+    unless `overwrite=True`, and so are individuals without a positive sample.
+    Returns `df` with the updated InfectionID column.
+    """
+    if df.empty:
+        return df
+    groups = df.groupby(keys, dropna=True, sort=False, observed=True)
+    person = groups.ngroup().to_numpy()
+    if not overwrite:
+        known = person >= 0
+        labelled = np.bincount(person[known], weights=_has_id(df["InfectionID"])[known],
+                               minlength=groups.ngroups) > 0
+        person = np.where(known & ~labelled[np.maximum(person, 0)], person, -1)
+    if not (person >= 0).any():
+        return df
+
+    t = pd.to_numeric(df["TimeDays"], errors="coerce").to_numpy(dtype=float)
+    v, _, _, positive = detection(df, ct_limit, detection_limits)
+    measured = ~np.isnan(v)
+    episodes = episode_numbers(person, t, positive, measured, max_gap, negatives, min_gap)
+
+    filled = episodes > 0
+    labels = np.array([str(i) for i in range(episodes.max() + 1)], dtype=object)
+    infection = df["InfectionID"].astype(object).to_numpy(copy=True)
+    infection[filled] = labels[episodes[filled]]
+    df["InfectionID"] = infection
+    return df
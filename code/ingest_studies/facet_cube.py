@@ -0,0 +1,69 @@
+"""
+Precomputed facet count cube for filterable views of the combined dataset.
+
+The cube holds one row per distinct combination of the FACET_COLUMNS values
+with its row count. Any "counts for every facet given the current filters"
+question can then be answered from the cube alone, whose size depends on the
+number of distinct combinations rather than on the number of rows.
+
+StudyID is one of the facets, so the cube of the whole dataset is simply the
+concatenation of the per-study cubes. Each study's cube is written next to its
+partition, and only the changed study's cube is recomputed on an incremental
+ingest.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from partitions import OUTPUT_DIR, PARTITION_DIR
+
+FACET_COLUMNS = ["Pathogen", "StudyID", "Subtype", "SampleSource", "Units", "AgeBand"]
+CUBE_FILE = "facets.csv"
+MISSING = "<NA>"
+
+
+def age_band(age):
+    """Decade band ("30-39") of the lower age bound; missing ages become MISSING."""
+    lower = pd.to_numeric(age, errors="coerce")
+    decade = (np.floor(lower / 10) * 10).astype("Int64")
+    band = decade.astype(str) + "-" + (decade + 9).astype(str)
+    return band.where(decade.notna(), MISSING)
+
+
+def facet_cube(df):
+    """Row counts per distinct combination of FACET_COLUMNS values."""
+    # Missing values may arrive as NA or as the "nan"/"<NA>" strings written by coerce_types
+    facets = pd.DataFrame({
+        col: df[col].astype(object).where(df[col].notna(), MISSING).astype(str).replace("nan", MISSING)
+        for col in FACET_COLUMNS if col != "AgeBand"
+    })
+    facets["AgeBand"] = age_band(df["AgeRng1"]).to_numpy()
+    cube = facets.groupby(FACET_COLUMNS, sort=True).size().rename("count").reset_index()
+    return cube
+
+
+def partition_cube_path(study_id, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, PARTITION_DIR, f"{study_id}.facets.csv")
+
+
+def write_partition_cube(study_id, df, output_dir=OUTPUT_DIR):
+    """Write one study's facet cube next to its partition."""
+    path = partition_cube_path(study_id, output_dir)
+    facet_cube(df).to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def assemble_cube(manifest, output_dir=OUTPUT_DIR):
+    """Combine the per-study cubes into output/facets.csv."""
+    cubes = [
+        pd.read_csv(partition_cube_path(study_id, output_dir), dtype=str, keep_default_na=False)
+        for study_id in sorted(manifest["partitions"])
+        if os.path.exists(partition_cube_path(study_id, output_dir))
+    ]
+    cube = pd.concat(cubes, ignore_index=True) if cubes else pd.DataFrame(columns=FACET_COLUMNS + ["count"])
+    path = os.path.join(output_dir, CUBE_FILE)
+    cube.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return path
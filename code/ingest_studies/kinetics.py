@@ -0,0 +1,182 @@
+"""
+Per-infection kinetics features of the combined dataset.
+
+Analyses keep asking the same questions of every trajectory: how high did the
+load peak and when, when was it first and last positive, how long did shedding
+last, how large is the area under the curve. `kinetics()` answers all of them
+for every measurement series (an infection measured with one SampleSource,
+Targets and Units) in a single pass: the rows are sorted by (series, TimeDays)
+once and every feature is a segment reduction (`np.<ufunc>.reduceat`) over the
+contiguous runs of each series. There is no per-series Python callback.
+
+For Ct values a lower value means more virus, so "peak" is the lowest Ct and
+positives are the values below `ct_limit`; the area under the curve is taken
+over `ct_limit - Ct`. For the other units peak is the highest value, positives
+are the values above the unit's detection limit (by default 0, so zeros and
+non-detects are negative; binary results are 1/0) and the area is taken over
+the load above that limit. Shedding duration runs from the first to the last
+positive sample.
+
+Like the facet cube, features are written per study next to its partition and
+concatenated into output/kinetics.csv, so only a changed study is recomputed.
+
+Example:
+    features = kinetics(df)
+    features.loc[features["Units"] == "Ct", ["PeakLoad", "SheddingDuration"]].describe()
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from partitions import OUTPUT_DIR, PARTITION_DIR
+from schema import category_codes, numeric_load
+
+SERIES_KEYS = ["StudyID", "IndivID", "InfectionID", "SampleSource", "Targets", "Units"]
+FEATURE_COLUMNS = [
+    "NSamples", "NMeasured", "NPositive", "FirstTime", "LastTime", "PeakLoad", "PeakTime",
+    "FirstPositive", "LastPositive", "SheddingDuration", "AUC",
+]
+KINETICS_FILE = "kinetics.csv"
+CT_LIMIT = 40.0
+# Detection limit of each non-Ct unit: values at or below it are non-detects.
+# Units not listed use DEFAULT_DETECTION_LIMIT, so zeros never count as positive.
+DETECTION_LIMITS = {}
+DEFAULT_DETECTION_LIMIT = 0.0
+
+
+def detection(df, ct_limit=CT_LIMIT, detection_limits=None):
+    """
+    Per-row (load, is_ct, limit, positive) arrays of `df`.
+
+    Ct values are positive below `ct_limit`; values of the other units are
+    positive above their detection limit (DETECTION_LIMITS, updated with
+    `detection_limits`). Binary results (1/0) are positive when 1. Missing
+    loads are never positive.
+    """
+    v = numeric_load(df["PathogenLoad"]).to_numpy(dtype=float)
+    codes, units = category_codes(df["Units"])
+    limits = {**DETECTION_LIMITS, **(detection_limits or {})}
+    # One entry per distinct unit, plus a last one for missing Units (code -1)
+    unit_is_ct = np.array([str(u) == "Ct" for u in units] + [False])
+    unit_limit = np.array([limits.get(str(u), DEFAULT_DETECTION_LIMIT) for u in units]
+                          + [DEFAULT_DETECTION_LIMIT], dtype=float)
+    is_ct = unit_is_ct[codes]
+    limit = np.where(is_ct, ct_limit, unit_limit[codes])
+    positive = ~np.isnan(v) & np.where(is_ct, v < limit, v > limit)
+    return v, is_ct, limit, positive
+
+
+def _sorted_series(df, keys, ct_limit, detection_limits):
+    """Series codes, times, loads, Ct flags, detection limits and positivity, sorted by (series, time)."""
+    groups = df.groupby(keys, dropna=False, sort=True, observed=True)
+    series = groups.ngroup().to_numpy()
+    index = groups.size().reset_index()[keys]
+
+    t = pd.to_numeric(df["TimeDays"], errors="coerce").to_numpy(dtype=float)
+    v, is_ct, limit, positive = detection(df, ct_limit, detection_limits)
+
+    keep = ~np.isnan(t)
+    order = np.lexsort((t[keep], series[keep]))
+    return (index, series[keep][order], t[keep][order], v[keep][order],
+            is_ct[keep][order], limit[keep][order], positive[keep][order])
+
+
+def kinetics(df, keys=SERIES_KEYS, ct_limit=CT_LIMIT, detection_limits=None):
+    """
+    Kinetics features for every series of `df`.
+
+    Positives are the samples detected at `ct_limit` / `detection_limits` (see
+    detection()); FirstPositive, LastPositive, SheddingDuration and PeakTime
+    are based on them, and AUC is the area above the detection limit.
+
+    Returns:
+        pd.DataFrame: one row per series with the `keys` columns followed by
+        FEATURE_COLUMNS. Times are in TimeDays; PeakLoad is in the series' Units.
+        Features that are undefined for a series (e.g. no positive sample) are NaN.
+    """
+    index, series, t, v, is_ct, limit, positive = _sorted_series(df, keys, ct_limit, detection_limits)
+    out = index.copy()
+    n = len(index)
+    if t.size == 0:
+        return out.reindex(columns=list(keys) + FEATURE_COLUMNS)
+
+    # Contiguous run of every series in the sorted arrays (series without timed rows stay empty)
+    present, starts = np.unique(series, return_index=True)
+    counts = np.diff(np.append(starts, len(series)))
+
+    def per_series(values, fill):
+        result = np.full(n, fill, dtype=values.dtype)
+        result[present] = values
+        return result
+
+    measured = ~np.isnan(v)
+    # Signal on a "higher is more virus" scale
+    signal = np.where(is_ct, ct_limit - v, v)
+
+    n_samples = per_series(counts, 0)
+    n_measured = per_series(np.add.reduceat(measured.astype(np.int64), starts), 0)
+    positives = np.add.reduceat(positive.astype(np.int64), starts)
+    n_positive = per_series(positives, 0)
+    first_time = per_series(t[starts], np.nan)
+    last_time = per_series(t[starts + counts - 1], np.nan)
+
+    # Peak: highest signal, at its earliest time (undefined without a positive sample)
+    peak_signal = np.maximum.reduceat(np.where(measured, signal, -np.inf), starts)
+    at_peak = positive & (signal == np.repeat(peak_signal, counts))
+    peak_time = np.minimum.reduceat(np.where(at_peak, t, np.inf), starts)
+    peak_load = np.where(is_ct[starts], ct_limit - peak_signal, peak_signal)
+    peak_load = np.where(positives > 0, peak_load, np.nan)
+
+    first_pos = np.minimum.reduceat(np.where(positive, t, np.inf), starts)
+    last_pos = np.maximum.reduceat(np.where(positive, t, -np.inf), starts)
+
+    # Trapezoidal area above the detection limit between consecutive measured points of the same series
+    m_series, m_t = series[measured], t[measured]
+    m_signal = np.maximum(np.where(is_ct, signal, v - limit)[measured], 0.0)
+    same = m_series[1:] == m_series[:-1]
+    trapezoids = np.where(same, np.diff(m_t) * (m_signal[1:] + m_signal[:-1]) / 2, 0.0)
+    auc = np.bincount(m_series[1:], weights=trapezoids, minlength=n) if m_series.size > 1 else np.zeros(n)
+
+    def finite(a):
+        return np.where(np.isfinite(a), a, np.nan)
+
+    out["NSamples"] = n_samples
+    out["NMeasured"] = n_measured
+    out["NPositive"] = n_positive
+    out["FirstTime"] = first_time
+    out["LastTime"] = last_time
+    out["PeakLoad"] = per_series(finite(peak_load), np.nan)
+    out["PeakTime"] = per_series(finite(peak_time), np.nan)
+    out["FirstPositive"] = per_series(finite(first_pos), np.nan)
+    out["LastPositive"] = per_series(finite(last_pos), np.nan)
+    out["SheddingDuration"] = out["LastPositive"] - out["FirstPositive"]
+    out["AUC"] = np.where(n_measured > 1, auc, np.nan)
+    return out
+
+
+def partition_kinetics_path(study_id, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, PARTITION_DIR, f"{study_id}.kinetics.csv")
+
+
+def write_partition_kinetics(study_id, df, output_dir=OUTPUT_DIR):
+    """Write one study's kinetics features next to its partition."""
+    path = partition_kinetics_path(study_id, output_dir)
+    kinetics(df).to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def assemble_kinetics(manifest, output_dir=OUTPUT_DIR):
+    """Combine the per-study features into output/kinetics.csv."""
+    frames = [
+        pd.read_csv(partition_kinetics_path(study_id, output_dir), dtype={k: str for k in SERIES_KEYS})
+        for study_id in sorted(manifest["partitions"])
+        if os.path.exists(partition_kinetics_path(study_id, output_dir))
+    ]
+    features = (pd.concat(frames, ignore_index=True) if frames
+                else pd.DataFrame(columns=SERIES_KEYS + FEATURE_COLUMNS))
+    path = os.path.join(output_dir, KINETICS_FILE)
+    features.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return path
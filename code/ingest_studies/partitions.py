@@ -0,0 +1,178 @@
+"""
+Partitioned storage for the combined output.
+
+Each study is written to its own partition file (`output/partitions/<StudyID>.csv`)
+and described in `output/manifest.json` together with the derived artifacts
+computed from it (row count, distinct individuals, TimeDays range and counts).
+`combined_cleaned_data.csv` is then assembled by byte-concatenating the partition
+files — no partition is re-parsed or re-formatted — so replacing or adding one
+study only re-ingests and re-summarizes that study.
+
+All files are written to a temporary name first and moved into place with
+os.replace(), so readers never see a half-written partition or combined file.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import pandas as pd
+
+OUTPUT_DIR = "output"
+PARTITION_DIR = "partitions"
+MANIFEST_FILE = "manifest.json"
+COMBINED_FILE = "combined_cleaned_data.csv"
+DOWNLOAD_DIR = "downloads"
+
+# Where the OPKCWeb visualization app reads its data from
+WEB_DATA_DIR = os.path.join("OPKCWeb", "visualization", "data")
+
+
+def _atomic_replace(tmp_path, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path, block_size=1 << 20):
+    """SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def partition_path(study_id, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, PARTITION_DIR, f"{study_id}.csv")
+
+
+def load_manifest(output_dir=OUTPUT_DIR):
+    """Return the manifest dict, or an empty one if nothing was published yet."""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"partitions": {}}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_manifest(manifest, output_dir=OUTPUT_DIR):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    os.makedirs(output_dir, exist_ok=True)
+    with open(tmp_path, "w") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    _atomic_replace(tmp_path, path)
+
+
+def summarize_partition(df):
+    """Derived artifacts for one partition; merged across partitions by the readers."""
+    times = pd.to_numeric(df["TimeDays"], errors="coerce").dropna()
+    time_counts = times.value_counts().sort_index()
+    return {
+        "rows": int(len(df)),
+        "individuals": int(df["IndivID"].nunique()),
+        "time_min": float(times.min()) if len(times) else None,
+        "time_max": float(times.max()) if len(times) else None,
+        "time_counts": {repr(float(t)): int(c) for t, c in time_counts.items()},
+    }
+
+
+def write_partition(study_id, df, output_dir=OUTPUT_DIR, manifest=None):
+    """
+    Atomically write (or replace) one study's partition and update its manifest entry.
+
+    Returns the updated manifest (also saved to disk).
+    """
+    if manifest is None:
+        manifest = load_manifest(output_dir)
+    path = partition_path(study_id, output_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    df.to_csv(tmp_path, index=False)
+    _atomic_replace(tmp_path, path)
+
+    entry = summarize_partition(df)
+    entry["file"] = os.path.relpath(path, output_dir)
+    entry["bytes"] = os.path.getsize(path)
+    entry["sha256"] = file_sha256(path)
+    manifest["partitions"][study_id] = entry
+    save_manifest(manifest, output_dir)
+    return manifest
+
+
+def assemble_combined(manifest, output_dir=OUTPUT_DIR, combined_file=COMBINED_FILE):
+    """
+    Build the combined CSV by concatenating partition files byte-for-byte.
+
+    The header is taken from the first partition and skipped in the others.
+    Returns the path of the combined file.
+    """
+    path = os.path.join(output_dir, combined_file)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for i, study_id in enumerate(sorted(manifest["partitions"])):
+            entry = manifest["partitions"][study_id]
+            with open(os.path.join(output_dir, entry["file"]), "rb") as src:
+                header = src.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(src, out, 1 << 20)
+    _atomic_replace(tmp_path, path)
+    return path
+
+
+def combined_summary(manifest):
+    """Merge the per-partition artifacts into whole-dataset totals."""
+    entries = manifest["partitions"].values()
+    time_counts = {}
+    for entry in entries:
+        for t, c in entry["time_counts"].items():
+            time_counts[t] = time_counts.get(t, 0) + c
+    return {
+        "rows": sum(e["rows"] for e in entries),
+        "studies": len(manifest["partitions"]),
+        "time_counts": dict(sorted(time_counts.items(), key=lambda kv: float(kv[0]))),
+    }
+
+
+def link_or_copy(src, dst):
+    """Atomically place `src` at `dst`, as a hard link where possible."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.exists(dst + ".tmp"):
+        os.remove(dst + ".tmp")
+    # Builds always write new files, so a hard link is safe and avoids copying
+    try:
+        os.link(src, dst + ".tmp")
+    except OSError:
+        shutil.copyfile(src, dst + ".tmp")
+    os.replace(dst + ".tmp", dst)
+
+
+def publish(output_dir=OUTPUT_DIR, web_data_dir=WEB_DATA_DIR, files=(COMBINED_FILE, "facets.csv", "kinetics.csv")):
+    """
+    Atomically copy the built artifacts into the web app's data directory.
+
+    The download artifacts (see downloads.py), if built, are published too, with
+    their manifest last so it never lists a file that is not in place yet.
+
+    Running OPKCWeb workers check the data file's signature on every request
+    (see visualization/dataset.py), so they swap to the new dataset on their
+    next request without a restart.
+    """
+    names = [name for name in files if os.path.exists(os.path.join(output_dir, name))]
+    download_root = os.path.join(output_dir, DOWNLOAD_DIR)
+    if os.path.isdir(download_root):
+        downloads = []
+        for root, _, filenames in os.walk(download_root):
+            downloads.extend(
+                os.path.relpath(os.path.join(root, f), output_dir) for f in filenames if not f.endswith(".tmp")
+            )
+        # The manifest (downloads/*.json) goes last
+        names.extend(sorted(downloads, key=lambda name: (name.endswith(".json"), name)))
+
+    published = []
+    for name in names:
+        dst = os.path.join(web_data_dir, name)
+        link_or_copy(os.path.join(output_dir, name), dst)
+        published.append(dst)
+    return published
@@ -0,0 +1,170 @@
+"""
+Opt-in profiling of loaders and web views, saved as reports under output/profiles/.
+
+`Profiler` is a context manager that runs its block under cProfile and writes
+three files named `<UTC time>-<name>`:
+
+- `.pstats`: the raw statistics, for `python -m pstats` or snakeviz;
+- `.collapsed`: folded stacks ("outer;inner;leaf <microseconds>"), the input
+  of flamegraph.pl, speedscope and inferno;
+- `.json`: metadata (what was profiled, dataset version, row counts,
+  parameters, wall time) and the slowest functions by cumulative time.
+
+cProfile records caller -> callee edges rather than whole stacks, so the folded
+stacks are reconstructed from the call graph: a function's time is split
+between its callers in proportion to the time each call edge accounts for.
+That is exact for tree-shaped call graphs and an approximation where a
+function is reached from several places.
+
+A disabled Profiler does nothing, so callers can wrap their work
+unconditionally:
+
+    with Profiler(f"load_and_format-{study_id}", enabled=args.profile) as profiler:
+        df = module.load_and_format()
+        profiler.metadata["rows"] = len(df)
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+from partitions import OUTPUT_DIR
+
+PROFILE_DIR = "profiles"
+TOP_FUNCTIONS = 25
+MAX_DEPTH = 128
+MIN_MICROSECONDS = 1
+
+
+def profile_dir(output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, PROFILE_DIR)
+
+
+def _is_profiler(func):
+    """Whether a pstats function key is the profiler's own bookkeeping (Profiler.__exit__)."""
+    if func[0] == "~":
+        return "_lsprof.Profiler" in func[2]
+    return os.path.abspath(func[0]) == os.path.abspath(__file__)
+
+
+def _label(func):
+    """Flame-graph frame label of a pstats function key (filename, line, name)."""
+    filename, line, name = func
+    if filename == "~":
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{line})"
+    return label.replace(";", ",")
+
+
+def collapsed_stacks(stats):
+    """
+    Folded stacks of a pstats.Stats, as {"frame;frame;...": microseconds}.
+
+    Roots are the functions without a recorded caller (those called directly
+    from the profiled block), apart from the Profiler's own exit. Recursive
+    calls are folded into the first occurrence of the function on the stack.
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, entry in entries.items() if not entry[4] and not _is_profiler(func)]
+
+    folded = {}
+    # Depth-first over (function, stack, share of the function's time on this stack)
+    pending = [(func, (), 1.0) for func in roots]
+    while pending:
+        func, stack, share = pending.pop()
+        stack = stack + (_label(func),)
+        own = entries[func][2] * share * 1e6
+        if own >= MIN_MICROSECONDS:
+            key = ";".join(stack)
+            folded[key] = folded.get(key, 0) + own
+        if len(stack) >= MAX_DEPTH:
+            continue
+        for callee, edge_time in callees.get(func, ()):
+            total = entries[callee][3]
+            if total <= 0 or _label(callee) in stack:
+                continue
+            callee_share = share * edge_time / total
+            if total * callee_share * 1e6 >= MIN_MICROSECONDS:
+                pending.append((callee, stack, callee_share))
+    return {key: int(round(value)) for key, value in folded.items() if value >= 0.5}
+
+
+def top_functions(stats, n=TOP_FUNCTIONS):
+    """The `n` functions with the most cumulative time."""
+    rows = sorted(((func, entry) for func, entry in stats.stats.items() if not _is_profiler(func)),
+                  key=lambda item: item[1][3], reverse=True)[:n]
+    return [
+        {"function": _label(func), "calls": nc, "own_seconds": round(tt, 6), "cumulative_seconds": round(ct, 6)}
+        for func, (_, nc, tt, ct, _) in rows
+    ]
+
+
+def write_report(name, profile, metadata, directory):
+    """Write the .pstats, .collapsed and .json reports of `profile`; returns the path prefix."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
+    prefix = os.path.join(directory, f"{stamp}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}")
+
+    stats = pstats.Stats(profile)
+    stats.dump_stats(prefix + ".pstats")
+    with open(prefix + ".collapsed", "w") as fh:
+        for stack, microseconds in sorted(collapsed_stacks(stats).items()):
+            fh.write(f"{stack} {microseconds}\n")
+    report = {
+        "name": name,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        **metadata,
+        "top_functions": top_functions(stats),
+    }
+    with open(prefix + ".json", "w") as fh:
+        json.dump(report, fh, indent=2, default=str)
+    return prefix
+
+
+class Profiler:
+    """
+    Profile the enclosed block and save its reports on exit (also when it raises).
+
+    Parameters:
+        name (str): Report name, e.g. "load_and_format-ke2022" or "view-kinetics".
+        directory (str): Where the reports are written (default output/profiles/).
+        metadata (dict): Extra report fields; the block may add more via `profiler.metadata`.
+        enabled (bool): With False the Profiler does nothing.
+    """
+
+    def __init__(self, name, directory=None, metadata=None, enabled=True):
+        self.name = name
+        self.directory = directory or profile_dir()
+        self.metadata = dict(metadata or {})
+        self.enabled = enabled
+        self.report = None
+        self._profile = None
+
+    def __enter__(self):
+        if self.enabled:
+            self._started = time.perf_counter()
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profile is None:
+            return False
+        self._profile.disable()
+        self.metadata["seconds"] = round(time.perf_counter() - self._started, 6)
+        if exc is not None:
+            self.metadata["error"] = repr(exc)
+        self.report = write_report(self.name, self._profile, self.metadata, self.directory)
+        self._profile = None
+        return False
@@ -0,0 +1,150 @@
+"""
+Resampling of per-infection trajectories onto a common time grid.
+
+Studies sample on very different schedules (daily, every 12 hours, study days,
+re-baselined days), so cross-study comparisons need every trajectory on the same
+time axis. `resample()` does that for all infections at once: observations are
+sorted by (series, TimeDays) into one composite key, and every (series, grid
+point) pair is located with a single binary search. No per-infection loop.
+
+The result is a dense (infections x grid) float32 matrix plus a boolean mask that
+is True only where the grid point lies within the infection's observed support.
+
+Example:
+    traj = resample(df[df["Units"] == "Ct"], grid=np.arange(0, 21, 1.0))
+    traj.values[traj.mask].mean()
+"""
+
+from collections import OrderedDict, namedtuple
+import numpy as np
+import pandas as pd
+
+INFECTION_KEYS = ["StudyID", "IndivID", "InfectionID"]
+METHODS = ("linear", "locf")
+
+Trajectories = namedtuple("Trajectories", ["index", "grid", "values", "mask"])
+
+_CACHE = OrderedDict()
+CACHE_SIZE = 32
+
+
+def _prepare(df, keys, value, censor_value):
+    """Observations sorted by (series, time), duplicates at one time averaged."""
+    groups = df.groupby(keys, dropna=False, sort=True, observed=True)
+    data = pd.DataFrame({
+        "series": groups.ngroup().to_numpy(),
+        "t": pd.to_numeric(df["TimeDays"], errors="coerce").to_numpy(dtype=float),
+        "v": pd.to_numeric(df[value], errors="coerce").to_numpy(dtype=float),
+    })
+    index = groups.size().reset_index()[keys]
+
+    # Censored (non-detect) observations: either pinned at censor_value or dropped
+    if censor_value is not None:
+        data["v"] = data["v"].fillna(censor_value)
+    data = data.dropna(subset=["t", "v"])
+    data = data.groupby(["series", "t"], sort=True, as_index=False)["v"].mean()
+    return index, data["series"].to_numpy(), data["t"].to_numpy(), data["v"].to_numpy()
+
+
+def resample(df, grid, method="linear", keys=INFECTION_KEYS, value="PathogenLoad", censor_value=None):
+    """
+    Map every series' trajectory onto a common time grid.
+
+    Parameters:
+        df (pd.DataFrame): Long data with `keys`, TimeDays and `value` columns.
+            Filter to one measurement type (Units/SampleSource/Targets) first, or
+            add those columns to `keys`.
+        grid (array-like): Common TimeDays grid.
+        method (str): "linear" interpolation between neighbouring observations, or
+            "locf" (last observation carried forward).
+        keys (list): Columns identifying one trajectory.
+        value (str): Column holding the measurement.
+        censor_value (float or None): Value used for censored (missing/non-detect)
+            measurements at observed times; None drops them.
+
+    Returns:
+        Trajectories: (index, grid, values, mask) where index is a DataFrame of the
+        series keys (row i of values/mask), values is float32 (series x grid) and
+        mask is True where the grid point is within the series' observed support.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}'; expected one of {METHODS}.")
+    grid = np.asarray(grid, dtype=float)
+    index, series, t, v = _prepare(df, keys, value, censor_value)
+    n_series, n_grid = len(index), len(grid)
+    values = np.full((n_series, n_grid), np.nan, dtype=np.float32)
+    mask = np.zeros((n_series, n_grid), dtype=bool)
+    if t.size == 0 or n_grid == 0:
+        return Trajectories(index, grid, values, mask)
+
+    # Composite key: series * span + time offset, sorted because data is sorted
+    tmin, tmax = t.min(), t.max()
+    span = (tmax - tmin) + 1.0
+    key = series * span + (t - tmin)
+
+    # One binary search per (series, grid point); offsets clipped to stay within a series
+    offsets = np.clip(grid - tmin, -0.5, span - 0.5)
+    query = (np.arange(n_series)[:, None] * span + offsets[None, :]).ravel()
+    s_q = np.repeat(np.arange(n_series), n_grid)
+    g_q = np.tile(grid, n_series)
+
+    left = np.searchsorted(key, query, side="right") - 1
+    left_ok = (left >= 0) & (series[np.clip(left, 0, None)] == s_q)
+    left = np.clip(left, 0, t.size - 1)
+    right = np.clip(left + 1, 0, t.size - 1)
+    right_ok = left_ok & (left + 1 < t.size) & (series[right] == s_q)
+    exact = left_ok & (t[left] == g_q)
+
+    if method == "linear":
+        ok = exact | right_ok
+        dt = np.where(right_ok, t[right] - t[left], 1.0)
+        w = np.where(right_ok, (g_q - t[left]) / dt, 0.0)
+        out = np.where(exact, v[left], v[left] + w * (v[right] - v[left]))
+    else:
+        # LOCF within support: up to and including the series' last observation
+        last_t = np.full(n_series, -np.inf)
+        np.maximum.at(last_t, series, t)
+        ok = left_ok & (g_q <= last_t[s_q])
+        out = v[left]
+
+    values.ravel()[ok] = out[ok]
+    mask.ravel()[ok] = True
+    return Trajectories(index, grid, values, mask)
+
+
+def _filter(df, filters):
+    m = np.ones(len(df), dtype=bool)
+    for col, wanted in (filters or {}).items():
+        wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+        m &= df[col].isin(list(wanted)).to_numpy()
+    return df[m]
+
+
+def resample_cached(df, grid, filters=None, dataset_key=None, **kwargs):
+    """
+    resample() of `df` restricted to `filters` ({column: value or list}), cached
+    per (dataset_key, grid, filters, options).
+
+    `dataset_key` must change whenever the underlying data changes (e.g. a
+    snapshot version or the file's mtime/size); without it nothing is cached.
+    """
+    if dataset_key is None:
+        return resample(_filter(df, filters), grid, **kwargs)
+
+    frozen_filters = tuple(sorted(
+        (col, tuple(sorted(map(str, v))) if isinstance(v, (list, tuple, set)) else (str(v),))
+        for col, v in (filters or {}).items()
+    ))
+    cache_key = (
+        dataset_key, tuple(np.asarray(grid, dtype=float).tolist()), frozen_filters,
+        tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in kwargs.items())),
+    )
+    if cache_key in _CACHE:
+        _CACHE.move_to_end(cache_key)
+        return _CACHE[cache_key]
+
+    result = resample(_filter(df, filters), grid, **kwargs)
+    _CACHE[cache_key] = result
+    while len(_CACHE) > CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return result
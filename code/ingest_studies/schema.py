@@ -1,3 +1,5 @@
+import numbers
+import numpy as np
 import pandas as pd
 
 STANDARD_SCHEMA = [
@@ -11,6 +13,13 @@ STANDARD_SCHEMA = [
     "Targets", "PlatformTech"
 ]
 
+NUMERIC_COLUMNS = ["TimeDays", "AgeRng1", "AgeRng2", "GEml_conversion_intercept", "GEml_conversion_slope"]
+
+# Binary test results (Units "binary") are stored in PathogenLoad as 1 (positive) / 0 (negative)
+BINARY_VALUES = {"pos": 1.0, "positive": 1.0, "detected": 1.0, "neg": 0.0, "negative": 0.0, "not detected": 0.0}
+
+STRING_COLUMNS = ["StudyID", "IndivID", "Pathogen", "IndSpecies", "InfectionID", "SampleID", "Symptoms1", "Symptoms2", "Symptoms3", "Symptoms4", "Comorbidity1", "Comorbidity2", "Comorbidity3", "Comorbidity4", "Treatment1", "Treatment2", "Treatment3", "Treatment4", "SampleSource", "SampleMethod", "Subtype", "PlatformType", "DOI", "Units", "Targets", "PlatformTech"]
+
 def enforce_schema(df):
     """Add missing columns from the schema and return ordered DataFrame."""
     for col in STANDARD_SCHEMA:
@@ -18,16 +27,114 @@ def enforce_schema(df):
             df[col] = pd.NA
     return df[STANDARD_SCHEMA]
 
+def _categorical_as_str(values):
+    """astype(str) of a categorical, done on its categories (NA as astype(str) renders it)."""
+    categories = values.cat.categories.astype(str)
+    codes = values.cat.codes.to_numpy()
+    na = pd.Series([np.nan], dtype=object).astype(str).iloc[0]
+    if (codes == -1).any() and not pd.isna(na):
+        categories = categories.append(pd.Index([na]))
+        codes = np.where(codes == -1, len(categories) - 1, codes)
+    if not categories.is_unique:
+        return values.astype(str)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+def numeric_load(values):
+    """PathogenLoad as floats, with binary labels ("Pos"/"Neg", see BINARY_VALUES) as 1/0."""
+    load = pd.to_numeric(values, errors="coerce")
+    if not pd.api.types.is_numeric_dtype(values.dtype):
+        labels = values.astype(str).str.strip().str.lower().map(BINARY_VALUES)
+        load = load.fillna(labels)
+    return load.astype(float)
+
 def coerce_types(df):
-    numeric_cols = ["TimeDays", "AgeRng1", "AgeRng2", "GEml_conversion_intercept", "GEml_conversion_slope"]
-    for col in numeric_cols:
+    for col in NUMERIC_COLUMNS:
         df[col] = pd.to_numeric(df[col], errors="coerce")
+    df["PathogenLoad"] = numeric_load(df["PathogenLoad"])
 
-    string_cols = ["StudyID", "IndivID", "Pathogen", "IndSpecies", "InfectionID", "SampleID", "Symptoms1", "Symptoms2", "Symptoms3", "Symptoms4", "Comorbidity1", "Comorbidity2", "Comorbidity3", "Comorbidity4", "Treatment1", "Treatment2", "Treatment3", "Treatment4", "SampleSource", "SampleMethod", "Subtype", "PlatformType", "DOI", "Units", "Targets", "PlatformTech"]
-    df[string_cols] = df[string_cols].astype(str)
+    # Categorical columns (e.g. constant metadata) stay categorical, with string categories
+    categorical = [col for col in STRING_COLUMNS if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    for col in categorical:
+        df[col] = _categorical_as_str(df[col])
+    other = [col for col in STRING_COLUMNS if col not in categorical]
+    df[other] = df[other].astype(str)
 
     return df
 
+def category_codes(series):
+    """(codes, uniques) of a column; NA gets code -1."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    return pd.factorize(series, use_na_sentinel=True)
+
+def broadcast(codes, values):
+    """
+    Column from one value per code (-1 and NA values give NA).
+
+    Strings become a categorical sharing `codes`; numbers a float array.
+    """
+    values = list(values)
+    if all(isinstance(v, numbers.Number) or pd.isna(v) for v in values):
+        lookup = np.append(np.array([np.nan if pd.isna(v) else v for v in values], dtype=float), np.nan)
+        return lookup[codes]
+    categories = list(dict.fromkeys(v for v in values if not pd.isna(v)))
+    index = {v: i for i, v in enumerate(categories)}
+    remap = np.append(np.array([-1 if pd.isna(v) else index[v] for v in values], dtype=np.int32), -1)
+    return pd.Categorical.from_codes(remap[codes], categories=categories)
+
+def map_uniques(series, func):
+    """Apply `func` to each distinct value of `series` once and broadcast the results."""
+    codes, uniques = category_codes(series)
+    return broadcast(codes, [func(v) for v in uniques])
+
+def melt_values(df, value_columns, id_columns, value_name="PathogenLoad"):
+    """
+    Reshapes wide value columns into the long layout used by STANDARD_SCHEMA in
+    a single vectorized pass.
+
+    Every value column contributes one block of len(df) rows. The id columns
+    are repeated for each block, and the per-column metadata (e.g. Targets,
+    Units, SampleSource, PlatformType, or IndivID for one-column-per-person
+    sheets) is added as categorical columns built from block codes, so no
+    per-target copy of the frame and no per-row strings are created.
+
+    Parameters:
+        df (pd.DataFrame): Wide DataFrame.
+        value_columns (dict): Maps each value column to a dict of metadata
+            columns for its rows, e.g.
+            {"Nasal_CN": {"SampleSource": "nasal", "Units": "Ct"}, ...}.
+            Metadata keys missing for a column are left NA.
+        id_columns (list): Columns repeated for every value column.
+        value_name (str): Name of the output value column.
+
+    Returns:
+        pd.DataFrame: Long DataFrame with id_columns, value_name and the metadata columns.
+    """
+    n = len(df)
+    cols = list(value_columns)
+    k = len(cols)
+
+    out = {}
+    for col in id_columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            out[col] = pd.Categorical.from_codes(np.tile(values.cat.codes.to_numpy(), k), dtype=values.dtype)
+        else:
+            out[col] = np.tile(values.to_numpy(), k)
+    out[value_name] = np.concatenate([df[col].to_numpy() for col in cols]) if k else np.empty(0)
+
+    # Metadata: one category per distinct value, one code per block
+    block = np.repeat(np.arange(k), n)
+    meta_keys = list(dict.fromkeys(key for spec in value_columns.values() for key in spec))
+    for key in meta_keys:
+        values = [value_columns[col].get(key, pd.NA) for col in cols]
+        categories = list(dict.fromkeys(v for v in values if not pd.isna(v)))
+        lookup = {v: i for i, v in enumerate(categories)}
+        block_codes = np.array([lookup.get(v, -1) if not pd.isna(v) else -1 for v in values], dtype=np.int32)
+        out[key] = pd.Categorical.from_codes(block_codes[block], categories=categories)
+
+    return pd.DataFrame(out)
+
 def split_age_range(df, col="AgeGrp", out1="AgeRng1", out2="AgeRng2"):
     """
     Splits an age range string like '[30, 39)' or '30-39' in a DataFrame column
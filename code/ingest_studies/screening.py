@@ -0,0 +1,259 @@
+"""
+Monte Carlo evaluation of testing strategies against observed trajectories.
+
+Infections are taken from the combined dataset: every (infection, SampleSource,
+Targets, Units) series is resampled onto a fine common time grid (resample.py),
+so each simulated person follows a real trajectory. A testing policy is a test
+interval, an assay limit of detection and a result turnaround delay. For a
+block of simulations at once the simulator draws a trajectory and a random
+schedule phase per person, builds the whole (people x tests) matrix of sampling
+times by broadcasting, and looks up every test result with one fancy index:
+
+- a test is positive if the trajectory is strictly beyond the limit of
+  detection at the sampling time (Ct < lod, or load > lod for the other
+  scales). A value equal to the LOD is a non-detect, as in kinetics.py, so
+  lod=40 treats the usual Ct 40 non-detect code as negative;
+- the person is isolated from the first positive test's result time
+  (test time + turnaround) onwards;
+- infectious days averted are the trajectory's infectious grid time after
+  that point (a suffix sum precomputed per trajectory).
+
+Blocks are capped at BLOCK_CELLS (people x tests) cells, about BLOCK_BYTES of
+arrays, so each process's memory stays bounded. Blocks (and policies) are
+independent and can be spread over a process pool, at one block of memory per
+process; every block has its own seed, so results do not depend on the number
+of processes.
+
+Antigen results (Units "binary", stored as 1/0 in PathogenLoad) are simulated
+with lod=0.5. With scale="log10_geml", Ct values are converted to log10 GE/mL using
+each series' GEml_conversion_intercept/slope, so assays with limits of
+detection in GE/mL can be compared across sample types.
+
+Example:
+    traj = load_trajectories(df, {"StudyID": "ke2022", "Units": "Ct", "SampleSource": "nasal"})
+    simulate(traj, [Policy(1, 35, 0), Policy(3, 35, 1)], infectious=30, simulations=1_000_000)
+
+Usage:
+    $ python3 code/ingest_studies/screening.py --study ke2022 --units Ct \\
+          --source nasal --source saliva --interval 1 2 3 7 --lod 30 35 40 --turnaround 0 1
+"""
+
+import argparse
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from partitions import OUTPUT_DIR, COMBINED_FILE
+from resample import resample
+from schema import STRING_COLUMNS
+
+SERIES_KEYS = ["StudyID", "IndivID", "InfectionID", "SampleSource", "Targets", "Units"]
+GRID_STEP = 0.25
+# Working memory per process for one block: a block holds about CELL_BYTES per
+# (person, test) cell (float64 grid positions, int32 grid indices and bool
+# results), so BLOCK_CELLS is about 64 MB of arrays
+BLOCK_BYTES = 64 * 2**20
+CELL_BYTES = 16
+BLOCK_CELLS = BLOCK_BYTES // CELL_BYTES
+
+Policy = namedtuple("Policy", ["interval", "lod", "turnaround"])
+
+# Resampled trajectories ready for simulation; `higher` is True when larger values mean more virus
+Cohort = namedtuple("Cohort", ["values", "mask", "grid", "higher"])
+
+_WORKER = {}
+
+
+def numeric_load(df, scale=None):
+    """PathogenLoad as floats (binary results are 1/0); Ct can be converted to log10 GE/mL."""
+    load = pd.to_numeric(df["PathogenLoad"], errors="coerce")
+    if scale == "log10_geml":
+        intercept = pd.to_numeric(df["GEml_conversion_intercept"], errors="coerce")
+        slope = pd.to_numeric(df["GEml_conversion_slope"], errors="coerce")
+        load = intercept + slope * load
+    elif scale is not None:
+        raise ValueError(f"Unknown scale '{scale}'; expected None or 'log10_geml'.")
+    return load
+
+
+def load_trajectories(df, filters=None, grid=None, scale=None, keys=SERIES_KEYS):
+    """
+    Resampled trajectories of the series of `df` matching `filters` ({column: value or list}).
+
+    The filters should select a single kind of measurement (Units, and usually
+    SampleSource); grid defaults to the data's TimeDays range in GRID_STEP steps.
+    """
+    for col, wanted in (filters or {}).items():
+        wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+        df = df[df[col].isin(list(wanted))]
+    if df.empty:
+        raise ValueError(f"No rows match {filters}.")
+    units = df["Units"].dropna().unique()
+    if len(units) != 1:
+        raise ValueError(f"Filters must select one kind of measurement; got Units {list(units)}.")
+
+    df = df.assign(PathogenLoad=numeric_load(df, scale).to_numpy())
+    if grid is None:
+        times = pd.to_numeric(df["TimeDays"], errors="coerce")
+        grid = np.arange(np.floor(times.min()), np.ceil(times.max()) + GRID_STEP / 2, GRID_STEP)
+    traj = resample(df, grid, method="linear", keys=keys)
+    keep = traj.mask.any(axis=1)
+    higher = not (units[0] == "Ct" and scale is None)
+    return Cohort(traj.values[keep], traj.mask[keep], traj.grid, higher)
+
+
+def _above(cohort, threshold):
+    """(trajectories x grid) bool: within support and strictly beyond `threshold` (Ct below, loads above)."""
+    with np.errstate(invalid="ignore"):
+        beyond = cohort.values > threshold if cohort.higher else cohort.values < threshold
+    return cohort.mask & beyond
+
+
+def _simulate_block(positive, suffix, step, policy, n, seed):
+    """Sums of the outcome measures over `n` simulated people under one policy."""
+    rng = np.random.default_rng(seed)
+    n_traj, n_grid = positive.shape
+    span = n_grid * step
+    n_tests = int(np.ceil(span / policy.interval)) + 1
+
+    person = rng.integers(n_traj, size=n)
+    phase = rng.random(n) * policy.interval
+    # Grid index of every test, computed in place: one float64 and one int32 array per block
+    position = phase[:, None] + np.arange(n_tests)[None, :] * policy.interval
+    position /= step
+    np.rint(position, out=position)
+    idx = position.astype(np.int32)
+    del position
+    in_range = idx < n_grid
+    np.minimum(idx, n_grid - 1, out=idx)
+    result = positive[person[:, None], idx]
+    result &= in_range
+    del idx, in_range
+
+    detected = result.any(axis=1)
+    first = result.argmax(axis=1)
+    detect_time = phase + first * policy.interval
+    isolate_idx = np.minimum(np.ceil((detect_time + policy.turnaround) / step).astype(np.int64), n_grid)
+    total = suffix[person, 0] * step
+    averted = np.where(detected, suffix[person, isolate_idx], 0.0) * step
+    return {
+        "simulations": n,
+        "detected": int(detected.sum()),
+        "detection_time": float(detect_time[detected].sum()),
+        "infectious_days": float(total.sum()),
+        "averted_days": float(averted.sum()),
+    }
+
+
+def _init_worker(positives, suffix, step):
+    _WORKER.update(positives=positives, suffix=suffix, step=step)
+
+
+def _run_job(job):
+    i, policy, n, seed = job
+    return i, _simulate_block(_WORKER["positives"][policy.lod], _WORKER["suffix"], _WORKER["step"], policy, n, seed)
+
+
+def simulate(cohort, policies, infectious, simulations=1_000_000, seed=0, processes=None):
+    """
+    Detection probability and infectious days averted for each testing policy.
+
+    Parameters:
+        cohort (Cohort): From load_trajectories().
+        policies (list): Policy(interval days, lod, turnaround days) tuples.
+        infectious (float): Infectiousness threshold on the cohort's scale
+            (e.g. 30 for Ct < 30); grid time strictly beyond it counts as infectious.
+        simulations (int): Simulated people per policy.
+        seed (int): Seed for the whole run.
+        processes (int or None): Worker processes; None or 1 simulates in this process.
+
+    Returns:
+        pd.DataFrame: One row per policy with detection_probability,
+        mean_detection_day (TimeDays of the first positive test, among detected),
+        infectious_days and infectious_days_averted (means per person) and
+        fraction_averted (of all infectious days).
+    """
+    step = float(cohort.grid[1] - cohort.grid[0]) if len(cohort.grid) > 1 else 1.0
+    infectious_grid = _above(cohort, infectious).astype(np.float64)
+    # suffix[i, j]: infectious grid points of trajectory i from grid index j on
+    suffix = np.zeros((infectious_grid.shape[0], infectious_grid.shape[1] + 1))
+    suffix[:, :-1] = np.cumsum(infectious_grid[:, ::-1], axis=1)[:, ::-1]
+
+    positives = {policy.lod: _above(cohort, policy.lod) for policy in policies}
+
+    blocks = []
+    for i, policy in enumerate(policies):
+        n_tests = int(np.ceil(len(cohort.grid) * step / policy.interval)) + 1
+        block = max(1, BLOCK_CELLS // n_tests)
+        blocks.extend((i, policy, min(block, simulations - start)) for start in range(0, simulations, block))
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+    jobs = [(i, policy, n, s) for (i, policy, n), s in zip(blocks, seeds)]
+
+    if processes and processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(positives, suffix, step)) as pool:
+            results = list(pool.map(_run_job, jobs))
+    else:
+        _init_worker(positives, suffix, step)
+        results = [_run_job(job) for job in jobs]
+
+    rows = []
+    for i, policy in enumerate(policies):
+        totals = pd.DataFrame([r for j, r in results if j == i]).sum()
+        rows.append({
+            "interval": policy.interval,
+            "lod": policy.lod,
+            "turnaround": policy.turnaround,
+            "simulations": int(totals["simulations"]),
+            "detection_probability": totals["detected"] / totals["simulations"],
+            "mean_detection_day": (cohort.grid[0] + totals["detection_time"] / totals["detected"]
+                                   if totals["detected"] else np.nan),
+            "infectious_days": totals["infectious_days"] / totals["simulations"],
+            "infectious_days_averted": totals["averted_days"] / totals["simulations"],
+            "fraction_averted": (totals["averted_days"] / totals["infectious_days"]
+                                 if totals["infectious_days"] else np.nan),
+        })
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate testing strategies against observed trajectories.")
+    parser.add_argument("--input", default=os.path.join(OUTPUT_DIR, COMBINED_FILE))
+    parser.add_argument("--study", action="append", dest="studies", help="Restrict to this StudyID; may be repeated.")
+    parser.add_argument("--units", required=True, help="Measurement to simulate, e.g. Ct or binary.")
+    parser.add_argument("--source", action="append", dest="sources",
+                        help="SampleSource to simulate separately (e.g. nasal, saliva); may be repeated.")
+    parser.add_argument("--scale", choices=["log10_geml"], help="Convert Ct to log10 GE/mL first.")
+    parser.add_argument("--interval", type=float, nargs="+", default=[1, 2, 3, 7], help="Days between tests.")
+    parser.add_argument("--lod", type=float, nargs="+", required=True, help="Assay limits of detection; values equal to the LOD are non-detects.")
+    parser.add_argument("--turnaround", type=float, nargs="+", default=[0], help="Days from test to result.")
+    parser.add_argument("--infectious", type=float, required=True,
+                        help="Infectiousness threshold on the same scale (e.g. 30 for Ct).")
+    parser.add_argument("--simulations", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Worker processes (default 1); each holds one block of about 64 MB.")
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.input, na_values=["<NA>"], dtype={c: str for c in STRING_COLUMNS}, low_memory=False)
+    policies = [Policy(i, l, t) for i in args.interval for l in args.lod for t in args.turnaround]
+    reports = []
+    for source in args.sources or [None]:
+        filters = {"Units": args.units}
+        if args.studies:
+            filters["StudyID"] = args.studies
+        if source is not None:
+            filters["SampleSource"] = source
+        cohort = load_trajectories(df, filters, scale=args.scale)
+        report = simulate(cohort, policies, args.infectious, args.simulations, args.seed, args.processes)
+        report.insert(0, "SampleSource", source or "all")
+        report.insert(1, "trajectories", len(cohort.values))
+        reports.append(report)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(pd.concat(reports, ignore_index=True).to_string(index=False, float_format="%.3f"))
+
+
+if __name__ == "__main__":
+    main()
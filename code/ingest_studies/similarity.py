@@ -0,0 +1,156 @@
+"""
+Nearest-neighbour search over resampled viral-load trajectories.
+
+Trajectories are first put on a common grid with `resample.resample()`. The
+index keeps the (series x grid) matrix with missing points zeroed and the
+support mask, so distances restricted to the points both trajectories observed
+reduce to a handful of masked matrix products:
+
+    n    = M  @ mq                   (overlapping points)
+    sum((x - q)^2) = X2 @ mq - 2 X @ (q mq) + M @ (q^2 mq)
+
+and likewise for the sums needed by the Pearson correlation. Database rows are
+processed in blocks so memory stays bounded for batched queries.
+
+Example:
+    traj = resample(df[df["Units"] == "Ct"], grid=np.arange(-5, 31, 1.0))
+    index = TrajectoryIndex(traj)
+    index.query_id(("kissler2023", "1234", "1"), k=5)
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+from resample import resample_cached
+
+METRICS = ("euclidean", "correlation")
+BLOCK_ROWS = 8192
+
+_INDEX_CACHE = OrderedDict()
+INDEX_CACHE_SIZE = 8
+
+
+class TrajectoryIndex:
+    """
+    Top-k similarity index over resampled trajectories.
+
+    Parameters:
+        traj (Trajectories): Output of resample() / resample_cached().
+        min_points (int): Trajectories with fewer observed grid points are not indexed.
+    """
+
+    def __init__(self, traj, min_points=3):
+        keep = traj.mask.sum(axis=1) >= min_points
+        self.index = traj.index[keep].reset_index(drop=True)
+        self.grid = traj.grid
+        self.mask = traj.mask[keep].astype(np.float32)
+        self.values = np.where(traj.mask[keep], traj.values[keep], 0.0).astype(np.float32)
+        self.squares = self.values * self.values
+        self._positions = {
+            tuple(str(v) for v in row): i for i, row in enumerate(self.index.itertuples(index=False))
+        }
+
+    def __len__(self):
+        return len(self.index)
+
+    def position(self, key):
+        """Row of the trajectory identified by its key tuple (compared as strings)."""
+        return self._positions[tuple(str(v) for v in key)]
+
+    def distances(self, q, qmask, metric="euclidean", min_overlap=3):
+        """
+        Distances from every indexed trajectory to each query row.
+
+        Parameters:
+            q (np.ndarray): (queries x grid) values; ignored where qmask is False.
+            qmask (np.ndarray): (queries x grid) boolean support mask.
+
+        Returns:
+            np.ndarray: (indexed x queries) float32 distances; inf where the
+            overlap is shorter than `min_overlap`.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'; expected one of {METRICS}.")
+        q = np.atleast_2d(q).astype(np.float32)
+        mq = np.atleast_2d(qmask).astype(np.float32)
+        q = np.where(mq > 0, q, 0.0).T
+        mq = mq.T
+        q2 = q * q
+
+        out = np.empty((len(self), q.shape[1]), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            sl = slice(start, start + BLOCK_ROWS)
+            X, X2, M = self.values[sl], self.squares[sl], self.mask[sl]
+            n = M @ mq
+            sx, sq, sxq = X @ mq, M @ q, X @ q
+            if metric == "euclidean":
+                ssd = X2 @ mq - 2.0 * sxq + M @ q2
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    d = np.sqrt(np.maximum(ssd, 0.0) / n)
+            else:
+                sxx, sqq = X2 @ mq, M @ q2
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    cov = sxq - sx * sq / n
+                    var = (sxx - sx * sx / n) * (sqq - sq * sq / n)
+                    d = 1.0 - cov / np.sqrt(var)
+            d[(n < min_overlap) | ~np.isfinite(d)] = np.inf
+            out[sl] = d
+        return out
+
+    def query(self, q, qmask, k=10, metric="euclidean", exclude=None, min_overlap=3):
+        """
+        The k nearest indexed trajectories to a single query trajectory.
+
+        Returns:
+            pd.DataFrame: Series keys of the neighbours plus `distance` and
+            `overlap` (number of shared grid points), nearest first.
+        """
+        d = self.distances(q, qmask, metric, min_overlap)[:, 0]
+        if exclude is not None:
+            d[exclude] = np.inf
+        k = min(k, int(np.isfinite(d).sum()))
+        if k == 0:
+            return self.index.iloc[:0].assign(distance=[], overlap=[])
+        top = np.argpartition(d, k - 1)[:k]
+        top = top[np.argsort(d[top], kind="stable")]
+        overlap = (self.mask[top] @ np.asarray(qmask, dtype=np.float32).ravel()).astype(int)
+        return self.index.iloc[top].assign(distance=d[top], overlap=overlap).reset_index(drop=True)
+
+    def query_id(self, key, k=10, metric="euclidean", min_overlap=3):
+        """The k nearest neighbours of an indexed trajectory (excluding itself)."""
+        i = self.position(key)
+        return self.query(self.values[i], self.mask[i] > 0, k, metric, exclude=i, min_overlap=min_overlap)
+
+
+def trajectory_on_grid(times, values, grid):
+    """Linearly interpolate an uploaded trajectory onto `grid` within its observed support."""
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if times.ndim != 1 or times.shape != values.shape:
+        raise ValueError("times and values must be lists of numbers of the same length.")
+    ok = ~(np.isnan(times) | np.isnan(values))
+    times, values = times[ok], values[ok]
+    order = np.argsort(times)
+    times, values = times[order], values[order]
+    grid = np.asarray(grid, dtype=float)
+    if times.size == 0:
+        return np.zeros(grid.shape), np.zeros(grid.shape, dtype=bool)
+    mask = (grid >= times[0]) & (grid <= times[-1])
+    return np.interp(grid, times, values), mask
+
+
+def get_index(df, grid, filters=None, dataset_key=None, min_points=3, **resample_kwargs):
+    """TrajectoryIndex over `df` restricted to `filters`, cached like resample_cached()."""
+    traj = resample_cached(df, grid, filters, dataset_key, **resample_kwargs)
+    if dataset_key is None:
+        return TrajectoryIndex(traj, min_points)
+    cache_key = (id(traj), min_points)
+    cached = _INDEX_CACHE.get(cache_key)
+    if cached is not None and cached[0] is traj:
+        _INDEX_CACHE.move_to_end(cache_key)
+        return cached[1]
+    index = TrajectoryIndex(traj, min_points)
+    _INDEX_CACHE[cache_key] = (traj, index)
+    while len(_INDEX_CACHE) > INDEX_CACHE_SIZE:
+        _INDEX_CACHE.popitem(last=False)
+    return index
@@ -0,0 +1,498 @@
+"""
+Mergeable summary sketches of each study and build-to-build drift reports.
+
+Checking a rebuild used to mean recomputing distinct counts and quantiles from
+the full data. Instead, every study's standardized output is summarized in one
+streaming pass (blocks of BLOCK_ROWS rows) into small sketches:
+
+- HyperLogLog: distinct (StudyID, IndivID) and (StudyID, IndivID, InfectionID)
+  counts, so merged sketches count an ID reused by two studies twice;
+- QuantileSketch (KLL-style): TimeDays, and PathogenLoad per Units;
+- CountMinSketch: frequencies of the categorical columns in FREQUENCY_COLUMNS.
+
+All three merge exactly as if built from the concatenated data, so study
+sketches combine into whole-dataset ones. The sketch of a study is written next
+to its partition (`partitions/<StudyID>.sketch.json`) and stored with every
+snapshot under the partition's hash, so comparing a build to its parent reads
+two small JSON files per study and never the data.
+
+Usage:
+    $ python3 code/ingest_studies/sketches.py drift              # latest build vs its parent
+    $ python3 code/ingest_studies/sketches.py drift <old> <new>
+"""
+
+import argparse
+import base64
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from partitions import OUTPUT_DIR, PARTITION_DIR
+
+BLOCK_ROWS = 100_000
+# Individuals and infections are only unique within a study, so keys include StudyID
+DISTINCT_KEYS = {"IndivID": ["StudyID", "IndivID"], "InfectionID": ["StudyID", "IndivID", "InfectionID"]}
+FREQUENCY_COLUMNS = ["SampleSource", "Units", "Subtype", "Targets", "PlatformType"]
+REPORT_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+DRIFT_FILE = "drift.json"
+
+# Changes flagged in drift reports
+DISTINCT_TOLERANCE = 0.05    # relative change of a distinct count
+QUANTILE_TOLERANCE = 0.25    # shift of a quantile, in units of the previous IQR
+FREQUENCY_TOLERANCE = 0.05   # change of a category's share of rows
+
+
+def _encode(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+def _decode(text, dtype):
+    return np.frombuffer(base64.b64decode(text), dtype=dtype).copy()
+
+
+def _hash_values(values):
+    """64-bit hashes of the string form of `values` (NA dropped), hashing each distinct value once."""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    hashes = pd.util.hash_array(np.asarray([str(u) for u in uniques], dtype=object))
+    return hashes[codes[codes >= 0]]
+
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantile sketch (KLL-style compactor hierarchy).
+
+    Values are buffered at level 0; when a level exceeds its capacity it is
+    sorted and every other item (random offset) is promoted to the next level,
+    where each item stands for twice as many observations. Memory stays
+    O(k log(n / k)) and two sketches merge by concatenating their levels.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            buf = self.levels[level]
+            if buf.size > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                buf = np.sort(buf)
+                keep = buf[:0]
+                if buf.size % 2:
+                    keep, buf = buf[-1:], buf[:-1]
+                promoted = buf[self._rng.integers(2)::2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                self.levels[level] = keep
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.n += int(values.size)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, buf in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], buf])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, qs):
+        """Approximate quantiles (inverted-CDF definition) for a scalar or list of qs."""
+        scalar = np.isscalar(qs)
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        if self.n == 0:
+            result = np.full(qs.shape, np.nan)
+        else:
+            values = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(buf.size, 2.0 ** i) for i, buf in enumerate(self.levels)])
+            order = np.argsort(values, kind="mergesort")
+            values, cum = values[order], np.cumsum(weights[order])
+            idx = np.searchsorted(cum, qs * cum[-1], side="left")
+            result = values[np.clip(idx, 0, values.size - 1)]
+        return float(result[0]) if scalar else result
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "levels": [_encode(buf.astype("<f8")) for buf in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        sketch = cls(data["k"], seed)
+        sketch.n = data["n"]
+        sketch.levels = [_decode(buf, "<f8") for buf in data["levels"]]
+        return sketch
+
+
+class HyperLogLog:
+    """
+    Distinct-count sketch with 2**p one-byte registers (relative error about 1.04 / sqrt(2**p)).
+
+    Each value's 64-bit hash picks a register with its top p bits; the register
+    keeps the largest rank (position of the first set bit) of the remaining
+    bits. Sketches merge by taking the register-wise maximum.
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values):
+        hashes = _hash_values(values)
+        if hashes.size == 0:
+            return self
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Bit length of the remaining bits, via the (exact) float exponent of each 32-bit half
+        high = (rest >> np.uint64(32)).astype(np.float64)
+        low = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        bits = np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+        rank = (64 - self.p) - bits + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        return self
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small cardinalities: linear counting over the empty registers
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+    def to_dict(self):
+        return {"p": self.p, "registers": _encode(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["p"])
+        sketch.registers = _decode(data["registers"], np.uint8)
+        return sketch
+
+
+class CountMinSketch:
+    """
+    Frequency sketch: `depth` rows of `width` counters, one hash per row.
+
+    A value's count is over-estimated by at most e / width of the total with
+    probability 1 - exp(-depth). The most frequent values seen are kept as
+    candidates (up to `top`) so reports know which values to look up.
+    """
+
+    def __init__(self, width=512, depth=4, top=32):
+        self.width = width
+        self.depth = depth
+        self.top = top
+        self.total = 0
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.candidates = []
+
+    def _columns(self, hashes):
+        # Independent row hashes from one 64-bit hash (double hashing)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, values):
+        values = pd.Series(values, dtype=object)
+        hashes = _hash_values(values)
+        if hashes.size == 0:
+            return self
+        for row, columns in enumerate(self._columns(hashes)):
+            self.table[row] += np.bincount(columns, minlength=self.width)
+        self.total += int(hashes.size)
+        seen = [str(v) for v in values.dropna().unique()]
+        self._prune(list(dict.fromkeys(self.candidates + seen)))
+        return self
+
+    def _prune(self, candidates):
+        estimates = self.estimate(candidates)
+        order = sorted(range(len(candidates)), key=lambda i: (-estimates[i], candidates[i]))
+        self.candidates = [candidates[i] for i in order[:self.top]]
+
+    def estimate(self, values):
+        """Estimated counts of `values` (never below the true count)."""
+        if not values:
+            return []
+        hashes = pd.util.hash_array(np.asarray([str(v) for v in values], dtype=object))
+        columns = self._columns(hashes)
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0).tolist()
+
+    def frequencies(self):
+        """{candidate value: estimated share of rows}."""
+        return {v: c / self.total for v, c in zip(self.candidates, self.estimate(self.candidates))} if self.total else {}
+
+    def merge(self, other):
+        self.table += other.table
+        self.total += other.total
+        self._prune(list(dict.fromkeys(self.candidates + other.candidates)))
+        return self
+
+    def to_dict(self):
+        return {"width": self.width, "depth": self.depth, "top": self.top, "total": self.total,
+                "table": _encode(self.table.astype("<u4")), "candidates": self.candidates}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["width"], data["depth"], data["top"])
+        sketch.total = data["total"]
+        sketch.table = _decode(data["table"], "<u4").astype(np.int64).reshape(data["depth"], data["width"])
+        sketch.candidates = list(data["candidates"])
+        return sketch
+
+
+class StudySketch:
+    """All sketches of one study (or, after merging, of several)."""
+
+    def __init__(self):
+        self.rows = 0
+        self.distinct = {name: HyperLogLog() for name in DISTINCT_KEYS}
+        self.quantiles = {}
+        self.frequencies = {col: CountMinSketch() for col in FREQUENCY_COLUMNS}
+
+    def _quantile(self, name):
+        if name not in self.quantiles:
+            # Fixed seed: rebuilding identical data gives identical sketches
+            self.quantiles[name] = QuantileSketch(seed=0)
+        return self.quantiles[name]
+
+    def update(self, block):
+        """Add one block of standardized rows."""
+        self.rows += len(block)
+        # Rows without an IndivID are not counted; a missing InfectionID is a value of its own
+        identified = block["IndivID"].notna().to_numpy()
+        for name, cols in DISTINCT_KEYS.items():
+            keys = block[cols[0]].astype(object).fillna("<NA>").astype(str)
+            for col in cols[1:]:
+                keys = keys + "|" + block[col].astype(object).fillna("<NA>").astype(str)
+            self.distinct[name].update(keys[identified])
+        self._quantile("TimeDays").update(pd.to_numeric(block["TimeDays"], errors="coerce"))
+        load = pd.to_numeric(block["PathogenLoad"], errors="coerce")
+        units = block["Units"].astype(object)
+        for unit in units[load.notna()].dropna().unique():
+            self._quantile(f"PathogenLoad[{unit}]").update(load[(units == unit).to_numpy()])
+        for col in FREQUENCY_COLUMNS:
+            self.frequencies[col].update(block[col])
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        for name, sketch in other.distinct.items():
+            self.distinct[name].merge(sketch)
+        for name, sketch in other.quantiles.items():
+            self._quantile(name).merge(sketch)
+        for col, sketch in other.frequencies.items():
+            self.frequencies[col].merge(sketch)
+        return self
+
+    def summary(self, quantiles=REPORT_QUANTILES):
+        """Plain numbers read off the sketches."""
+        return {
+            "rows": self.rows,
+            "distinct": {name: round(s.count()) for name, s in self.distinct.items()},
+            "quantiles": {name: dict(zip(map(str, quantiles), s.quantile(quantiles).tolist()))
+                          for name, s in sorted(self.quantiles.items())},
+            "frequencies": {col: s.frequencies() for col, s in self.frequencies.items()},
+        }
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "distinct": {name: s.to_dict() for name, s in self.distinct.items()},
+            "quantiles": {name: s.to_dict() for name, s in self.quantiles.items()},
+            "frequencies": {col: s.to_dict() for col, s in self.frequencies.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.rows = data["rows"]
+        sketch.distinct = {name: HyperLogLog.from_dict(d) for name, d in data["distinct"].items()}
+        sketch.quantiles = {name: QuantileSketch.from_dict(d, seed=0) for name, d in data["quantiles"].items()}
+        sketch.frequencies = {col: CountMinSketch.from_dict(d) for col, d in data["frequencies"].items()}
+        return sketch
+
+
+def sketch_study(df, block_rows=BLOCK_ROWS):
+    """Sketch a study's standardized output in one pass over blocks of rows."""
+    sketch = StudySketch()
+    for start in range(0, len(df), block_rows):
+        sketch.update(df.iloc[start:start + block_rows])
+    return sketch
+
+
+def partition_sketch_path(study_id, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, PARTITION_DIR, f"{study_id}.sketch.json")
+
+
+def save_sketch(sketch, path):
+    with open(path + ".tmp", "w") as fh:
+        json.dump(sketch.to_dict(), fh)
+    os.replace(path + ".tmp", path)
+
+
+def load_sketch(path):
+    with open(path) as fh:
+        return StudySketch.from_dict(json.load(fh))
+
+
+def write_partition_sketch(study_id, df, output_dir=OUTPUT_DIR):
+    """Write one study's sketches next to its partition."""
+    path = partition_sketch_path(study_id, output_dir)
+    save_sketch(sketch_study(df), path)
+    return path
+
+
+def _relative(old, new):
+    return (new - old) / old if old else (0.0 if new == old else np.inf)
+
+
+def compare_sketches(old, new):
+    """
+    Drift between two StudySketch objects.
+
+    Returns:
+        dict: the changes of rows and distinct counts (relative), quantile shifts
+        (absolute, and in units of the old IQR) and category share changes, plus
+        a list of `flags` for the changes beyond the module tolerances.
+    """
+    old_summary, new_summary = old.summary(), new.summary()
+    report = {"rows": [old.rows, new.rows], "distinct": {}, "quantiles": {}, "frequencies": {}, "flags": []}
+    for name in DISTINCT_KEYS:
+        a, b = old_summary["distinct"][name], new_summary["distinct"][name]
+        change = _relative(a, b)
+        report["distinct"][name] = {"old": a, "new": b, "change": change}
+        if abs(change) > DISTINCT_TOLERANCE:
+            report["flags"].append(f"distinct {name}: {a} -> {b}")
+    for name in sorted(set(old_summary["quantiles"]) | set(new_summary["quantiles"])):
+        if name not in old_summary["quantiles"] or name not in new_summary["quantiles"]:
+            report["flags"].append(f"{name}: {'added' if name in new_summary['quantiles'] else 'removed'}")
+            continue
+        a, b = old_summary["quantiles"][name], new_summary["quantiles"][name]
+        iqr = (a["0.75"] - a["0.25"]) or 1.0
+        shifts = {q: b[q] - a[q] for q in a}
+        report["quantiles"][name] = {"old": a, "new": b, "shift": shifts}
+        worst = max(shifts, key=lambda q: abs(shifts[q]))
+        if abs(shifts[worst]) / iqr > QUANTILE_TOLERANCE:
+            report["flags"].append(f"{name} q{worst}: {a[worst]:.4g} -> {b[worst]:.4g}")
+    for col in FREQUENCY_COLUMNS:
+        a_sketch, b_sketch = old.frequencies[col], new.frequencies[col]
+        values = list(dict.fromkeys(a_sketch.candidates + b_sketch.candidates))
+        a = dict(zip(values, (c / a_sketch.total if a_sketch.total else 0.0 for c in a_sketch.estimate(values))))
+        b = dict(zip(values, (c / b_sketch.total if b_sketch.total else 0.0 for c in b_sketch.estimate(values))))
+        changes = {v: b[v] - a[v] for v in values if abs(b[v] - a[v]) > 1e-12}
+        report["frequencies"][col] = changes
+        for value, change in changes.items():
+            if abs(change) > FREQUENCY_TOLERANCE:
+                report["flags"].append(f"{col}={value}: share {a[value]:.1%} -> {b[value]:.1%}")
+    return report
+
+
+def drift_report(old_sketches, new_sketches):
+    """
+    Per-study drift between two builds, given {StudyID: StudySketch} for each.
+
+    Studies only in one build are listed as added/removed; the "*" entry compares
+    the merged sketches of all studies.
+    """
+    report = {
+        "added": sorted(set(new_sketches) - set(old_sketches)),
+        "removed": sorted(set(old_sketches) - set(new_sketches)),
+        "studies": {},
+    }
+    for study_id in sorted(set(old_sketches) & set(new_sketches)):
+        report["studies"][study_id] = compare_sketches(old_sketches[study_id], new_sketches[study_id])
+    if old_sketches and new_sketches:
+        merged_old, merged_new = StudySketch(), StudySketch()
+        for sketch in old_sketches.values():
+            merged_old.merge(sketch)
+        for sketch in new_sketches.values():
+            merged_new.merge(sketch)
+        report["studies"]["*"] = compare_sketches(merged_old, merged_new)
+    return report
+
+
+def version_sketches(version_id, output_dir=OUTPUT_DIR):
+    """{StudyID: StudySketch} of a snapshot version (studies stored without sketches are skipped)."""
+    from snapshots import read_version, sketch_object_path
+
+    sketches = {}
+    for study_id, chunk in read_version(version_id, output_dir)["chunks"].items():
+        path = sketch_object_path(chunk["sha256"], output_dir)
+        if os.path.exists(path):
+            sketches[study_id] = load_sketch(path)
+    return sketches
+
+
+def write_drift_report(version_id, output_dir=OUTPUT_DIR):
+    """
+    Compare a snapshot version with its parent and write output/drift.json.
+
+    Returns the report, or None if the version has no parent.
+    """
+    from snapshots import read_version
+
+    record = read_version(version_id, output_dir)
+    if not record.get("parent"):
+        return None
+    report = drift_report(version_sketches(record["parent"], output_dir), version_sketches(version_id, output_dir))
+    report.update(old=record["parent"], new=version_id)
+    path = os.path.join(output_dir, DRIFT_FILE)
+    with open(path + ".tmp", "w") as fh:
+        json.dump(report, fh, indent=2, default=float)
+    os.replace(path + ".tmp", path)
+    return report
+
+
+def print_report(report):
+    for study_id in report["added"]:
+        print(f"+ {study_id}")
+    for study_id in report["removed"]:
+        print(f"- {study_id}")
+    for study_id, result in report["studies"].items():
+        rows = result["rows"]
+        print(f"{study_id}: {rows[0]} -> {rows[1]} rows, {len(result['flags'])} flagged")
+        for flag in result["flags"]:
+            print(f"    {flag}")
+
+
+def main(argv=None):
+    from snapshots import latest_version, read_version
+
+    parser = argparse.ArgumentParser(description="Report distribution drift between builds from their sketches.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    drift = sub.add_parser("drift", help="Compare two versions (default: the latest and its parent).")
+    drift.add_argument("old", nargs="?")
+    drift.add_argument("new", nargs="?")
+    args = parser.parse_args(argv)
+
+    new = args.new or latest_version()
+    old = args.old or (read_version(new)["parent"] if new else None)
+    if not old or not new:
+        parser.error("Need two recorded versions to compare.")
+    print_report(drift_report(version_sketches(old), version_sketches(new)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Content-addressed, versioned snapshots of the combined dataset.
+
+Every build is recorded as a version: a small JSON file listing, for each study
+partition, the SHA-256 of its bytes. The partition itself is stored once under
+`output/snapshots/objects/` keyed by that hash (gzip-compressed), so partitions
+that did not change between builds are shared by every version that contains
+them and keeping many versions costs about as much as the changes.
+
+The version ID is itself the hash of its (StudyID, chunk hash) pairs, so two
+identical builds resolve to the same version.
+
+Diffs compare chunk hashes first; only partitions whose hash changed are loaded
+and compared row by row.
+
+Usage:
+    $ python3 code/ingest_studies/snapshots.py list
+    $ python3 code/ingest_studies/snapshots.py diff <old_version> <new_version>
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+import pandas as pd
+
+from partitions import OUTPUT_DIR, load_manifest
+from sketches import partition_sketch_path
+
+SNAPSHOT_DIR = "snapshots"
+
+
+def _snapshot_root(output_dir):
+    return os.path.join(output_dir, SNAPSHOT_DIR)
+
+
+def _object_path(digest, output_dir):
+    return os.path.join(_snapshot_root(output_dir), "objects", digest[:2], f"{digest}.csv.gz")
+
+
+def sketch_object_path(digest, output_dir=OUTPUT_DIR):
+    """Stored sketches (see sketches.py) of the partition with hash `digest`."""
+    return os.path.join(_snapshot_root(output_dir), "objects", digest[:2], f"{digest}.sketch.json")
+
+
+def _version_path(version_id, output_dir):
+    return os.path.join(_snapshot_root(output_dir), "versions", f"{version_id}.json")
+
+
+def _store_object(src_path, digest, output_dir):
+    """Store a partition file under its hash unless an identical chunk already exists."""
+    path = _object_path(digest, output_dir)
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(src_path, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp_path, path)
+    return True
+
+
+def create_snapshot(manifest=None, output_dir=OUTPUT_DIR, message=None):
+    """
+    Record the currently published partitions as a version.
+
+    Returns the version ID. Only partitions whose content is not yet in the
+    object store are copied. Each partition's sketches, if present, are stored
+    next to it so later builds can be checked for drift without the data.
+    """
+    if manifest is None:
+        manifest = load_manifest(output_dir)
+    chunks = {}
+    for study_id, entry in sorted(manifest["partitions"].items()):
+        _store_object(os.path.join(output_dir, entry["file"]), entry["sha256"], output_dir)
+        sketch_path = partition_sketch_path(study_id, output_dir)
+        if os.path.exists(sketch_path) and not os.path.exists(sketch_object_path(entry["sha256"], output_dir)):
+            shutil.copyfile(sketch_path, sketch_object_path(entry["sha256"], output_dir))
+        chunks[study_id] = {"sha256": entry["sha256"], "rows": entry["rows"]}
+
+    version_id = hashlib.sha256(
+        json.dumps({k: v["sha256"] for k, v in chunks.items()}, sort_keys=True).encode()
+    ).hexdigest()[:16]
+    path = _version_path(version_id, output_dir)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = {
+            "version": version_id,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "parent": latest_version(output_dir),
+            "message": message,
+            "chunks": chunks,
+        }
+        with open(path + ".tmp", "w") as fh:
+            json.dump(record, fh, indent=2, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    latest = os.path.join(_snapshot_root(output_dir), "LATEST")
+    with open(latest + ".tmp", "w") as fh:
+        fh.write(version_id)
+    os.replace(latest + ".tmp", latest)
+    return version_id
+
+
+def latest_version(output_dir=OUTPUT_DIR):
+    """ID of the most recently recorded version, or None."""
+    path = os.path.join(_snapshot_root(output_dir), "LATEST")
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return fh.read().strip() or None
+
+
+def read_version(version_id, output_dir=OUTPUT_DIR):
+    """Version record for `version_id` (a unique prefix is accepted)."""
+    version_dir = os.path.join(_snapshot_root(output_dir), "versions")
+    matches = [f[:-5] for f in os.listdir(version_dir) if f.startswith(version_id)]
+    if len(matches) != 1:
+        raise KeyError(f"Version '{version_id}' matches {len(matches)} snapshots.")
+    with open(_version_path(matches[0], output_dir)) as fh:
+        return json.load(fh)
+
+
+def list_versions(output_dir=OUTPUT_DIR):
+    """All version records, oldest first."""
+    version_dir = os.path.join(_snapshot_root(output_dir), "versions")
+    if not os.path.isdir(version_dir):
+        return []
+    records = []
+    for f in os.listdir(version_dir):
+        if f.endswith(".json"):
+            with open(os.path.join(version_dir, f)) as fh:
+                records.append(json.load(fh))
+    return sorted(records, key=lambda r: r["created"])
+
+
+def load_chunk(digest, output_dir=OUTPUT_DIR):
+    """One stored partition as a DataFrame."""
+    return pd.read_csv(_object_path(digest, output_dir), na_values=["<NA>"], low_memory=False)
+
+
+def load_version(version_id, studies=None, output_dir=OUTPUT_DIR):
+    """Rebuild the combined DataFrame of a version (optionally only some studies)."""
+    record = read_version(version_id, output_dir)
+    frames = [
+        load_chunk(chunk["sha256"], output_dir)
+        for study_id, chunk in sorted(record["chunks"].items())
+        if studies is None or study_id in studies
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _row_diff(old, new):
+    """Rows present in only one of two frames, compared as multisets of whole rows."""
+    old_hash = pd.util.hash_pandas_object(old, index=False)
+    new_hash = pd.util.hash_pandas_object(new, index=False)
+    old_counts = old_hash.value_counts()
+    new_counts = new_hash.value_counts()
+    delta = new_counts.sub(old_counts, fill_value=0)
+    added_hashes = delta[delta > 0]
+    removed_hashes = -delta[delta < 0]
+
+    def pick(df, hashes, counts):
+        # Keep as many copies of each differing row as the count difference
+        rank = df.groupby(hashes.to_numpy()).cumcount().to_numpy()
+        limit = hashes.map(counts).fillna(0).to_numpy()
+        return df[rank < limit]
+
+    return pick(new, new_hash, added_hashes), pick(old, old_hash, removed_hashes)
+
+
+def diff_versions(old_id, new_id, rows=True, output_dir=OUTPUT_DIR):
+    """
+    Compare two versions.
+
+    Partitions are compared by chunk hash first; with `rows=True`, partitions
+    whose hash changed are loaded and compared row by row.
+
+    Returns:
+        dict: {"added": [...], "removed": [...], "unchanged": [...],
+               "changed": {StudyID: {"rows_added": DataFrame, "rows_removed": DataFrame}}}
+    """
+    old = read_version(old_id, output_dir)["chunks"]
+    new = read_version(new_id, output_dir)["chunks"]
+    result = {
+        "added": sorted(set(new) - set(old)),
+        "removed": sorted(set(old) - set(new)),
+        "unchanged": sorted(s for s in set(old) & set(new) if old[s]["sha256"] == new[s]["sha256"]),
+        "changed": {},
+    }
+    for study_id in sorted(s for s in set(old) & set(new) if old[s]["sha256"] != new[s]["sha256"]):
+        if not rows:
+            result["changed"][study_id] = None
+            continue
+        added, removed = _row_diff(
+            load_chunk(old[study_id]["sha256"], output_dir),
+            load_chunk(new[study_id]["sha256"], output_dir),
+        )
+        result["changed"][study_id] = {"rows_added": added, "rows_removed": removed}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect combined-dataset snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List recorded versions.")
+    diff = sub.add_parser("diff", help="Compare two versions.")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    diff.add_argument("--hash-only", action="store_true", help="Skip the row-level comparison.")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for record in list_versions():
+            rows = sum(c["rows"] for c in record["chunks"].values())
+            print(f"{record['version']}  {record['created']}  {len(record['chunks'])} studies  {rows} rows")
+        return
+
+    result = diff_versions(args.old, args.new, rows=not args.hash_only)
+    for study_id in result["added"]:
+        print(f"+ {study_id}")
+    for study_id in result["removed"]:
+        print(f"- {study_id}")
+    for study_id, change in result["changed"].items():
+        if change is None:
+            print(f"~ {study_id}")
+        else:
+            print(f"~ {study_id}: +{len(change['rows_added'])} / -{len(change['rows_removed'])} rows")
+    print(f"{len(result['unchanged'])} studies unchanged")
+
+
+if __name__ == "__main__":
+    main()
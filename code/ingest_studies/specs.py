@@ -0,0 +1,93 @@
+"""
+Declarative study specs and the engine that loads them.
+
+Most studies are a single CSV whose columns only need renaming to the standard
+schema, a few value mappings and some constant metadata. Such a study is
+described by a SPEC dict in its module and loaded with `load_spec(SPEC)`;
+studies that need real code (e.g. savela2022's workbooks) keep a Python loader.
+
+The engine reads only the columns the spec uses (`usecols`) with the spec's
+dtypes, applies every mapping to the distinct values of a column and
+broadcasts the result through the column's codes, adds constant metadata as
+one-category categoricals (no per-row strings), maps the sample and assay
+metadata onto the controlled vocabulary (vocabulary.py), and runs the schema
+step once.
+
+Spec keys (all optional except "file"):
+
+    file:        CSV path, relative to the repository root.
+    dtype:       {raw column: dtype} passed to the reader.
+    columns:     {raw column: schema column} renames; only these columns (and
+                 the sources of "derived"/"age_range") are read.
+    strip:       {raw column: regex} removed from the column's values.
+    value_maps:  {raw column: {old value: new value}}; unmapped values are kept.
+    derived:     {schema column: (raw column, {value: new value})}; unmapped
+                 values become NA.
+    age_range:   raw column holding ranges like "[30, 39)" or "30-39", split
+                 into AgeRng1/AgeRng2.
+    melt:        {"value_columns": ..., "id_columns": ...} passed to
+                 schema.melt_values() for wide files with one column per assay.
+    copy:        {schema column: schema column} duplicated after renaming.
+    constants:   {schema column: value} for every row.
+
+Example:
+    SPEC = {
+        "file": "data/wagstaffe2024.csv",
+        "columns": {"PersonID": "IndivID", "DaysPostInoculation": "TimeDays", ...},
+        "value_maps": {"site": {"nose": "nasal"}},
+        "constants": {"StudyID": "wagstaffe2024", "Units": "GE/ml"},
+    }
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+from schema import enforce_schema, coerce_types, melt_values, split_age_range, category_codes, broadcast, map_uniques
+from vocabulary import normalize_frame
+
+
+def constant(value, n):
+    """A length-n constant column, as a one-category categorical for strings."""
+    if isinstance(value, str):
+        return pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=[value])
+    return np.full(n, value)
+
+
+def load_spec(spec):
+    """Load a study described by a spec dict and return it in the standard schema."""
+    columns = spec.get("columns", {})
+    derived = spec.get("derived", {})
+    age_range = spec.get("age_range")
+    usecols = list(dict.fromkeys(
+        list(columns) + [src for src, _ in derived.values()] + ([age_range] if age_range else [])
+    ))
+    raw = pd.read_csv(spec["file"], usecols=usecols, dtype=spec.get("dtype"))
+
+    df = {}
+    for col, pattern in spec.get("strip", {}).items():
+        raw[col] = map_uniques(raw[col], lambda v: re.sub(pattern, "", v) if isinstance(v, str) else v)
+    for col, mapping in spec.get("value_maps", {}).items():
+        raw[col] = map_uniques(raw[col], lambda v: mapping.get(v, v))
+    for out, (src, mapping) in derived.items():
+        df[out] = map_uniques(raw[src], lambda v: mapping.get(v, pd.NA))
+    if age_range:
+        codes, uniques = category_codes(raw[age_range])
+        bounds = split_age_range(pd.DataFrame({"range": pd.Series(uniques, dtype=object)}), col="range")
+        df["AgeRng1"] = broadcast(codes, bounds["AgeRng1"])
+        df["AgeRng2"] = broadcast(codes, bounds["AgeRng2"])
+    for src, out in columns.items():
+        df[out] = raw[src].values
+
+    df = pd.DataFrame(df)
+    if "melt" in spec:
+        df = melt_values(df, **spec["melt"])
+    for out, src in spec.get("copy", {}).items():
+        df[out] = df[src]
+    for col, value in spec.get("constants", {}).items():
+        df[col] = constant(value, len(df))
+    df = normalize_frame(df)
+
+    df = enforce_schema(df)
+    df = coerce_types(df)
+    return df
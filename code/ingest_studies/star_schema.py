@@ -0,0 +1,164 @@
+"""
+Normalized (star-schema) output of the combined dataset.
+
+The flat output repeats study-constant strings (DOI, Pathogen, platform, units,
+GE/mL coefficients) and the composite (StudyID, IndivID, InfectionID) identity
+in every row. `to_star()` splits it into:
+
+- study:       StudyID, DOI, Pathogen, IndSpecies
+- individual:  study_key, IndivID, AgeRng1, AgeRng2, Comorbidity1-4
+- infection:   individual_key, InfectionID, Subtype, Symptoms1-4, Treatment1-4, Hospitalized
+- assay:       SampleSource, SampleMethod, PlatformType, PlatformTech, Targets,
+               Units, GEml_conversion_intercept, GEml_conversion_slope
+- fact:        infection_key, assay_key (int32), SampleID, TimeDays, PathogenLoad
+
+Each dimension holds the distinct combinations of its columns, and its surrogate
+key is the row number, so joining a dimension back is a positional take on an
+integer array. The round trip is lossless: `StarDataset.to_flat()` returns the
+original rows in the original order.
+
+Usage:
+    $ python3 code/ingest_studies/star_schema.py     # writes output/star/
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+from schema import STANDARD_SCHEMA, STRING_COLUMNS
+from partitions import OUTPUT_DIR, COMBINED_FILE
+
+STAR_DIR = "star"
+
+# dimension -> (parent key column or None, own columns)
+DIMENSIONS = {
+    "study": (None, ["StudyID", "DOI", "Pathogen", "IndSpecies"]),
+    "individual": ("study_key", ["IndivID", "AgeRng1", "AgeRng2",
+                                 "Comorbidity1", "Comorbidity2", "Comorbidity3", "Comorbidity4"]),
+    "infection": ("individual_key", ["InfectionID", "Subtype",
+                                     "Symptoms1", "Symptoms2", "Symptoms3", "Symptoms4",
+                                     "Treatment1", "Treatment2", "Treatment3", "Treatment4", "Hospitalized"]),
+    "assay": (None, ["SampleSource", "SampleMethod", "PlatformType", "PlatformTech", "Targets",
+                     "Units", "GEml_conversion_intercept", "GEml_conversion_slope"]),
+}
+FACT_COLUMNS = ["infection_key", "assay_key", "SampleID", "TimeDays", "PathogenLoad"]
+
+
+def _intern(frame):
+    """int32 surrogate keys for the distinct rows of `frame`, plus the dimension table."""
+    codes = frame.groupby(list(frame.columns), dropna=False, sort=False, observed=True).ngroup().to_numpy(dtype=np.int32)
+    first = np.unique(codes, return_index=True)[1]
+    dim = frame.iloc[first].reset_index(drop=True)
+    return codes, dim
+
+
+def to_star(df):
+    """Split a STANDARD_SCHEMA frame into dimension tables and an integer-keyed fact table."""
+    tables = {}
+    keys = {}
+    for name, (parent, columns) in DIMENSIONS.items():
+        frame = df[columns].reset_index(drop=True)
+        if parent is not None:
+            frame.insert(0, parent, keys[parent])
+        codes, dim = _intern(frame)
+        keys[f"{name}_key"] = codes
+        dim.insert(0, f"{name}_key", np.arange(len(dim), dtype=np.int32))
+        tables[name] = dim
+
+    fact = pd.DataFrame({
+        "infection_key": keys["infection_key"],
+        "assay_key": keys["assay_key"],
+        "SampleID": df["SampleID"].to_numpy(),
+        "TimeDays": df["TimeDays"].to_numpy(),
+        "PathogenLoad": df["PathogenLoad"].to_numpy(),
+    })
+    tables["fact"] = fact
+    return tables
+
+
+def write_star(df, output_dir=OUTPUT_DIR, star_dir=STAR_DIR):
+    """Write the star tables as CSV files under output/star/ (replacing each atomically)."""
+    path = os.path.join(output_dir, star_dir)
+    os.makedirs(path, exist_ok=True)
+    for name, table in to_star(df).items():
+        target = os.path.join(path, f"{name}.csv")
+        table.to_csv(target + ".tmp", index=False)
+        os.replace(target + ".tmp", target)
+    return path
+
+
+class StarDataset:
+    """
+    Lazy reader for the star tables.
+
+    Only the fact table is read up front; dimensions are read the first time a
+    column from them is requested, and joined by positional take on the int32 keys.
+
+    Example:
+        star = StarDataset()
+        df = star.columns(["StudyID", "IndivID", "TimeDays", "PathogenLoad", "Units"])
+    """
+
+    def __init__(self, output_dir=OUTPUT_DIR, star_dir=STAR_DIR):
+        self.path = os.path.join(output_dir, star_dir)
+        self.fact = pd.read_csv(
+            os.path.join(self.path, "fact.csv"),
+            dtype={"infection_key": np.int32, "assay_key": np.int32, "SampleID": str},
+            na_values=["<NA>"], low_memory=False,
+        )
+        self._dims = {}
+
+    def dimension(self, name):
+        if name not in self._dims:
+            parent, columns = DIMENSIONS[name]
+            dtype = {c: str for c in columns if c in STRING_COLUMNS}
+            dtype[f"{name}_key"] = np.int32
+            if parent is not None:
+                dtype[parent] = np.int32
+            self._dims[name] = pd.read_csv(
+                os.path.join(self.path, f"{name}.csv"), dtype=dtype, na_values=["<NA>"], low_memory=False
+            )
+        return self._dims[name]
+
+    def _keys(self, name):
+        """Per-fact-row keys into dimension `name`, following the key chain."""
+        if name == "assay":
+            return self.fact["assay_key"].to_numpy()
+        infection = self.fact["infection_key"].to_numpy()
+        if name == "infection":
+            return infection
+        individual = self.dimension("infection")["individual_key"].to_numpy()[infection]
+        if name == "individual":
+            return individual
+        return self.dimension("individual")["study_key"].to_numpy()[individual]
+
+    def columns(self, columns):
+        """The requested STANDARD_SCHEMA columns, joining only the dimensions they need."""
+        out = {}
+        for col in columns:
+            if col in self.fact.columns:
+                out[col] = self.fact[col].to_numpy()
+                continue
+            owner = next((n for n, (_, cols) in DIMENSIONS.items() if col in cols), None)
+            if owner is None:
+                raise KeyError(f"Unknown column '{col}'.")
+            out[col] = self.dimension(owner)[col].to_numpy()[self._keys(owner)]
+        return pd.DataFrame(out)
+
+    def to_flat(self):
+        """The full flat STANDARD_SCHEMA frame."""
+        return self.columns(STANDARD_SCHEMA)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the combined dataset as star-schema tables.")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    args = parser.parse_args(argv)
+    df = pd.read_csv(os.path.join(args.output_dir, COMBINED_FILE), na_values=["<NA>"],
+                     dtype={c: str for c in STRING_COLUMNS}, low_memory=False)
+    print(f"Wrote star tables to {write_star(df, args.output_dir)}")
+
+
+if __name__ == "__main__":
+    main()
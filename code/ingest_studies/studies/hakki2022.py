@@ -27,10 +27,10 @@ Notes:
 ------
 - Viral load (`copy`) and infectious titre (`pfu`) were reported in units per mL.
 - `Log10VL` is computed from these raw values (non-positive values → NaN).
-- Default assumptions: SampleType = "combined_nose_throat_swab", Platform = "RT-qPCR"
+- Default assumptions: SampleSource = "combined_nose_throat_swab", PlatformType = "RT-qPCR"
   (update if further methodological details confirm otherwise).
-  - Sampling involved combined nose-and-throat (URT) swabs, treated as "combined_nose_throat_swab"
-  for schema consistency across datasets.
+  - Sampling involved combined nose-and-throat (URT) swabs, which the controlled
+  vocabulary maps to "nasal_oropharyngeal" for schema consistency across datasets.
 """
 
 import math
@@ -42,6 +42,7 @@ PARENT_DIR = os.path.abspath(os.path.join(THIS_DIR, ".."))  # .../ingest_studies
 if PARENT_DIR not in sys.path:
     sys.path.insert(0, PARENT_DIR)
 from schema import enforce_schema, coerce_types  # split_age_range if needed
+from vocabulary import normalize_frame
 
 def _safe_log10(x):
     """Return log10(x) for positive x, else NaN."""
@@ -113,17 +114,19 @@ def load_and_format():
     # 6) Fill study-level metadata lab schema expects
     df["StudyID"] = "hakki2022"
     df["DOI"] = "10.1016/S2213-2600(22)00226-0"
-    # SampleType/Platform - set conservative defaults; refine from Methods later if needed
-    if "SampleType" not in df.columns:
-        df["SampleType"] = "combined_nose_throat_swab"
-    if "Platform" not in df.columns:
-        df["Platform"] = "RT-qPCR"           # TODO: refine targets if I extract them later
+    # SampleSource/PlatformType - set conservative defaults; refine from Methods later if needed
+    if "SampleSource" not in df.columns:
+        df["SampleSource"] = "combined_nose_throat_swab"
+        df["SampleMethod"] = "swab"
+    if "PlatformType" not in df.columns:
+        df["PlatformType"] = "RT-qPCR"           # TODO: refine targets if I extract them later
 
     # Optional: normalize booleans
     if "LFD_Positive" in df.columns:
         df["LFD_Positive"] = df["LFD_Positive"].map({1: True, 0: False, "1": True, "0": False}).fillna(df["LFD_Positive"])
 
-    # 7) Enforce schema and types
+    # 7) Map sample/assay metadata to the controlled vocabulary, enforce schema and types
+    df = normalize_frame(df)
     df = enforce_schema(df)
     df = coerce_types(df)
 
@@ -1,37 +1,32 @@
-import pandas as pd
-from schema import enforce_schema, coerce_types
+from specs import load_spec
 
-def load_and_format():
-    # Import the raw data:
-    df = pd.read_csv("data/kissler2023.csv")
-
-    # Keep only the columns we need: 
-    df = df[['PersonID', 'InfectionEvent', 'TestDateIndex', 'CtT1', 'AgeGrp', 'LineageBroad']]
-
-    # Format the age group column into separate age ranges: 
-    df[["AgeRng1", "AgeRng2"]] = df["AgeGrp"].str.extract(r"[\[\(](\d+),\s*(\d+)[\)\]]")
-
-    # Convert to numeric
-    df["AgeRng1"] = pd.to_numeric(df["AgeRng1"], errors="coerce")
-    df["AgeRng2"] = pd.to_numeric(df["AgeRng2"], errors="coerce")
-
-    # Rename columns to match schema: 
-    df = df.rename(columns={
+SPEC = {
+    "file": "data/kissler2023.csv",
+    "dtype": {"AgeGrp": "category", "LineageBroad": "category"},
+    # Keep only the columns we need, renamed to match schema:
+    "columns": {
+        "PersonID": "IndivID",
         "InfectionEvent": "InfectionID",
         "TestDateIndex": "TimeDays",
-        "CtT1": "Log10VL",
-        "LineageBroad": "Subtype"
-        })
-
-    # Add additional columns with known but missing information:
-    df["StudyID"] = "kissler2023"
-    df["DOI"] = "10.1038/s41467-023-41941-z"
-    df["Units"] = "Ct"
-    df["Platform"] = "cobas_target1"
-    df["GEml_conversion_intercept"] = 11.34089
-    df["GEml_conversion_slope"] = -0.2770306
-    df["SampleType"] = "nasal_oropharyngeal"
+        "CtT1": "PathogenLoad",
+        "LineageBroad": "Subtype",
+    },
+    # Format the age group column ("[0,30)") into separate age ranges:
+    "age_range": "AgeGrp",
+    # Known but missing information:
+    "constants": {
+        "StudyID": "kissler2023",
+        "Pathogen": "SARS-CoV-2",
+        "IndSpecies": "Human",
+        "DOI": "10.1038/s41467-023-41941-z",
+        "Units": "Ct",
+        "PlatformType": "cobas",
+        "Targets": "target1",
+        "GEml_conversion_intercept": 11.34089,
+        "GEml_conversion_slope": -0.2770306,
+        "SampleSource": "nasal_oropharyngeal",
+    },
+}
 
-    df = enforce_schema(df)
-    df = coerce_types(df)
-    return df
\ No newline at end of file
+def load_and_format():
+    return load_spec(SPEC)
@@ -39,8 +39,8 @@ Notes:
 ------
 - Sample types include paired saliva and anterior nares (AN) swabs; no 
   nasopharyngeal samples were collected.
-- Viral load values (`Viral Load N1`/`N2`) reported as copies per mL.
-- `Log10VL` computed as log10 of the mean viral load across N1 and N2 targets.
+- Viral load values (`Viral Load N1`/`N2`) reported as copies per mL and kept
+  as `PathogenLoad` (one row per target); non-positive values are non-detects.
 - Self-collected samples; household study conducted during the early 2022 
   Omicron transmission period.
 - Data aggregated across multiple figure-level files into a unified schema via 
@@ -56,22 +56,13 @@ PARENT_DIR = os.path.abspath(os.path.join(THIS_DIR, ".."))  # .../ingest_studies
 if PARENT_DIR not in sys.path:
     sys.path.insert(0, PARENT_DIR)
 
-from schema import enforce_schema, coerce_types
+from schema import enforce_schema, coerce_types, melt_values
+from workbook import read_workbooks
+from vocabulary import normalize, normalize_frame
 
-def _sample_fields_from_text(txt: str):
-    """
-    Map raw 'Sample Type' text into (SampleSource, SampleMethod).
-    Expected sample_type_str contains something like 'saliva' or 'nasal swab'.
-    """
-    if not isinstance(txt, str):
-        return (pd.NA, pd.NA)
-    t = txt.strip().lower()
-    if "saliva" in t:
-        return ("saliva", "saliva collection")
-    # Savela uses anterior nares (nasal) swabs
-    if "nasal" in t or "nares" in t or "anterior" in t or "swab" in t:
-        return ("anterior nares", "swab")
-    return (pd.NA, pd.NA)
+# Savela's 'Sample Type' text is either saliva or an anterior nares (nasal) swab
+SAMPLE_SOURCE_RULES = [("saliva", r".*saliva.*"), ("anterior nares", r".*(nasal|nares|anterior|swab).*")]
+SAMPLE_METHOD_RULES = [("saliva collection", r".*saliva.*"), ("swab", r".*(nasal|nares|anterior|swab).*")]
 
 def _safe_log10(x):
     """Return log10(x) for positive x, else NaN."""
@@ -100,81 +91,67 @@ def load_savela2022_infection(data_dir: str) -> pd.DataFrame:
         "E": (30, 39), # No raw data for Fig 2E in CaltechDATA repository
         "F": (6, 11), # No raw data for Fig 2F in CaltechDATA repository
         "G": (50, 59),
-    }    
+    }
+    # Read the independent figure workbooks concurrently, keeping only the needed columns
+    raw_cols = [
+        "Participant", "Days Post-Enrollment", "Sample Type",
+        "Viral Load N1 (copies/mL)", "Viral Load N2 (copies/mL)",
+    ]
+    raw_books = read_workbooks(
+        {os.path.join(data_dir, f): None for f in infection_files}, usecols=raw_cols
+    )
+
     for f in infection_files:
-        raw = pd.read_excel(os.path.join(data_dir, f))
+        raw = raw_books[os.path.join(data_dir, f)]
 
         # Clean and standardize
         df = raw.rename(columns={
-            "Participant": "PersonID",
+            "Participant": "IndivID",
             "Days Post-Enrollment": "TimeDays",
             "Viral Load N1 (copies/mL)": "Target1",
             "Viral Load N2 (copies/mL)": "Target2",
         })
 
         # Parse Sample Type
-        ss = df.get("Sample Type")
-        sample_pairs = ss.apply(_sample_fields_from_text) if ss is not None else [(pd.NA, pd.NA)] * len(df)
-        df["SampleSource"] = [p[0] for p in sample_pairs]
-        df["SampleMethod"] = [p[1] for p in sample_pairs]
-
-        # Metadata
-        df["StudyID"] = "savela2022"
-        df["Pathogen"] = "SARS-CoV-2"
-        df["PtSpecies"] = "Human"
-        df["Units"] = "copies/mL"
-        df["PlatformName"] = "RT-qPCR"
-        df["PlatformTech"] = "Bio-Rad CFX96"
-        df["DOI"] = "10.1128/JCM.01785-21"
+        ss = df.get("Sample Type", pd.Series(pd.NA, index=df.index))
+        df["SampleSource"] = normalize(ss, "SampleSource", SAMPLE_SOURCE_RULES, default=pd.NA)
+        df["SampleMethod"] = normalize(ss, "SampleMethod", SAMPLE_METHOD_RULES, default=pd.NA)
 
         # Set age ranges based on figure letter
         fig_letter = f.split("fig2")[1][0].upper()
         df["AgeRng1"], df["AgeRng2"] = age_map.get(fig_letter, (pd.NA, pd.NA))
 
-        # Ensure numeric targets
+        # Ensure numeric targets; non-positive loads are non-detects
         for col in ["Target1", "Target2"]:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-
-        # N1 rows
-        df_n1 = df.copy(deep=True)
-        df_n1["Targets"] = "N1"
-        df_n1["Log10VL"] = df_n1["Target1"].apply(
-            lambda x: math.log10(x) if pd.notna(x) and x > 0 else np.nan
-        )
-
-        # N2 rows
-        df_n2 = df.copy(deep=True)
-        df_n2["Targets"] = "N2"
-        df_n2["Log10VL"] = df_n2["Target2"].apply(
-            lambda x: math.log10(x) if pd.notna(x) and x > 0 else np.nan
-        )
-
-        use_cols = [
-            "StudyID", "PersonID", "Pathogen", "PtSpecies", "TimeDays",
-            "SampleSource", "SampleMethod", "AgeRng1", "AgeRng2", "PlatformName", "PlatformTech", "DOI",
-            "Targets", "Log10VL", "Units"
-        ]
-
-        frames.append(df_n1[use_cols])
-        frames.append(df_n2[use_cols])
-
-    # Combine everything AFTER the loop
-    out = pd.concat(frames, ignore_index=True)
-
-    # Re-baseline TimeDays
-    def first_detected_day(g):
-        mask = g["Log10VL"].notna() & g["TimeDays"].notna()
-        if mask.any():
-            return g.loc[mask, "TimeDays"].min()
-        return np.nan
-
-    shifts = out.groupby("PersonID", dropna=False).apply(first_detected_day).rename("t0")
-    out = out.merge(shifts, on="PersonID", how="left")
-    out["TimeDays"] = pd.to_numeric(out["TimeDays"], errors="coerce") - pd.to_numeric(out["t0"], errors="coerce")
-    out.drop(columns=["t0"], inplace=True)
+            df[col] = pd.to_numeric(df.get(col), errors="coerce")
+            df.loc[df[col] <= 0, col] = np.nan
+
+        frames.append(df)
+
+    # Combine the wide frames, then split N1/N2 into rows in one pass
+    wide = pd.concat(frames, ignore_index=True)
+    out = melt_values(
+        wide,
+        value_columns={"Target1": {"Targets": "N1"}, "Target2": {"Targets": "N2"}},
+        id_columns=["IndivID", "TimeDays", "SampleSource", "SampleMethod", "AgeRng1", "AgeRng2"],
+    )
+
+    # Metadata
+    out["StudyID"] = "savela2022"
+    out["Pathogen"] = "SARS-CoV-2"
+    out["IndSpecies"] = "Human"
+    out["Units"] = "copies/mL"
+    out["PlatformType"] = "RT-qPCR"
+    out["PlatformTech"] = "Bio-Rad CFX96"
+    out["DOI"] = "10.1128/JCM.01785-21"
+
+    # Re-baseline TimeDays to each individual's first detected day
+    times = pd.to_numeric(out["TimeDays"], errors="coerce")
+    t0 = times.where(out["PathogenLoad"].notna()).groupby(out["IndivID"], dropna=False).transform("min")
+    out["TimeDays"] = times - t0
 
     # Final schema alignment
+    out = normalize_frame(out)
     out = enforce_schema(out)
     out = coerce_types(out)
 
@@ -36,20 +36,20 @@ PARENT_DIR = os.path.abspath(os.path.join(THIS_DIR, ".."))
 if PARENT_DIR not in sys.path:
     sys.path.insert(0, PARENT_DIR)
 
-from schema import enforce_schema, coerce_types
+from schema import enforce_schema, coerce_types, melt_values
+from workbook import read_sheets
+from vocabulary import normalize_frame
 
 
-def _load_sheet(base_dir, sheet_name, platform_type, units, platform_tech, targets):
-    xlsx_path = os.path.join(base_dir, "data", "waickman2024.xlsx")
-    df_raw = pd.read_excel(xlsx_path, sheet_name=sheet_name)
+def _format_sheet(df_raw, platform_type, units, platform_tech, targets):
     df_raw = df_raw.dropna(how="all")
     df_raw.columns = df_raw.columns.map(str)
     df_raw = df_raw.loc[:, ~df_raw.columns.str.contains("^Unnamed")]
     id_cols = [c for c in df_raw.columns if c.isdigit()]
 
-    df = df_raw.melt(id_vars="Day", value_vars=id_cols, var_name="IndivID", value_name="PathogenLoad")
-    df["TimeDays"] = df["Day"]
-    df = df.drop(columns=["Day"])
+    # One column per participant -> one block of rows per participant
+    df = melt_values(df_raw, {c: {"IndivID": c} for c in id_cols}, id_columns=["Day"])
+    df = df.rename(columns={"Day": "TimeDays"})
 
     # Replace BLOD / non-detectable values ≤1 with NaN
     df["PathogenLoad"] = pd.to_numeric(df["PathogenLoad"], errors="coerce")
@@ -74,6 +74,7 @@ def _load_sheet(base_dir, sheet_name, platform_type, units, platform_tech, targe
     df["Targets"] = targets
     df["PlatformTech"] = platform_tech
 
+    df = normalize_frame(df)
     df = enforce_schema(df)
     df = coerce_types(df)
     return df
@@ -95,9 +96,13 @@ def load_and_format(base_dir=None):
          "DENV-3 NS1 protein"),
     ]
 
+    # Open the workbook once and read all three sheets from it
+    xlsx_path = os.path.join(base_dir, "data", "waickman2024.xlsx")
+    raw = read_sheets(xlsx_path, [sheet for sheet, *_ in sheets])
+
     dfs = []
     for sheet, platform_type, units, platform_tech, targets in sheets:
-        dfs.append(_load_sheet(base_dir, sheet, platform_type, units, platform_tech, targets))
+        dfs.append(_format_sheet(raw[sheet], platform_type, units, platform_tech, targets))
 
     df_all = pd.concat(dfs, ignore_index=True)
     return df_all
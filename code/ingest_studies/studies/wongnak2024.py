@@ -1,35 +1,31 @@
-import pandas as pd
-from schema import enforce_schema, coerce_types
+from specs import load_spec
 
-def load_and_format():
-    # Import the raw data:
-    df = pd.read_csv("data/wongnak2024.csv")
-
-    # Keep only the columns we need: 
-    df = df[['ID', 'Time', 'Trt', 'Swab_ID', 'Age', 'BARCODE', 'Variant', 'log10_viral_load']]
-
-    # Rename columns to match the standard schema:
-    df = df.rename(columns={
-        "ID": "PersonID",
+SPEC = {
+    "file": "data/wongnak2024.csv",
+    "dtype": {"Trt": "category", "Swab_ID": "category", "Variant": "category", "BARCODE": str},
+    # Keep only the columns we need, renamed to match the standard schema:
+    "columns": {
+        "ID": "IndivID",
         "Time": "TimeDays",
         "Trt": "Treatment1",
-        "Swab_ID": "SampleType",
+        "Swab_ID": "SampleSource",
         "Age": "AgeRng1",
-        "BARCODE": "SampleID", 
+        "BARCODE": "SampleID",
         "Variant": "Subtype",
-        "log10_viral_load": "Log10VL"
-        })
-
+        "log10_viral_load": "PathogenLoad",
+    },
     # Since age is given as a single value, set the upper bound of the age range to be the same
-    df['AgeRng2'] = df['AgeRng1']
+    "copy": {"AgeRng2": "AgeRng1"},
+    # Known but missing information:
+    "constants": {
+        "StudyID": "wongnak2024",
+        "Pathogen": "SARS-CoV-2",
+        "IndSpecies": "Human",
+        "DOI": "10.1016/S1473-3099(24)00183-X",
+        "Units": "GE/ml",
+        "PlatformType": "TaqCheckFastPCR",
+    },
+}
 
-    # Add additional columns with known but missing information:
-    df["StudyID"] = "wongnak2024"
-    df["DOI"] = "10.1016/S1473-3099(24)00183-X"
-    df["Units"] = "GEml"
-    df["Platform"] = "TaqCheckFastPCR"
-
-    df = enforce_schema(df)
-    df = coerce_types(df)
-
-    return df
\ No newline at end of file
+def load_and_format():
+    return load_spec(SPEC)
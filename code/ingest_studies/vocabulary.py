@@ -0,0 +1,128 @@
+"""
+Controlled vocabulary for sample and assay metadata.
+
+Studies describe the same thing in different words ("nose", "nasal swab",
+"NS"; "GEml", "GE/ml"), so every loader used to normalize SampleSource,
+SampleMethod, PlatformType and Units its own way. VOCABULARY lists the canonical
+terms of each column with the patterns that mean them; `normalize()` maps a
+column onto those terms.
+
+Patterns are case-insensitive regular expressions matched against the whole
+value (after trimming and collapsing whitespace), and every canonical term also
+matches itself. Each distinct value of a column is looked up once and the
+results are broadcast through the column's codes (schema.map_uniques), so the
+cost depends on the number of distinct strings, not on the number of rows.
+
+Study-specific rules (a list of (canonical term, pattern) pairs) are tried
+before the shared ones; values matching nothing are kept as they are, or
+replaced by `default`.
+
+Example:
+    df["SampleSource"] = normalize(df["site"], "SampleSource")   # "nose" -> "nasal"
+    df = normalize_frame(df)                                      # every VOCABULARY column present
+"""
+
+import re
+import pandas as pd
+
+from schema import map_uniques
+
+# column -> {canonical term: [patterns]}; the first matching term wins
+VOCABULARY = {
+    "SampleSource": {
+        "nasal_oropharyngeal": [
+            r"nasal[ _-]?oropharyngeal( swab)?",
+            r"combined[ _]nose[ _](and[ _])?throat([ _]swab)?",
+            r"nose (and|&) throat( swab)?",
+        ],
+        "nasopharyngeal": [r"nasopharyngeal( swab)?", r"np( swab)?"],
+        "oropharyngeal": [r"oropharyngeal( swab)?", r"op( swab)?"],
+        "anterior nares": [r"anterior nares( swab)?", r"anterior nasal( swab)?", r"an swab"],
+        "nasal": [r"nasal( swab)?", r"nose( swab)?", r"ns", r"mid[ -]?turbinate( swab)?"],
+        "throat": [r"throat( swab)?"],
+        "saliva": [r"saliva( sample)?", r"spit"],
+        "serum": [r"blood serum"],
+        "plasma": [r"blood plasma"],
+    },
+    "SampleMethod": {
+        "swab": [r".*swab"],
+        "saliva collection": [r"saliva", r"spit"],
+        "blood draw (serum)": [r"blood draw", r"venipuncture"],
+    },
+    "PlatformType": {
+        "RT-qPCR": [r"q?rt[- ]?q?pcr", r"real[- ]time pcr"],
+        "Alinity": [r"(abbott )?alinity( m)?"],
+        "Taqpath": [r"taqpath"],
+        "TaqCheckFastPCR": [r"taqcheck[ _-]?fast[ _-]?pcr"],
+        "cobas": [r"(roche )?cobas"],
+        "Sofia": [r"(quidel )?sofia"],
+        "Crick COVID-19 Consortium (CCC)": [r"ccc"],
+        "plaque-forming assay": [r"plaque([- ]forming)? assay"],
+        "ELISA": [r"elisa"],
+    },
+    "Units": {
+        "Ct": [r"ct", r"cycle threshold"],
+        "binary": [r"pos/neg", r"positive/negative"],
+        "copies/mL": [r"copies ?/ ?ml"],
+        "log10(copies/mL)": [r"log10 ?\(?copies ?/ ?ml\)?"],
+        "GE/ml": [r"ge ?/ ?ml", r"geml", r"genome equivalents ?/ ?ml"],
+        "PFU/ml": [r"pfu ?/ ?ml"],
+        "log10(PFU/mL)": [r"log10 ?\(?pfu ?/ ?ml\)?"],
+        "OD (ELISA units)": [r"od"],
+    },
+}
+
+KEEP = object()
+
+
+def _compile(rules):
+    """[(canonical term, compiled pattern)] for (term, pattern) pairs."""
+    return [(term, re.compile(pattern, re.IGNORECASE)) for term, pattern in rules]
+
+
+_RULES = {
+    column: _compile((term, pattern) for term, patterns in terms.items()
+                     for pattern in [re.escape(term)] + patterns)
+    for column, terms in VOCABULARY.items()
+}
+
+
+def _lookup(value, rules, default):
+    if pd.isna(value):
+        return pd.NA
+    text = " ".join(str(value).split())
+    for term, pattern in rules:
+        if pattern.fullmatch(text):
+            return term
+    return text if default is KEEP else default
+
+
+def canonical(value, column, rules=(), default=KEEP):
+    """The canonical term for one value of `column`."""
+    return _lookup(value, _compile(rules) + _RULES[column], default)
+
+
+def normalize(values, column, rules=(), default=KEEP):
+    """
+    Map the values of a column onto the canonical terms of VOCABULARY[column].
+
+    Parameters:
+        values (pd.Series or array-like): Raw values.
+        column (str): Vocabulary column (SampleSource, SampleMethod, PlatformType, Units).
+        rules (list): Study-specific (canonical term, pattern) pairs tried first.
+        default: Replacement for values matching no rule; by default they are
+            kept (whitespace-trimmed).
+
+    Returns:
+        pd.Categorical: One canonical term per value.
+    """
+    compiled = _compile(rules) + _RULES[column]
+    return map_uniques(pd.Series(values), lambda v: _lookup(v, compiled, default))
+
+
+def normalize_frame(df, columns=None):
+    """Normalize every VOCABULARY column of `df` (or those in `columns`) that is present."""
+    for column in columns or VOCABULARY:
+        if column in df.columns:
+            df[column] = normalize(df[column], column)
+    return df
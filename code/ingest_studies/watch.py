@@ -0,0 +1,138 @@
+"""
+Watch mode: re-ingest studies whose raw data or loader code changed and publish
+the result to the running web app.
+
+The watcher polls file modification times under `data/` and
+`code/ingest_studies/` (no extra dependencies), waits until a burst of edits has
+settled for `--debounce` seconds, and then:
+
+1. maps the changed files to studies (data files are prefixed with their
+   StudyID, loaders live in `studies/<StudyID>.py`; any other ingestion module
+   affects every study),
+2. re-ingests only those studies (all of them if shared code changed) by
+   running `create_schema.py` in a fresh process, so every edited module is
+   picked up, and their partitions are replaced atomically,
+3. publishes the new combined output into `OPKCWeb/visualization/data/`.
+
+OPKCWeb workers notice the replaced data file on their next request and swap to
+the new dataset without a restart.
+
+Usage (from the repository root):
+    $ python3 code/ingest_studies/watch.py
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import create_schema
+from partitions import OUTPUT_DIR, WEB_DATA_DIR, publish
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = "data"
+WATCHED_SUFFIXES = (".csv", ".xlsx", ".py")
+
+
+def snapshot_mtimes(dirs):
+    """Modification times of the watched files below `dirs`."""
+    mtimes = {}
+    for root_dir in dirs:
+        for root, subdirs, files in os.walk(root_dir):
+            subdirs[:] = [d for d in subdirs if d != "__pycache__"]
+            for name in files:
+                if name.endswith(WATCHED_SUFFIXES) and not name.startswith((".", "~$")):
+                    path = os.path.join(root, name)
+                    try:
+                        mtimes[path] = os.stat(path).st_mtime_ns
+                    except FileNotFoundError:
+                        pass
+    return mtimes
+
+
+def changed_files(before, after):
+    return sorted(p for p in set(before) | set(after) if before.get(p) != after.get(p))
+
+
+def affected_studies(paths, study_ids):
+    """StudyIDs whose partitions must be rebuilt for a set of changed paths."""
+    affected = set()
+    for path in paths:
+        name = os.path.basename(path)
+        if os.path.abspath(os.path.dirname(path)) == os.path.abspath(THIS_DIR):
+            # Shared ingestion code (schema.py, ...) affects every study
+            if name.endswith(".py") and name not in ("watch.py", "test_import.py", "temp.py"):
+                return set(study_ids)
+            continue
+        affected.update(s for s in study_ids if name.startswith(s))
+    return affected
+
+
+def rebuild(paths, output_dir=OUTPUT_DIR, web_data_dir=WEB_DATA_DIR, profile=False):
+    """Re-ingest and publish the studies affected by `paths`; returns the StudyIDs rebuilt."""
+    study_ids = sorted(affected_studies(paths, create_schema.STUDIES))
+    if not study_ids:
+        return []
+    # A fresh interpreter runs the ingestion code as it is on disk now; reloading
+    # modules here would miss names bound with `from module import ...`
+    command = [sys.executable, os.path.join(THIS_DIR, "create_schema.py"), "--output-dir", output_dir]
+    if set(study_ids) != set(create_schema.STUDIES):
+        command += [f"--study={study_id}" for study_id in study_ids]
+    if profile:
+        command.append("--profile")
+    subprocess.run(command, check=True)
+    publish(output_dir, web_data_dir)
+    return study_ids
+
+
+def watch(interval=1.0, debounce=2.0, output_dir=OUTPUT_DIR, web_data_dir=WEB_DATA_DIR, profile=False):
+    dirs = [DATA_DIR, THIS_DIR]
+    known = snapshot_mtimes(dirs)
+    print(f"Watching {', '.join(dirs)} (Ctrl-C to stop)")
+    while True:
+        time.sleep(interval)
+        current = snapshot_mtimes(dirs)
+        changes = changed_files(known, current)
+        if not changes:
+            continue
+
+        # Debounce: wait until the files have been quiet for `debounce` seconds
+        settled_at = time.monotonic()
+        while time.monotonic() - settled_at < debounce:
+            time.sleep(interval)
+            latest = snapshot_mtimes(dirs)
+            more = changed_files(current, latest)
+            if more:
+                changes = sorted(set(changes) | set(more))
+                current = latest
+                settled_at = time.monotonic()
+        known = current
+
+        started = time.monotonic()
+        try:
+            rebuilt = rebuild([os.path.abspath(p) for p in changes], output_dir, web_data_dir, profile)
+        except Exception as e:
+            # Keep watching; the previous published dataset stays in place
+            print(f"Rebuild failed: {e}", file=sys.stderr)
+            continue
+        if rebuilt:
+            print(f"Re-ingested {', '.join(rebuilt)} and published in {time.monotonic() - started:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-ingest changed studies and publish to OPKCWeb.")
+    parser.add_argument("--interval", type=float, default=1.0, help="Polling interval in seconds.")
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="Quiet period (seconds) after the last change before rebuilding.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the loaders of every rebuild and save the reports under output/profiles/.")
+    args = parser.parse_args(argv)
+    try:
+        watch(args.interval, args.debounce, profile=args.profile)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
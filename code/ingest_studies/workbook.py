@@ -0,0 +1,75 @@
+"""
+Shared Excel reader for the study loaders.
+
+`pd.read_excel` re-opens and re-parses the whole workbook on every call, so a
+loader that pulls three sheets from one file pays for three full parses. The
+helpers here open each workbook once, read every requested sheet from that
+single handle (optionally keeping only the needed columns), and read
+independent workbooks concurrently.
+
+Example:
+    sheets = read_sheets("data/waickman2024.xlsx", ["Figure 1B", "Figure 1C"])
+    books = read_workbooks({
+        "data/savela2022_fig2A_paired.xlsx": None,   # first sheet
+        "data/savela2022_fig2B_paired.xlsx": None,
+    }, usecols=["Participant", "Days Post-Enrollment"])
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pandas as pd
+
+
+def read_sheets(path, sheet_names=None, usecols=None):
+    """
+    Read several sheets from one workbook, opening the file once.
+
+    Parameters:
+        path (str): Path to the .xlsx file.
+        sheet_names (list or None): Sheets to read; None reads only the first sheet.
+        usecols (list or None): Column labels to keep. Columns not present in a
+            sheet are ignored rather than raising.
+
+    Returns:
+        dict: sheet name -> DataFrame (a single DataFrame if sheet_names is None).
+    """
+    wanted = None if usecols is None else {str(c) for c in usecols}
+    parse_kwargs = {}
+    if wanted is not None:
+        parse_kwargs["usecols"] = lambda c: str(c) in wanted
+
+    with pd.ExcelFile(path) as book:
+        if sheet_names is None:
+            return book.parse(book.sheet_names[0], **parse_kwargs)
+        return {name: book.parse(name, **parse_kwargs) for name in sheet_names}
+
+
+def _read_one(job):
+    path, sheet_names, usecols = job
+    return read_sheets(path, sheet_names, usecols)
+
+
+def read_workbooks(requests, usecols=None, max_workers=None, processes=True):
+    """
+    Read several independent workbooks concurrently.
+
+    Parameters:
+        requests (dict): path -> list of sheet names (or None for the first sheet).
+        usecols (list or None): Column labels to keep in every sheet.
+        max_workers (int or None): Pool size; defaults to min(len(requests), CPU count).
+        processes (bool): Use a process pool (openpyxl parsing is CPU-bound and
+            holds the GIL); set False to use threads instead.
+
+    Returns:
+        dict: path -> result of read_sheets() for that file, in request order.
+    """
+    jobs = [(path, sheets, usecols) for path, sheets in requests.items()]
+    if len(jobs) <= 1:
+        return {job[0]: _read_one(job) for job in jobs}
+
+    if max_workers is None:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+    pool_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool_cls(max_workers=max_workers) as pool:
+        results = list(pool.map(_read_one, jobs))
+    return {job[0]: result for job, result in zip(jobs, results)}